@@ -0,0 +1,48 @@
+"""add media_assets table
+
+Revision ID: a7c31e9d5b20
+Revises: 2eb805ef47d3
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c31e9d5b20"
+down_revision: Union[str, Sequence[str], None] = "2eb805ef47d3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "media_assets",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("s3_key", sa.String(length=512), nullable=False),
+        sa.Column("mime", sa.String(length=255), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("derivative_key", sa.String(length=512), nullable=True),
+        sa.Column("derivative_mime", sa.String(length=255), nullable=True),
+        sa.Column("duration_s", sa.Float(), nullable=True),
+        sa.Column("sample_rate", sa.Integer(), nullable=True),
+        sa.Column("channels", sa.Integer(), nullable=True),
+        sa.Column("row_count", sa.Integer(), nullable=True),
+        sa.Column("error", sa.String(length=500), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index("ix_media_assets_id", "media_assets", ["id"])
+    op.create_index("ix_media_assets_user_id", "media_assets", ["user_id"])
+    op.create_index("uq_media_assets_s3_key", "media_assets", ["s3_key"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("uq_media_assets_s3_key", table_name="media_assets")
+    op.drop_index("ix_media_assets_user_id", table_name="media_assets")
+    op.drop_index("ix_media_assets_id", table_name="media_assets")
+    op.drop_table("media_assets")
@@ -0,0 +1,45 @@
+"""add spreadsheet_digests table
+
+Revision ID: b3e8f1c4d6a2
+Revises: a7c31e9d5b20
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = "b3e8f1c4d6a2"
+down_revision: Union[str, Sequence[str], None] = "a7c31e9d5b20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "spreadsheet_digests",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("digest_key", sa.String(length=64), nullable=False),
+        sa.Column("s3_key", sa.String(length=512), nullable=False),
+        sa.Column("etag", sa.String(length=128), nullable=False),
+        sa.Column("mode", sa.String(length=16), nullable=False),
+        sa.Column("content", sa.Text().with_variant(mysql.MEDIUMTEXT(), "mysql"), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_used_at", sa.DateTime(timezone=True), nullable=False),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index("ix_spreadsheet_digests_id", "spreadsheet_digests", ["id"])
+    op.create_index("uq_spreadsheet_digests_digest_key", "spreadsheet_digests", ["digest_key"], unique=True)
+    op.create_index("ix_spreadsheet_digests_s3_key", "spreadsheet_digests", ["s3_key"])
+    op.create_index("ix_spreadsheet_digests_last_used_at", "spreadsheet_digests", ["last_used_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_spreadsheet_digests_last_used_at", table_name="spreadsheet_digests")
+    op.drop_index("ix_spreadsheet_digests_s3_key", table_name="spreadsheet_digests")
+    op.drop_index("uq_spreadsheet_digests_digest_key", table_name="spreadsheet_digests")
+    op.drop_index("ix_spreadsheet_digests_id", table_name="spreadsheet_digests")
+    op.drop_table("spreadsheet_digests")
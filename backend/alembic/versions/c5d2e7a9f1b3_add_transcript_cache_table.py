@@ -0,0 +1,44 @@
+"""add transcript_cache table
+
+Revision ID: c5d2e7a9f1b3
+Revises: b3e8f1c4d6a2
+Create Date: 2026-10-19
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = "c5d2e7a9f1b3"
+down_revision: Union[str, Sequence[str], None] = "b3e8f1c4d6a2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "transcript_cache",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column("cache_key", sa.String(length=64), nullable=False),
+        sa.Column("model", sa.String(length=64), nullable=False),
+        sa.Column("content", sa.Text().with_variant(mysql.MEDIUMTEXT(), "mysql"), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_used_at", sa.DateTime(timezone=True), nullable=False),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8mb4",
+    )
+    op.create_index("ix_transcript_cache_id", "transcript_cache", ["id"])
+    op.create_index("uq_transcript_cache_cache_key", "transcript_cache", ["cache_key"], unique=True)
+    op.create_index("ix_transcript_cache_expires_at", "transcript_cache", ["expires_at"])
+    op.create_index("ix_transcript_cache_last_used_at", "transcript_cache", ["last_used_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_transcript_cache_last_used_at", table_name="transcript_cache")
+    op.drop_index("ix_transcript_cache_expires_at", table_name="transcript_cache")
+    op.drop_index("uq_transcript_cache_cache_key", table_name="transcript_cache")
+    op.drop_index("ix_transcript_cache_id", table_name="transcript_cache")
+    op.drop_table("transcript_cache")
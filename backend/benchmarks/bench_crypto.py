@@ -0,0 +1,33 @@
+"""
+decrypt_message döngüsü vs decrypt_many karşılaştırması.
+Kullanım (repo kökünden):  python -m backend.benchmarks.bench_crypto
+"""
+import os
+import time
+from cryptography.fernet import Fernet
+
+os.environ.setdefault("FERNET_KEY", Fernet.generate_key().decode())
+
+from backend.utils.security import encrypt_many, decrypt_message, decrypt_many  # noqa: E402
+
+
+def _bench(n: int):
+    payloads = [{"text": f"mesaj {i} " + "x" * 120} for i in range(n)]
+    ciphers, _ = encrypt_many(payloads)
+
+    t0 = time.perf_counter()
+    for c in ciphers:
+        decrypt_message(c)
+    loop_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    out, errors = decrypt_many(ciphers)
+    batch_s = time.perf_counter() - t0
+    assert not errors and out[0] == [payloads[0]] and out[-1] == [payloads[-1]]
+
+    print(f"n={n:>7}  loop={n / loop_s:>10.0f} msg/s  decrypt_many={n / batch_s:>10.0f} msg/s")
+
+
+if __name__ == "__main__":
+    for n in (1_000, 10_000, 100_000):
+        _bench(n)
@@ -0,0 +1,70 @@
+"""
+Excel -> CSV: eski tam pandas okuması vs akış halinde (openpyxl read-only) dönüşüm.
+Süre ve tepe bellek (tracemalloc) karşılaştırılır.
+Kullanım (repo kökünden):  python -m backend.benchmarks.bench_excel [satır_sayısı]
+"""
+import io
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from backend.utils.spreadsheet import (
+    MAX_ROWS_PER_SHEET, MAX_CSV_BYTES, CSV_PREVIEW_ROWS, excel_to_csv_with_stats,
+)
+
+
+def _make_workbook(n_rows: int) -> bytes:
+    """Excel'in kendi yazdığı dosyalar gibi <dimension> etiketli çalışma kitabı."""
+    df = pd.DataFrame({
+        "hasta_id": range(n_rows),
+        "tarih": [f"2025-08-{i % 28 + 1:02d}" for i in range(n_rows)],
+        "test": [f"TEST{i % 40}" for i in range(n_rows)],
+        "deger": [i * 0.37 for i in range(n_rows)],
+        "birim": "mg/dL",
+        "ref_min": 10,
+        "ref_max": 200,
+        "not": ["ok" if i % 3 else "" for i in range(n_rows)],
+    })
+    out = io.BytesIO()
+    df.to_excel(out, sheet_name="lab", index=False)
+    return out.getvalue()
+
+
+def _pandas_baseline(raw: bytes) -> str:
+    """Değişiklik öncesi davranış: her sayfa tamamen DataFrame'e alınır."""
+    xls = pd.ExcelFile(io.BytesIO(raw))
+    pieces = []
+    for name in xls.sheet_names:
+        df = xls.parse(name)
+        pieces.append(f"# Sheet: {name}\n" + df.head(MAX_ROWS_PER_SHEET).to_csv(index=False))
+    csv_all = "\n\n".join(pieces)
+    if len(csv_all.encode("utf-8")) > MAX_CSV_BYTES:
+        parts = []
+        for name in xls.sheet_names:
+            df = xls.parse(name)
+            parts.append(f"# Sheet: {name}\n" + df.head(CSV_PREVIEW_ROWS).to_csv(index=False))
+        csv_all = "\n\n".join(parts)
+    return csv_all
+
+
+def _measure(label: str, fn, raw: bytes):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(raw)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed:>8.2f} s  peak={peak / 1e6:>8.1f} MB")
+
+
+def main(n_rows: int = 300_000):
+    raw = _make_workbook(n_rows)
+    print(f"rows={n_rows} xlsx={len(raw) / 1e6:.1f} MB")
+    _measure("pandas", _pandas_baseline, raw)
+    _measure("streaming", excel_to_csv_with_stats, raw)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300_000)
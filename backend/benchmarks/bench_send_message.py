@@ -0,0 +1,73 @@
+"""
+POST /conversations/{id}/messages gecikmesi (p50/p99), SQLite bellek DB üzerinde.
+Kullanım (repo kökünden):  python -m backend.benchmarks.bench_send_message [n]
+Karşılaştırma için aynı betiği değişiklik öncesi commit'te de çalıştırın.
+"""
+import os
+import sys
+import time
+import statistics
+from cryptography.fernet import Fernet
+
+os.environ.setdefault("FERNET_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from backend.database import Base, get_db  # noqa: E402
+from backend.models import Users, UserConversation, UserConversationState  # noqa: E402
+from backend.routers import conversations  # noqa: E402
+from backend.routers.auth import get_current_user_from_cookie  # noqa: E402
+
+
+def main(n: int = 2000):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = Session()
+    a = Users(username="a", email="a@x", first_name="A", last_name="A", role="doctor")
+    b = Users(username="b", email="b@x", first_name="B", last_name="B", role="doctor")
+    db.add_all([a, b]); db.flush()
+    convo = UserConversation(user1_id=a.id, user2_id=b.id)
+    db.add(convo); db.flush()
+    db.add_all([
+        UserConversationState(user_id=a.id, conversation_id=convo.id),
+        UserConversationState(user_id=b.id, conversation_id=convo.id),
+    ])
+    db.commit()
+    me, cid = {"id": a.id}, convo.id
+    db.close()
+
+    def _db():
+        s = Session()
+        try:
+            yield s
+        finally:
+            s.close()
+
+    app = FastAPI()
+    app.include_router(conversations.router)
+    app.dependency_overrides[get_db] = _db
+    app.dependency_overrides[get_current_user_from_cookie] = lambda: me
+    client = TestClient(app)
+
+    lat = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        r = client.post(f"/conversations/{cid}/messages", json={"content": f"mesaj {i}"})
+        lat.append((time.perf_counter() - t0) * 1000)
+        assert r.status_code == 201, r.text
+
+    lat.sort()
+    p50 = statistics.median(lat)
+    p99 = lat[int(len(lat) * 0.99) - 1]
+    print(f"n={n} p50={p50:.2f} ms p99={p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,109 @@
+"""
+Offline VAD: eski frame listesi + bytes kopyalayan segmentasyon vs memoryview/offset tabanlı
+vad_offsets (enerji ön-filtresi kapalı ve açık). Süre, tepe bellek ve sonuç eşitliği raporlanır.
+Kullanım (repo kökünden):  python -m backend.benchmarks.bench_vad [dakika]
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import webrtcvad
+
+from backend.utils.vad import vad_offsets
+
+SR = 16000
+
+
+def _make_recording(minutes: float, seed: int = 7) -> bytes:
+    """Konuşmaya benzer (genlik modülasyonlu harmonik) bloklar + düşük seviyeli gürültülü sessizlik."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * SR)
+    out = np.empty(total, dtype=np.int16)
+    pos = 0
+    while pos < total:
+        speech = int(rng.uniform(1.5, 8.0) * SR)
+        t = np.arange(speech) / SR
+        f0 = rng.uniform(110, 220)
+        env = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+        sig = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6)) * env * 6000
+        sig += rng.normal(0, 300, speech)
+        silence = int(rng.uniform(0.3, 3.0) * SR)
+        chunk = np.concatenate([sig, rng.normal(0, 8, silence)]).astype(np.int16)
+        n = min(len(chunk), total - pos)
+        out[pos:pos + n] = chunk[:n]
+        pos += n
+    return out.tobytes()
+
+
+class _Frame:
+    __slots__ = ("bytes", "timestamp", "duration")
+
+    def __init__(self, b, ts, dur):
+        self.bytes = b
+        self.timestamp = ts
+        self.duration = dur
+
+
+def _frame_generator(frame_ms, audio, sample_rate):
+    n = int(sample_rate * (frame_ms / 1000.0) * 2)
+    offset = 0
+    ts = 0.0
+    dur = (float(n) / (2 * sample_rate))
+    while offset + n <= len(audio):
+        yield _Frame(audio[offset:offset + n], ts, dur)
+        ts += dur
+        offset += n
+
+
+def _old_vad_segments(pcm16, sample_rate=16000, frame_ms=20, aggressiveness=2, max_silence_ms=900, min_segment_ms=1200):
+    """Değişiklik öncesi gemini.vad_segments (segment baytlarını kopyalar)."""
+    vad = webrtcvad.Vad(aggressiveness)
+    frames = list(_frame_generator(frame_ms, pcm16, sample_rate))
+    cur = bytearray()
+    voiced = []
+    silence_run = 0
+    min_frames = int(min_segment_ms / frame_ms)
+    max_silence_frames = int(max_silence_ms / frame_ms)
+    need_bytes = int(min_frames * (sample_rate * (frame_ms / 1000.0) * 2))
+    for fr in frames:
+        if vad.is_speech(fr.bytes, sample_rate):
+            cur += fr.bytes
+            silence_run = 0
+        elif len(cur) > 0:
+            silence_run += 1
+            if silence_run <= max_silence_frames:
+                cur += fr.bytes
+            else:
+                if len(cur) >= need_bytes:
+                    voiced.append(bytes(cur))
+                cur = bytearray()
+                silence_run = 0
+    if len(cur) >= need_bytes and len(cur) > 0:
+        voiced.append(bytes(cur))
+    return voiced
+
+
+def _measure(label, fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<22} {elapsed:>7.2f} s  peak={peak / 1e6:>8.1f} MB  segments={len(result)}")
+    return result
+
+
+def main(minutes: float = 60.0):
+    pcm = _make_recording(minutes)
+    print(f"recording={minutes:g} min  pcm={len(pcm) / 1e6:.1f} MB")
+    old = _measure("old (bytes)", lambda: _old_vad_segments(pcm))
+    new = _measure("vad_offsets", lambda: vad_offsets(pcm, energy_gate_dbfs=None))
+    gated = _measure("vad_offsets + gate", lambda: vad_offsets(pcm, energy_gate_dbfs=-50.0))
+    same = len(old) == len(new) and all(bytes(memoryview(pcm)[s:e]) == seg for seg, (s, e) in zip(old, new))
+    print(f"identical to old: {same}  gated segments differ: {gated != new}")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 60.0)
@@ -1,2 +1,27 @@
+from backend.utils.presence import make_presence
+
 sio = None
-connected_users = {}
+# user_id -> SID'ler, sid -> user_id; memory ya da redis backend'i (SOCKETIO_BACKEND env).
+# Çok worker'da tüm süreçler aynı görünümü paylaşır. Sorgular async'tir (event loop bloklanmaz).
+presence = make_presence()
+
+def user_room(user_id) -> str:
+    """Kullanıcıya ait Socket.IO odası; kullanıcının tüm cihazları bu odaya katılır."""
+    return f"user:{user_id}"
+
+async def is_online(user_id) -> bool:
+    return await presence.is_online(user_id)
+
+async def add_connection(user_id, sid) -> None:
+    await presence.add(user_id, sid)
+
+async def remove_connection(sid):
+    """SID'i indekslerden çıkarır, bağlı olduğu user_id'yi döner (yoksa None)."""
+    return await presence.remove(sid)
+
+async def user_of(sid):
+    uid = await presence.user_of(sid)
+    try:
+        return int(uid) if uid is not None else None
+    except Exception:
+        return None
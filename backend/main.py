@@ -14,14 +14,25 @@ from backend.utils.security import encrypt_message, decrypt_message
 from datetime import datetime, timezone, timedelta
 
 from backend.routers import (
-    auth, users, gemini, chatlogs, patients, upload, files, conversations, sessionlogs
+    auth, users, gemini, chatlogs, patients, upload, files, conversations, sessionlogs, metrics
 )
 
 import asyncio
 import backend.globals as globals_mod
-import io, time, wave, re
+import io, time, wave
 import webrtcvad
-from backend.routers.gemini import upload_and_wait_active, client as gemini_client
+from backend.routers.gemini import upload_and_wait_active, client as gemini_client, MODEL as GEMINI_MODEL
+from backend.utils.presence import make_client_manager, run_heartbeat
+from backend.utils.chat import invalidate_user_info
+from backend.utils.transcript_cache import (
+    audio_sha256, cache_key as transcript_key, lookup as transcript_lookup, store as transcript_store,
+)
+from backend.utils.transcript_filter import trash_reason, classify_batch, count_dropped
+from backend.utils.diarize import make_item, merge_items
+from backend.utils.packing import (
+    LIVE_PACK_TARGET_MS, LIVE_PACK_MAX_WAIT_MS, TRANSCRIBE_PACK_GAP_MS, TRANSCRIBE_PACK_MAP,
+    ms_to_bytes, join_pcm, pack_layout, pack_prompt, split_pack_text, record_call,
+)
 
 load_dotenv()
 
@@ -47,6 +58,26 @@ fastapi_app.include_router(upload.router)
 fastapi_app.include_router(files.router)
 fastapi_app.include_router(conversations.router)
 fastapi_app.include_router(sessionlogs.router)
+fastapi_app.include_router(metrics.router)
+
+GEMINI_FILE_GC_INTERVAL = float(os.getenv("GEMINI_FILE_GC_INTERVAL", "600"))
+
+async def _gemini_file_gc_loop():
+    """Gemini dosya cache'inin merkezi çöp toplayıcısı."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(GEMINI_FILE_GC_INTERVAL)
+        try:
+            removed = await loop.run_in_executor(None, gemini.gc_gemini_file_cache)
+            if removed:
+                print(f"[GEMINI][FILECACHE][GC] {removed} dosya silindi")
+        except Exception as e:
+            print(f"[GEMINI][FILECACHE][GC][ERR] {e}")
+
+@fastapi_app.on_event("startup")
+async def _start_background_tasks():
+    asyncio.create_task(_gemini_file_gc_loop())
+    asyncio.create_task(run_heartbeat(globals_mod.presence))
 
 @fastapi_app.get("/entry")
 def entry_point():
@@ -55,12 +86,17 @@ def entry_point():
 Base.metadata.create_all(bind=engine)
 
 
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins=origins or "*")
+# SOCKETIO_BACKEND=redis ise emit'ler tüm worker'lara pub/sub ile dağıtılır
+sio = socketio.AsyncServer(
+    async_mode="asgi",
+    cors_allowed_origins=origins or "*",
+    client_manager=make_client_manager(),
+)
 app = socketio.ASGIApp(sio, other_asgi_app=fastapi_app)
 sio_app = app
 
 globals_mod.sio = sio
-globals_mod.connected_users = {}
+user_room = globals_mod.user_room
 
 SAMPLE_RATE = 16000
 FRAME_MS = 20
@@ -108,7 +144,7 @@ def _sync_call_with_backoff(wav_bytes: bytes, prompt: str):
             active_file = upload_and_wait_active(wav_bytes, "audio/wav")
             try:
                 resp = gemini_client.models.generate_content(
-                    model="gemini-2.5-flash",
+                    model=GEMINI_MODEL,
                     contents=[prompt, active_file],
                 )
                 return getattr(resp, "text", "") or ""
@@ -131,49 +167,40 @@ def _sync_call_with_backoff(wav_bytes: bytes, prompt: str):
             raise
     raise RuntimeError("Gemini backoff attempts exhausted")
 
-#Çöp metin filtresi 
-_FILLER_WORDS = {
-    "uh","uhhuh","umm","hm","hmm","mm","eee","ı","i","hıhı","haha","ha","hahaha"
-}
-_ALLOW_SHORT = {
-    "evet","hayır","hayir","tamam","olur","peki","tabi","teşekkürler","tesekkurler",
-    "sağ ol","sag ol","yok","var","merhaba","alo"
-}
-
-def _norm_token(w: str) -> str:
-    return w.lower().replace("-", "").strip()
-
-def _is_trash_text(s: str) -> bool:
-    s = (s or "").strip()
-    if not s:
-        return True
-
-    # kısa ama anlamlı yanıtları korumak adına 
-    norm = re.sub(r"\s+", " ", s.lower())
-    if norm in _ALLOW_SHORT:
-        return False
-
-    if len(s) < 10:
-        return True
-
-    words = re.findall(r"[^\W\d_]+", s, flags=re.UNICODE)
-    if len(words) < 3:
-        return True
-
-    letters = re.findall(r"[^\W\d_]", s, flags=re.UNICODE)
-    if (len(letters) / max(1, len(s))) < 0.6:
-        return True
-
-    if all(_norm_token(w) in _FILLER_WORDS for w in words):
-        return True
-
-    return False
-
-# PCM akış state
+# PCM akış state (bu worker'a bağlı SID'ler; Socket.IO bir sid'in olaylarını hep aynı worker'a iletir)
 pcm_states = {
     # sid: {...}
 }
-sid_to_user = {}
+
+def _drop_pcm_state(sid: str):
+    st = pcm_states.pop(sid, None)
+    if st:
+        _cancel_pack_timer(st)
+
+def _cancel_pack_timer(st: dict) -> None:
+    """Bekleyen pack zamanlayıcısını iptal eder (zamanlayıcının kendi içinden çağrılırsa dokunmaz)."""
+    task = st.get("pack_timer")
+    st["pack_timer"] = None
+    if task and not task.done() and task is not asyncio.current_task():
+        task.cancel()
+
+async def _pack_deadline(sid: str, st: dict):
+    """
+    Pack'in ilk segmentinden LIVE_PACK_MAX_WAIT_MS sonra, yeni chunk gelmese de pack'i gönderir.
+    Konuşma sürüyorsa beklenir; o durumda pack, segment kapanınca pcm_chunk içinde gönderilir.
+    """
+    try:
+        await asyncio.sleep(LIVE_PACK_MAX_WAIT_MS / 1000.0)
+    except asyncio.CancelledError:
+        return
+    st["pack_timer"] = None  # tetiklendi; bundan sonra iptal edilmez, flush bunu bekler
+    if pcm_states.get(sid) is not st or not st["pack"] or st["voiced"]:
+        return
+    st["pack_flush"] = asyncio.current_task()
+    try:
+        await _transcribe_pack_and_emit(sid)
+    finally:
+        st["pack_flush"] = None
 
 def _parse_client_iso(ts: str):
     """'2025-08-10T20:32:16.680Z' -> datetime (tz-aware)"""
@@ -195,15 +222,18 @@ def _pcm16_to_wav(pcm: bytes, sr: int = SAMPLE_RATE) -> bytes:
         wf.writeframes(pcm)
     return bio.getvalue()
 
+LIVE_TRANSCRIBE_PROMPT = "Transcribe the Turkish (and English if any) speech as plain text."
+
 async def _transcribe_wav_bytes(
     wav_bytes: bytes,
-    prompt: str = "Transcribe the Turkish (and English if any) speech as plain text.",
+    prompt: str = LIVE_TRANSCRIBE_PROMPT,
 ) -> str:
     await _rate_limit_gate()
     loop = asyncio.get_running_loop()
     return await loop.run_in_executor(None, lambda: _sync_call_with_backoff(wav_bytes, prompt))
 
 async def _finalize_segment_and_emit(sid: str):
+    """Açık segmenti kapatır ve bekleyen pack'e ekler; pack LIVE_PACK_TARGET_MS'e ulaşınca çağrı yapılır."""
     st = pcm_states.get(sid)
     if not st or not st["seg_buf"]:
         if st:
@@ -219,31 +249,71 @@ async def _finalize_segment_and_emit(sid: str):
     raw = bytes(st["seg_buf"])
     st["seg_buf"].clear()
     st["voiced"] = False
-
-    print(f"[PCM][SEGMENT][FINALIZE] sid={sid} bytes={len(raw)}")
-    wav_bytes = _pcm16_to_wav(raw, SAMPLE_RATE)
-    try:
-        text = (await _transcribe_wav_bytes(wav_bytes)).strip()
-    except Exception as e:
-        print(f"[PCM][SEGMENT][ERR] {e}")
-        await sio.emit("transcribe_error", f"{e}", to=sid)
-        return
-
-    # Çöpleri at
-    if not text or _is_trash_text(text):
-        print("[PCM][SEGMENT][DROP] trash/empty segment atıldı.")
+    # akış içi konum (saniye): ilk ve son konuşma frame'i
+    start_s = st["seg_start"] * FRAME_MS / 1000.0
+    end_s = st["seg_end"] * FRAME_MS / 1000.0
+
+    print(f"[PCM][SEGMENT][FINALIZE] sid={sid} bytes={len(raw)} at={start_s:.2f}-{end_s:.2f}s")
+    if not st["pack"]:
+        st["pack_started"] = time.time()
+        st["pack_timer"] = asyncio.create_task(_pack_deadline(sid, st))
+    st["pack"].append((raw, start_s, end_s))
+    pack_bytes = sum(len(x) for x, _, _ in st["pack"]) + ms_to_bytes(TRANSCRIBE_PACK_GAP_MS) * (len(st["pack"]) - 1)
+    if pack_bytes >= ms_to_bytes(LIVE_PACK_TARGET_MS):
+        await _transcribe_pack_and_emit(sid)
+
+async def _transcribe_pack_and_emit(sid: str):
+    """Bekleyen segmentleri tek Gemini çağrısıyla yazıya döker ve yayınlar."""
+    st = pcm_states.get(sid)
+    if not st or not st["pack"]:
         return
-
-    st["segments"].append(text)
-    st["n_segments"] += 1
-    print(f"[PCM][SEGMENT][TEXT] #{st['n_segments']} len={len(text)}")
-    await sio.emit("partial_transcript", {"text": text, "is_final": True}, to=sid)
-
-    peer_sid = None
-    if st.get("peer_user_id") is not None:
-        peer_sid = globals_mod.connected_users.get(str(st["peer_user_id"]))
-    if peer_sid:
-        await sio.emit("partial_transcript", {"text": text, "is_final": True}, to=peer_sid)
+    segs = st["pack"]
+    st["pack"] = []
+    _cancel_pack_timer(st)
+
+    mapped = TRANSCRIBE_PACK_MAP and len(segs) > 1
+    pcm = join_pcm([x for x, _, _ in segs])
+    prompt = LIVE_TRANSCRIBE_PROMPT
+    if mapped:
+        prompt = pack_prompt(prompt, pack_layout([(0, len(x)) for x, _, _ in segs]))
+
+    key = transcript_key(audio_sha256(pcm), prompt, GEMINI_MODEL)
+    text = await asyncio.to_thread(transcript_lookup, key)
+    if text is None:
+        t0 = time.perf_counter()
+        try:
+            text = (await _transcribe_wav_bytes(_pcm16_to_wav(pcm, SAMPLE_RATE), prompt)).strip()
+        except Exception as e:
+            print(f"[PCM][SEGMENT][ERR] {e}")
+            await sio.emit("transcribe_error", f"{e}", to=sid)
+            return
+        finally:
+            record_call("live", len(pcm) / (2 * SAMPLE_RATE), time.perf_counter() - t0, segments=len(segs))
+        await asyncio.to_thread(transcript_store, key, GEMINI_MODEL, text)
+
+    if mapped:
+        texts, mapped = split_pack_text(text, len(segs))
+    if mapped:
+        spans = [(start, end) for _, start, end in segs]
+    else:
+        # eşleme yoksa ya da model etiketleri tutmadıysa metin tüm pack'e
+        # (ilk segment başı - son segment sonu) aittir
+        texts = [text]
+        spans = [(segs[0][1], segs[-1][2])]
+    # Çöpleri at (nedenler transcript_dropped_live_* sayaçlarına yazılır)
+    for text, (start, end), reason in zip(texts, spans, classify_batch(texts, source="live")):
+        if reason:
+            continue
+        item = make_item(text.strip(), st["user_id"], st["role"], st["t0"], start, end)
+
+        st["segments"].append(item)
+        st["n_segments"] += 1
+        print(f"[PCM][SEGMENT][TEXT] #{st['n_segments']} len={len(item['text'])} packed={len(segs)}")
+        payload = {**item, "is_final": True}
+        await sio.emit("partial_transcript", payload, to=sid)
+
+        if st.get("peer_user_id") is not None:
+            await sio.emit("partial_transcript", payload, to=user_room(st["peer_user_id"]))
 
 async def _flush_and_save_sessionlog(sid: str):
     st = pcm_states.get(sid)
@@ -252,8 +322,11 @@ async def _flush_and_save_sessionlog(sid: str):
 
     if st["seg_buf"]:
         await _finalize_segment_and_emit(sid)
+    await _transcribe_pack_and_emit(sid)
+    if st.get("pack_flush"):  # zamanlayıcının o an sürmekte olan çağrısı da kayda girsin
+        await asyncio.wait([st["pack_flush"]])
 
-    items = [{"text": t} for t in st["segments"] if t]
+    items = [x for x in st["segments"] if x["text"]]
     plain_all = " ".join(x["text"] for x in items).strip()
 
     print(
@@ -262,9 +335,10 @@ async def _flush_and_save_sessionlog(sid: str):
     )
 
     # Tümü çöp ise kaydetme
-    if not items or _is_trash_text(plain_all):
-        print("[PCM][FLUSH] tüm segmentler çöp görünüyor; DB kaydı atlandı.")
-        pcm_states.pop(sid, None)
+    reason = trash_reason(plain_all) if items else "empty"
+    if reason:
+        count_dropped(reason, source="session")
+        _drop_pcm_state(sid)
         return
 
     if st.get("user_id") and st.get("peer_user_id"):
@@ -277,7 +351,7 @@ async def _flush_and_save_sessionlog(sid: str):
                 row = db.query(SessionLog).filter(SessionLog.call_id == call_id).first()
                 if row:
                     existing = decrypt_message(row.transcript) or []
-                    row.transcript = encrypt_message((existing + items)[-500:])  
+                    row.transcript = encrypt_message(merge_items(existing, items))
                     row.updated_at = now_tr()
                 else:
                     row = SessionLog(
@@ -314,7 +388,7 @@ async def _flush_and_save_sessionlog(sid: str):
                 )
                 if row:
                     existing = decrypt_message(row.transcript) or []
-                    row.transcript = encrypt_message((existing + items)[-500:])
+                    row.transcript = encrypt_message(merge_items(existing, items))
                     row.updated_at = now_tr()
                 else:
                     row = SessionLog(
@@ -329,9 +403,7 @@ async def _flush_and_save_sessionlog(sid: str):
             print(f"[PCM][SAVE] session_logs.id={row.id}")
             try:
                 await sio.emit("sessionlog_saved", {"id": row.id}, to=sid)
-                peer_sid = globals_mod.connected_users.get(str(st["peer_user_id"]))
-                if peer_sid:
-                    await sio.emit("sessionlog_saved", {"id": row.id}, to=peer_sid)
+                await sio.emit("sessionlog_saved", {"id": row.id}, to=user_room(st["peer_user_id"]))
             except Exception:
                 pass
 
@@ -341,7 +413,7 @@ async def _flush_and_save_sessionlog(sid: str):
                 row = db.query(SessionLog).filter(SessionLog.call_id == call_id).first()
                 if row:
                     existing = decrypt_message(row.transcript) or []
-                    row.transcript = encrypt_message((existing + items)[-500:])
+                    row.transcript = encrypt_message(merge_items(existing, items))
                     row.updated_at = now_tr()
                     db.commit()
                     print(f"[PCM][SAVE][MERGED] session_logs.id={row.id} (IntegrityError sonrası)")
@@ -352,24 +424,20 @@ async def _flush_and_save_sessionlog(sid: str):
             except Exception:
                 pass
 
-    pcm_states.pop(sid, None)
+    _drop_pcm_state(sid)
 
 
 # ---------------- Socket.IO events ----------------
 @sio.event
 async def connect(sid, environ):
     print(f"[Socket][CONNECT] Yeni bağlantı: SID={sid}")
-    print("[Socket][CONNECT] globals_mod.connected_users id:", id(globals_mod.connected_users),
-          "content:", globals_mod.connected_users)
 
 @sio.event
 async def join(sid, data):
     user_id = str(data.get("user_id"))
-    globals_mod.connected_users[user_id] = sid
-    try:
-        sid_to_user[sid] = int(user_id)
-    except Exception:
-        sid_to_user[sid] = None
+    # aynı kullanıcının her sekmesi/cihazı kendi odasına katılır
+    await sio.enter_room(sid, user_room(user_id))
+    await globals_mod.add_connection(user_id, sid)
     print(f"[Socket][JOIN] user_id={user_id}, sid={sid}")
 
 @sio.event
@@ -377,59 +445,47 @@ async def typing(sid, data):
     receiver_id = str(data.get("receiver_id"))
     sender_id = str(data.get("sender_id"))
     conversation_id = str(data.get("conversation_id"))
-    receiver_sid = globals_mod.connected_users.get(receiver_id)
-    if receiver_sid:
-        await sio.emit("typing", {"sender_id": sender_id, "conversation_id": conversation_id}, to=receiver_sid)
+    if await globals_mod.is_online(receiver_id):
+        await sio.emit("typing", {"sender_id": sender_id, "conversation_id": conversation_id}, to=user_room(receiver_id))
 
 @sio.event
 async def disconnect(sid):
-    disconnected_user_id = None
-    for uid, stored_sid in list(globals_mod.connected_users.items()):
-        if stored_sid == sid:
-            disconnected_user_id = uid
-            break
-    if disconnected_user_id:
-        del globals_mod.connected_users[disconnected_user_id]
+    # oda üyeliğini socketio kendisi temizler; sadece indeksleri güncelle (O(1))
+    disconnected_user_id = await globals_mod.remove_connection(sid)
+    if disconnected_user_id is not None:
         print(f"[Socket][DISCONNECT] user_id={disconnected_user_id} SID={sid} disconnected.")
 
-    try:
-        await _flush_and_save_sessionlog(sid)
-    finally:
-        sid_to_user.pop(sid, None)
+    await _flush_and_save_sessionlog(sid)
 
 @sio.on("webrtc_offer")
 async def webrtc_offer(sid, data):
     to_user = str(data.get("to_user_id"))
-    to_sid = globals_mod.connected_users.get(to_user)
-    if to_sid:
-        await sio.emit("webrtc_offer", data, to=to_sid)
+    if await globals_mod.is_online(to_user):
+        await sio.emit("webrtc_offer", data, to=user_room(to_user))
     else:
         print(f"[WebRTC][OFFER] Kullanıcı çevrimdışı! {to_user}")
 
 @sio.on("webrtc_answer")
 async def webrtc_answer(sid, data):
     to_user = str(data.get("to_user_id"))
-    to_sid = globals_mod.connected_users.get(to_user)
-    if to_sid:
-        await sio.emit("webrtc_answer", data, to=to_sid)
+    if await globals_mod.is_online(to_user):
+        await sio.emit("webrtc_answer", data, to=user_room(to_user))
     else:
         print(f"[WebRTC][ANSWER] Kullanıcı çevrimdışı!")
 
 @sio.on("webrtc_ice_candidate")
 async def webrtc_ice_candidate(sid, data):
     to_user = str(data.get("to_user_id"))
-    to_sid = globals_mod.connected_users.get(to_user)
-    if to_sid:
-        await sio.emit("webrtc_ice_candidate", data, to=to_sid)
+    if await globals_mod.is_online(to_user):
+        await sio.emit("webrtc_ice_candidate", data, to=user_room(to_user))
     else:
         print(f"[WebRTC][ICE] Kullanıcı çevrimdışı!")
 
 @sio.on("webrtc_call_end")
 async def webrtc_call_end(sid, data):
     to_user = str(data.get("to_user_id"))
-    to_sid = globals_mod.connected_users.get(to_user)
-    if to_sid:
-        await sio.emit("webrtc_call_end", data, to=to_sid)
+    if await globals_mod.is_online(to_user):
+        await sio.emit("webrtc_call_end", data, to=user_room(to_user))
     else:
         print(f"[WebRTC][CALL END] Kullanıcı çevrimdışı!")
     try:
@@ -448,14 +504,17 @@ async def user_status(sid, data):
     if user:
         user.status = status
         db.commit()
+        invalidate_user_info(user.id)
         print(f"[Socket][STATUS] Kullanıcı {user_id} -> {status}")
         await sio.emit("user_status_update", {"user_id": user.id, "status": status})
 
 @sio.on("pcm_begin")
 async def pcm_begin(sid, data):
-    user_id = data.get("user_id") or sid_to_user.get(sid)
+    user_id = data.get("user_id") or await globals_mod.user_of(sid)
     peer_user_id = data.get("peer_user_id")
     session_ts = _parse_client_iso(data.get("session_time_stamp"))
+    if sid in pcm_states:
+        _cancel_pack_timer(pcm_states[sid])
     pcm_states[sid] = {
         "buf": bytearray(),
         "seg_buf": bytearray(),
@@ -465,8 +524,15 @@ async def pcm_begin(sid, data):
         "peer_user_id": int(peer_user_id) if peer_user_id is not None else None,
         "session_ts": session_ts or now_tr(),
         "segments": [],
+        "pack": [],           # transkripsiyonu bekleyen segmentler: (PCM, başlangıç_s, bitiş_s)
+        "pack_started": 0.0,
+        "pack_timer": None,   # LIVE_PACK_MAX_WAIT_MS sonunda pack'i gönderen task
+        "pack_flush": None,   # zamanlayıcının sürmekte olan gönderimi (flush bunu bekler)
         "call_id": data.get("call_id"),   # 🔑 istemciden gelen call_id
         "role": data.get("role"),
+        "t0": time.time(),    # akış başlangıcı (sunucu saati); segment zamanları buna göre
+        "seg_start": 0,       # açık segmentin ilk / son konuşma frame'i (frame sayacı)
+        "seg_end": 0,
         "n_frames": 0,
         "n_voiced": 0,
         "n_segments": 0,
@@ -491,6 +557,9 @@ async def pcm_chunk(sid, data):
         now_ts = time.time()
 
         if is_speech:
+            if not st["seg_buf"]:
+                st["seg_start"] = st["n_frames"] - 1
+            st["seg_end"] = st["n_frames"]
             st["seg_buf"].extend(frame)
             st["voiced"] = True
             st["last_voice"] = now_ts
@@ -499,6 +568,11 @@ async def pcm_chunk(sid, data):
             if st["voiced"] and (now_ts - st["last_voice"]) * 1000 >= SILENCE_TAIL_MS:
                 await _finalize_segment_and_emit(sid)
 
+        # süre konuşma sırasında dolduysa pack, segment kapanınca burada gönderilir
+        # (konuşma yoksa _pack_deadline zamanlayıcısı chunk beklemeden gönderir)
+        if st["pack"] and not st["voiced"] and (now_ts - st["pack_started"]) * 1000 >= LIVE_PACK_MAX_WAIT_MS:
+            await _transcribe_pack_and_emit(sid)
+
         if st["n_frames"] % 50 == 0:
             print(
                 f"[PCM][CHUNK] sid={sid} frames={st['n_frames']} voiced={st['n_voiced']} open_seg_bytes={len(st['seg_buf'])}"
@@ -4,6 +4,7 @@ from datetime import datetime, timezone
 from sqlalchemy.orm import relationship
 import pytz
 from sqlalchemy import UniqueConstraint
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
 
 def now_tr():
     return datetime.now(pytz.timezone("Europe/Istanbul"))
@@ -127,4 +128,51 @@ Index(
      SessionLog.user1_id,
      SessionLog.user2_id,
      SessionLog.session_time_stamp,
-)
\ No newline at end of file
+)
+# Upload sonrası içerik tespiti + türetilmiş (kanonik) kopya bilgisi
+class MediaAsset(Base):
+    __tablename__ = "media_assets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    s3_key = Column(String(length=512), unique=True, index=True, nullable=False)
+    mime = Column(String(length=255), nullable=False)  # magic byte'lardan tespit edilen tip
+    size_bytes = Column(Integer, nullable=False)
+    status = Column(String(length=20), nullable=False, default="pending")  # pending/ready/skipped/failed
+    derivative_key = Column(String(length=512), nullable=True)
+    derivative_mime = Column(String(length=255), nullable=True)
+    duration_s = Column(Float, nullable=True)
+    sample_rate = Column(Integer, nullable=True)  # orijinal örnekleme hızı
+    channels = Column(Integer, nullable=True)
+    row_count = Column(Integer, nullable=True)
+    error = Column(String(length=500), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=now_tr, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=now_tr, onupdate=now_tr, nullable=False)
+
+# Excel/CSV eklerinin modele giden metni; (S3 key, ETag, limitler, mod) başına bir kayıt.
+# İçerik Fernet ile şifreli tutulur.
+class SpreadsheetDigest(Base):
+    __tablename__ = "spreadsheet_digests"
+
+    id = Column(Integer, primary_key=True, index=True)
+    digest_key = Column(String(length=64), unique=True, index=True, nullable=False)
+    s3_key = Column(String(length=512), nullable=False, index=True)
+    etag = Column(String(length=128), nullable=False)
+    mode = Column(String(length=16), nullable=False)
+    content = Column(Text().with_variant(MEDIUMTEXT(), "mysql"), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=now_tr, nullable=False)
+    last_used_at = Column(DateTime(timezone=True), default=now_tr, nullable=False, index=True)
+
+
+class TranscriptCache(Base):
+    __tablename__ = "transcript_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(length=64), unique=True, index=True, nullable=False)
+    model = Column(String(length=64), nullable=False)
+    content = Column(Text().with_variant(MEDIUMTEXT(), "mysql"), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=now_tr, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    last_used_at = Column(DateTime(timezone=True), default=now_tr, nullable=False, index=True)
@@ -17,6 +17,7 @@ from dotenv import load_dotenv
 
 from backend.models import Users
 from backend.database import SessionLocal
+from backend.utils.chat import invalidate_user_info
 
 load_dotenv()
 
@@ -218,6 +219,7 @@ async def login_token(
     if user.status == "offline":
         user.status = "online"
         db.commit()
+        invalidate_user_info(user.id)
 
     access_token = create_token(
         user.username, user.id, user.role, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -243,4 +245,5 @@ async def logout(
     if user:
         user.status = "offline"
         db.commit()
+        invalidate_user_info(user.id)
     return {"message": "Logged out successfully"}
@@ -6,7 +6,7 @@ from pydantic import BaseModel
 from backend.database import get_db
 from backend.models import AssistantChatLog, Users
 from backend.routers.auth import get_current_user_from_cookie 
-from backend.utils.security import encrypt_message, decrypt_message
+from backend.utils.security import encrypt_message, decrypt_message, decrypt_many
 
 router = APIRouter(
     prefix="/chatlogs",
@@ -60,9 +60,12 @@ def get_chat_logs(
         raise HTTPException(status_code=401, detail="Authentication failed")
     logs = db.query(AssistantChatLog).filter(AssistantChatLog.user_id == user["id"]).order_by(AssistantChatLog.created_at.desc()).all()
     
-    for log in logs:
-        if isinstance(log.messages, str):
-            log.messages = decrypt_message(log.messages)
+    encrypted = [log for log in logs if isinstance(log.messages, str)]
+    decrypted, errors = decrypt_many([log.messages for log in encrypted], fallback=[])
+    if errors:
+        print(f"[CHATLOG][DECRYPT] {len(errors)} kayıt çözülemedi: {[encrypted[i].id for i in errors]}")
+    for log, msgs in zip(encrypted, decrypted):
+        log.messages = msgs
        
     return logs
 
@@ -10,8 +10,9 @@ from backend.routers.auth import get_current_user_from_cookie
 from pydantic import BaseModel
 from datetime import datetime
 from typing import List
-from backend.utils.security import encrypt_message, decrypt_message
+from backend.utils.security import encrypt_message, decrypt_message_cached, decrypt_many
 import backend.globals as globals_mod
+from backend.utils.chat import get_user_info, count_unread
 
 router = APIRouter(
     prefix="/conversations",
@@ -54,18 +55,7 @@ def get_unread_count(db, conversation_id, user_id):
     if not convo:
         return 0
     other_user_id = convo.user2_id if convo.user1_id == user_id else convo.user1_id
-    unread_query = db.query(UserChatMessage).filter(
-        UserChatMessage.conversation_id == conversation_id,
-        UserChatMessage.sender_id == other_user_id
-    )
-    unread_count = 0
-    for msg in unread_query:
-        is_read = db.query(UserMessageRead).filter_by(
-            user_id=user_id, message_id=msg.id
-        ).first()
-        if not is_read:
-            unread_count += 1
-    return unread_count
+    return count_unread(db, conversation_id, user_id, other_user_id)
 
 @router.get("/my")
 def get_my_conversations(
@@ -118,7 +108,7 @@ def get_my_conversations(
 
         if last_msg:
             try:
-                content = decrypt_message(last_msg.content)
+                content = decrypt_message_cached(last_msg.content, ("msg", last_msg.id))
             except Exception:
                 content = "[Çözülemedi]"
         else:
@@ -161,15 +151,15 @@ def get_messages(
         messages_query = messages_query.filter(UserChatMessage.timestamp > cleared_at)
     messages = messages_query.order_by(UserChatMessage.timestamp).all()
 
-    decrypted_messages = []
-    for m in messages:
-        if m.sender_id is None or m.content is None:
-            continue
-        try:
-            decrypted_content = decrypt_message(m.content)
-        except Exception:
-            decrypted_content = "[Çözülemedi]"
+    messages = [m for m in messages if m.sender_id is not None and m.content is not None]
+    decrypted_all, _ = decrypt_many(
+        [m.content for m in messages],
+        cache_keys=[("msg", m.id) for m in messages],
+        fallback="[Çözülemedi]",
+    )
 
+    decrypted_messages = []
+    for m, decrypted_content in zip(messages, decrypted_all):
         if isinstance(decrypted_content, str):
             msg_text = decrypted_content
         elif isinstance(decrypted_content, list):
@@ -209,12 +199,25 @@ async def send_message(
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user_from_cookie)
 ):
-    link = db.query(UserConversationState).filter_by(
-        conversation_id=conversation_id, user_id=current_user["id"]
-    ).first()
-    if not link:
+    # Yetki kontrolü ve konuşma satırı tek sorguda; aşağıda tekrar okunmuyor
+    conversation = (
+        db.query(UserConversation)
+        .join(UserConversationState, UserConversationState.conversation_id == UserConversation.id)
+        .filter(
+            UserConversation.id == conversation_id,
+            UserConversationState.user_id == current_user["id"],
+        )
+        .first()
+    )
+    if not conversation:
         raise HTTPException(status_code=403, detail="Bu konuşmaya mesaj gönderemezsiniz.")
 
+    receiver_id = (
+        conversation.user2_id
+        if conversation.user1_id == current_user["id"]
+        else conversation.user1_id
+    )
+
     encrypted_content = encrypt_message(payload.content)
     message = UserChatMessage(
         conversation_id=conversation_id,
@@ -222,60 +225,43 @@ async def send_message(
         content=encrypted_content
     )
     db.add(message)
+    db.flush()  # id/timestamp flush'ta belli olur; commit'ten önce okunur (expire_on_commit yeniden yüklemesin)
+    message_id = message.id
+    timestamp_iso = message.timestamp.isoformat()
     db.commit()
-    db.refresh(message)
 
-    conversation = db.query(UserConversation).filter_by(id=conversation_id).first()
-    receiver_id = (
-        conversation.user2_id
-        if conversation.user1_id == current_user["id"]
-        else conversation.user1_id
-    )
+    sender_info = get_user_info(db, current_user["id"])
+
+    receiver_room = globals_mod.user_room(receiver_id)
+    sender_room = globals_mod.user_room(current_user["id"])
 
-    sender_user = db.query(Users).filter(Users.id == current_user["id"]).first()
-    receiver_user = db.query(Users).filter(Users.id == receiver_id).first()
-
-    sender_info = {
-        "id": sender_user.id,
-        "first_name": sender_user.first_name,
-        "last_name": sender_user.last_name,
-        "username": sender_user.username,
-        "profile_picture_url": sender_user.profile_picture_url,
-        "status": sender_user.status,
-        "role": sender_user.role,
-    }
-
-    receiver_sid = globals_mod.connected_users.get(str(receiver_id))
-    sender_sid = globals_mod.connected_users.get(str(current_user["id"]))
-
-    # EMIT: receive_message to both sender and receiver if connected
-    for sid in set([receiver_sid, sender_sid]):
-        if sid and globals_mod.sio:
-            await globals_mod.sio.emit("receive_message", {
-                "message_id": message.id,
-                "conversation_id": conversation_id,
-                "sender_id": current_user["id"],
-                "content": payload.content,
-                "timestamp": message.timestamp.isoformat(),
-                "sender_info": sender_info,
-            }, to=sid)
+    # EMIT: receive_message to all devices of both sender and receiver
+    if globals_mod.sio:
+        await globals_mod.sio.emit("receive_message", {
+            "message_id": message_id,
+            "conversation_id": conversation_id,
+            "sender_id": current_user["id"],
+            "content": payload.content,
+            "timestamp": timestamp_iso,
+            "sender_info": sender_info,
+        }, to=list({receiver_room, sender_room}))
 
     # EMIT: new_conversation only to the receiver if it's a new one
-    if receiver_sid and globals_mod.sio:
+    if await globals_mod.is_online(receiver_id) and globals_mod.sio:
         await globals_mod.sio.emit("new_conversation", {
             "conversation_id": conversation_id,
             "sender_info": sender_info,
             "content": payload.content,
-            "timestamp": message.timestamp.isoformat(),
-        }, to=receiver_sid)
+            "timestamp": timestamp_iso,
+        }, to=receiver_room)
 
         #karşı tarafa badge update 
-        unread_count = get_unread_count(db, conversation_id, receiver_id)
+        unread_count = count_unread(db, conversation_id, receiver_id, current_user["id"])
         await globals_mod.sio.emit("unread_count_update", {
             "conversation_id": conversation_id,
             "user_id": receiver_id,
             "unread_count": unread_count,
-        }, to=receiver_sid)
+        }, to=receiver_room)
 
     return {"message": "Mesaj gönderildi"}
 
@@ -353,8 +339,7 @@ async def mark_messages_as_read(
 
     # Her conversation için unread count güncellemesi
     for convo_id in updated_conversation_ids:
-        sid = globals_mod.connected_users.get(str(user_id))
-        if sid and globals_mod.sio:
+        if await globals_mod.is_online(user_id) and globals_mod.sio:
             unread_count = get_unread_count(db, convo_id, user_id)
             await globals_mod.sio.emit(
                 "unread_count_update",
@@ -363,12 +348,11 @@ async def mark_messages_as_read(
                     "user_id": user_id,
                     "unread_count": unread_count,
                 },
-                to=sid,
+                to=globals_mod.user_room(user_id),
             )
 
     for update in message_updates:
-        sender_sid = globals_mod.connected_users.get(str(update["sender_id"]))
-        if sender_sid and globals_mod.sio:
+        if await globals_mod.is_online(update["sender_id"]) and globals_mod.sio:
             await globals_mod.sio.emit(
                 "message_read_update",
                 {
@@ -376,7 +360,7 @@ async def mark_messages_as_read(
                     "conversation_id": update["conversation_id"],
                     "read_by": update["read_by"]
                 },
-                to=sender_sid
+                to=globals_mod.user_room(update["sender_id"])
             )
 
     return {"success": True, "marked": payload.message_ids}
@@ -1,8 +1,17 @@
 # routers/files.py
 from fastapi import APIRouter, Depends, HTTPException, Header
 from backend.routers.auth import get_current_user_from_cookie
-from starlette.responses import StreamingResponse
-import os, re, boto3
+from starlette.responses import StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
+from email.utils import parsedate_to_datetime, format_datetime
+from datetime import timezone
+import os, re, time
+from backend.utils.aws_s3 import get_s3_client
+from backend.utils.cache import LRUCache
+from backend.utils.disk_cache import disk_cache
+from backend.utils import metrics
+from pydantic import BaseModel
+from typing import List
 from urllib.parse import quote
 from unicodedata import normalize
 
@@ -14,12 +23,7 @@ AWS_S3_BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
 router = APIRouter(prefix="/files", tags=["files"])
 
 def _s3():
-    return boto3.client(
-        "s3",
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_DEFAULT_REGION,
-    )
+    return get_s3_client()
 
 def _ascii_fallback(name: str) -> str:
     fb = normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
@@ -45,6 +49,50 @@ def create_presigned_url(key: str, expires_in=300):
         print("!!! PRESIGN ERROR:", e)
         raise
 
+PRESIGN_EXPIRES = max(1, int(os.getenv("PRESIGN_EXPIRES", "300")))
+# imza dolmadan en az bu kadar süre önce cache'ten düşer; yeniden kullanım penceresi boş
+# kalmasın diye imza süresinin yarısıyla sınırlanır
+PRESIGN_SAFETY_MARGIN = min(max(0, int(os.getenv("PRESIGN_SAFETY_MARGIN", "90"))), PRESIGN_EXPIRES // 2)
+PRESIGN_BULK_MAX = int(os.getenv("PRESIGN_BULK_MAX", "200"))
+
+presign_cache = LRUCache(
+    "presign",
+    max_items=int(os.getenv("PRESIGN_CACHE_MAX", "5000")),
+    ttl=max(1, PRESIGN_EXPIRES - PRESIGN_SAFETY_MARGIN),
+)
+
+def _remaining(issued_at: float) -> int:
+    return max(0, int(issued_at + PRESIGN_EXPIRES - time.time()))
+
+def _presign(key: str, dl: bool = False, name: str | None = None) -> tuple[str, int]:
+    """
+    (key, dl, name) başına imzalı URL; imza süresi dolmadan güvenle yeniden kullanılır.
+    Dönüş: (url, kalan_saniye) -> cache'ten gelen URL için kalan süre imza anından hesaplanır.
+    """
+    cache_key = (key, bool(dl), name if dl else None)
+    hit = presign_cache.get(cache_key)
+    if hit:
+        url, issued_at = hit
+        return url, _remaining(issued_at)
+
+    params = {"Bucket": AWS_S3_BUCKET_NAME, "Key": key}
+    if dl:
+        fname = (name or key.split("/")[-1] or "download")
+        params["ResponseContentDisposition"] = content_disposition(fname, inline=False)
+
+    issued_at = time.time()
+    url = _s3().generate_presigned_url("get_object", Params=params, ExpiresIn=PRESIGN_EXPIRES)
+    presign_cache.set(cache_key, (url, issued_at))
+    return url, PRESIGN_EXPIRES
+
+class PresignItem(BaseModel):
+    key: str
+    dl: bool = False
+    name: str | None = None
+
+class PresignBulkRequest(BaseModel):
+    items: List[PresignItem]
+
 @router.get("/presign")
 def get_presigned_url(
     key: str,
@@ -55,77 +103,265 @@ def get_presigned_url(
     if not user or not user.get("id"):
         raise HTTPException(status_code=401, detail="Authentication failed")
 
-    s3 = _s3()
-    params = {"Bucket": AWS_S3_BUCKET_NAME, "Key": key}
-
-    if dl:
-        fname = (name or key.split("/")[-1] or "download")
-        params["ResponseContentDisposition"] = content_disposition(fname, inline=False)
-
-    url = s3.generate_presigned_url("get_object", Params=params, ExpiresIn=300)
-    return {"url": url}
+    url, expires_in = _presign(key, dl, name)
+    return {"url": url, "expires_in": expires_in}
 
-# CORSsuz stream endpoint (Range destekli)
-@router.get("/stream")
-def stream_file(
-    key: str,
-    dl: bool = False,
-    range_header: str | None = Header(None, alias="Range"),
+@router.post("/presign/bulk")
+def get_presigned_urls_bulk(
+    payload: PresignBulkRequest,
     user: dict = Depends(get_current_user_from_cookie),
 ):
+    """Bir konuşmadaki tüm avatar/ekler için tek istekte imzalı URL listesi (istek sırasıyla)."""
     if not user or not user.get("id"):
         raise HTTPException(status_code=401, detail="Authentication failed")
+    if len(payload.items) > PRESIGN_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"En fazla {PRESIGN_BULK_MAX} anahtar imzalanabilir.")
 
-    # if not key.startswith(f"user_{user['id']}/"):
-    #     raise HTTPException(status_code=403, detail="Forbidden")
+    out = []
+    for it in payload.items:
+        try:
+            url, expires_in = _presign(it.key, it.dl, it.name)
+            out.append({"key": it.key, "url": url, "expires_in": expires_in})
+        except Exception as e:
+            print("!!! PRESIGN ERROR:", e)
+            out.append({"key": it.key, "url": None, "error": "presign failed"})
+    # üst düzey expires_in: listedeki en erken dolan URL (tümünü birlikte yenileyen istemciler için)
+    lives = [o["expires_in"] for o in out if o.get("url")]
+    return {"items": out, "expires_in": min(lives) if lives else 0}
 
-    s3 = _s3()
+FILES_STREAM_CHUNK = int(os.getenv("FILES_STREAM_CHUNK", str(256 * 1024)))
 
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _parse_range(range_header: str | None) -> str | None:
+    """
+    'bytes=a-b', 'bytes=a-' ve 'bytes=-n' (suffix) kabul edilir ve S3'e olduğu gibi iletilir.
+    Çoklu aralık (virgüllü) desteklenmez -> None (tam dosya 200 döner, RFC 7233'e uygun).
+    """
+    if not range_header:
+        return None
+    rh = range_header.strip().replace(" ", "")
+    if "," in rh:
+        return None
+    m = _RANGE_RE.match(rh)
+    if not m or (not m.group(1) and not m.group(2)):
+        raise HTTPException(status_code=416, detail="Invalid Range")
+    if m.group(1) and m.group(2) and int(m.group(1)) > int(m.group(2)):
+        raise HTTPException(status_code=416, detail="Invalid Range")
+    return rh
+
+def _s3_error_code(e: Exception) -> str:
+    resp = getattr(e, "response", None) or {}
+    return str(resp.get("Error", {}).get("Code", "")) or str(resp.get("ResponseMetadata", {}).get("HTTPStatusCode", ""))
+
+def _get_object(key: str, s3_range: str | None, if_none_match: str | None,
+                if_modified_since: str | None, if_range: str | None) -> tuple[dict, bool]:
+    """
+    Tek GET ile gövde + meta. HEAD yapılmaz; boyut/tip/ETag GET yanıtından gelir.
+    Dönüş: (yanıt, range_uygulandı_mı)
+    """
+    s3 = _s3()
+    params = {"Bucket": AWS_S3_BUCKET_NAME, "Key": key}
+    if if_none_match:
+        params["IfNoneMatch"] = if_none_match
+    if if_modified_since:
+        try:
+            params["IfModifiedSince"] = parsedate_to_datetime(if_modified_since)
+        except Exception:
+            pass
+    if s3_range:
+        params["Range"] = s3_range
+        if if_range:
+            # If-Range: ETag ise IfMatch, tarih ise IfUnmodifiedSince; tutmazsa tam dosya
+            if if_range.startswith('"') or if_range.startswith("W/"):
+                params["IfMatch"] = if_range
+            else:
+                try:
+                    params["IfUnmodifiedSince"] = parsedate_to_datetime(if_range)
+                except Exception:
+                    params.pop("Range")
     try:
-        head = s3.head_object(Bucket=AWS_S3_BUCKET_NAME, Key=key)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
+        return s3.get_object(**params), "Range" in params
+    except Exception as e:
+        code = _s3_error_code(e)
+        if code in ("PreconditionFailed", "412") and s3_range and if_range:
+            params.pop("Range", None); params.pop("IfMatch", None); params.pop("IfUnmodifiedSince", None)
+            return s3.get_object(**params), False
+        raise
 
-    total = int(head.get("ContentLength", 0))
-    ctype = head.get("ContentType") or "application/octet-stream"
-    raw_name = key.split("/")[-1] or "download"
+async def _abody_iter(body, chunk_size: int = FILES_STREAM_CHUNK, writer=None):
+    """
+    S3 gövdesini threadpool'da parça parça okur; client koparsa bağlantıyı bırakır.
+    writer verilirse (disk cache) her parça aynı anda cache dosyasına da yazılır.
+    """
+    def _read():
+        chunk = body.read(chunk_size)
+        if chunk and writer:
+            writer.write(chunk)
+        return chunk
 
-    def _body_iter(obj, chunk_size=1024 * 1024):
-        body = obj["Body"]
+    done = False
+    try:
         while True:
-            chunk = body.read(chunk_size)
+            chunk = await run_in_threadpool(_read)
             if not chunk:
+                done = True
                 break
             yield chunk
+    finally:
+        body.close()
+        if writer:
+            if done:
+                await run_in_threadpool(writer.commit)
+            else:
+                writer.abort()
 
+def _base_headers(raw_name: str, dl: bool, ctype: str | None, etag: str | None, last_modified) -> dict:
     headers = {
-        "Content-Type": ctype,
+        "Content-Type": ctype or "application/octet-stream",
         "Content-Disposition": content_disposition(raw_name, inline=not dl),
         "Accept-Ranges": "bytes",
         # bazı tarayıcı sertleştirmeleri
         "X-Content-Type-Options": "nosniff",
         "Cross-Origin-Resource-Policy": "same-site",
     }
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
 
-    if range_header:
-        m = re.match(r"bytes=(\d+)-(\d*)", range_header)
-        if not m:
-            raise HTTPException(status_code=416, detail="Invalid Range")
-        start = int(m.group(1))
-        end = int(m.group(2) or (total - 1))
-        if start > end or end >= total:
-            raise HTTPException(status_code=416, detail="Invalid Range")
-
-        resp = s3.get_object(
-            Bucket=AWS_S3_BUCKET_NAME,
-            Key=key,
-            Range=f"bytes={start}-{end}",
-        )
+def _resolve_range(spec: str, total: int) -> tuple[int, int]:
+    """_parse_range çıktısını [start, end] byte aralığına çevirir (disk cache'ten servis için)."""
+    a, b = _RANGE_RE.match(spec).groups()
+    if not a:
+        n = int(b)
+        if n == 0:
+            raise ValueError("unsatisfiable")
+        return max(0, total - n), total - 1
+    start = int(a)
+    end = min(int(b), total - 1) if b else total - 1
+    if start >= total or start > end:
+        raise ValueError("unsatisfiable")
+    return start, end
+
+def _still_fresh(key: str, etag: str) -> bool:
+    """Cache'teki sürüm hala güncel mi? Gövdesiz koşullu HEAD (304 -> güncel)."""
+    try:
+        _s3().head_object(Bucket=AWS_S3_BUCKET_NAME, Key=key, IfNoneMatch=etag)
+        return False
+    except Exception as e:
+        if _s3_error_code(e) in ("304", "NotModified"):
+            return True
+        return False
+
+def _serve_from_disk(entry: dict, key: str, dl: bool, s3_range: str | None,
+                     if_none_match: str | None, if_range: str | None):
+    """Cache kaydından yanıt; dosya açılamazsa (evict/invalidate edilmiş) None -> S3'ten servis edilir."""
+    raw_name = key.split("/")[-1] or "download"
+    headers = _base_headers(raw_name, dl, entry["content_type"], entry["etag"], entry["last_modified"])
+    total = entry["size"]
+
+    if if_none_match and if_none_match == entry["etag"]:
+        return Response(status_code=304, headers={"ETag": entry["etag"]})
+
+    if s3_range and (not if_range or if_range == entry["etag"]):
+        try:
+            start, end = _resolve_range(s3_range, total)
+        except ValueError:
+            raise HTTPException(status_code=416, detail="Invalid Range",
+                                headers={"Content-Range": f"bytes */{total}"})
         headers["Content-Range"] = f"bytes {start}-{end}/{total}"
         headers["Content-Length"] = str(end - start + 1)
-        return StreamingResponse(_body_iter(resp), status_code=206, headers=headers)
+        status = 206
+    else:
+        start, end, status = 0, total - 1, 200
+        headers["Content-Length"] = str(total)
+
+    try:
+        body = disk_cache.read_range(entry, start, end, FILES_STREAM_CHUNK)
+    except OSError as e:
+        print(f"[FILES][DISKCACHE] open failed {key}: {e}")
+        metrics.incr("files_disk_cache_open_failed")
+        if disk_cache.lookup(key) is entry:  # bu arada yenisi yazıldıysa ona dokunma
+            disk_cache.invalidate(key)
+        return None
+    return StreamingResponse(body, status_code=status, headers=headers)
+
+def _cache_writer_for(key: str, resp: dict, ranged: bool):
+    """Yanıt objenin tamamını kapsıyorsa (tam GET veya bytes=0-) disk cache'e yazıcı döner."""
+    if not disk_cache.enabled:
+        return None
+    length = int(resp.get("ContentLength", 0))
+    if ranged:
+        m = re.match(r"bytes (\d+)-(\d+)/(\d+)", resp.get("ContentRange") or "")
+        if not m or int(m.group(1)) != 0 or int(m.group(3)) != length:
+            return None
+    return disk_cache.writer(key, resp.get("ETag"), length, resp.get("ContentType"), resp.get("LastModified"))
+
+# CORSsuz stream endpoint (Range + koşullu istek destekli, upstream'e tek GET)
+@router.get("/stream")
+async def stream_file(
+    key: str,
+    dl: bool = False,
+    range_header: str | None = Header(None, alias="Range"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+    if_modified_since: str | None = Header(None, alias="If-Modified-Since"),
+    if_range: str | None = Header(None, alias="If-Range"),
+    user: dict = Depends(get_current_user_from_cookie),
+):
+    if not user or not user.get("id"):
+        raise HTTPException(status_code=401, detail="Authentication failed")
+
+    # if not key.startswith(f"user_{user['id']}/"):
+    #     raise HTTPException(status_code=403, detail="Forbidden")
+
+    s3_range = _parse_range(range_header)
+
+    # Sıcak objeler: yerel disk cache. ETag son FILES_DISK_CACHE_REVALIDATE_S saniyede doğrulandıysa
+    # S3'e hiç gidilmez; değilse koşullu HEAD ile yeniden doğrulanır.
+    entry = disk_cache.lookup(key)
+    if entry:
+        fresh = not disk_cache.needs_revalidation(entry)
+        if not fresh and await run_in_threadpool(_still_fresh, key, entry["etag"]):
+            disk_cache.mark_fresh(entry)
+            metrics.incr("files_disk_cache_revalidations")
+            fresh = True
+        if fresh:
+            served = _serve_from_disk(entry, key, dl, s3_range, if_none_match, if_range)
+            if served is not None:
+                metrics.incr("files_disk_cache_hits")
+                return served
+        else:
+            disk_cache.invalidate(key)
+    if disk_cache.enabled:
+        metrics.incr("files_disk_cache_misses")
+
+    try:
+        resp, ranged = await run_in_threadpool(
+            _get_object, key, s3_range, if_none_match, if_modified_since, if_range
+        )
+    except Exception as e:
+        code = _s3_error_code(e)
+        if code in ("304", "NotModified"):
+            return Response(status_code=304, headers={"ETag": if_none_match or ""})
+        if code in ("InvalidRange", "416"):
+            size = (getattr(e, "response", None) or {}).get("Error", {}).get("ActualObjectSize")
+            headers = {"Content-Range": f"bytes */{size}"} if size else {}
+            raise HTTPException(status_code=416, detail="Invalid Range", headers=headers)
+        if code in ("NoSuchKey", "404", "NotFound"):
+            raise HTTPException(status_code=404, detail="File not found")
+        print("!!! S3 STREAM ERROR:", e)
+        raise HTTPException(status_code=502, detail="Upstream error")
+
+    raw_name = key.split("/")[-1] or "download"
+    headers = _base_headers(raw_name, dl, resp.get("ContentType"), resp.get("ETag"), resp.get("LastModified"))
+    headers["Content-Length"] = str(resp.get("ContentLength", 0))
+    writer = _cache_writer_for(key, resp, ranged)
+
+    if ranged and resp.get("ContentRange"):
+        headers["Content-Range"] = resp["ContentRange"]
+        return StreamingResponse(_abody_iter(resp["Body"], writer=writer), status_code=206, headers=headers)
 
     # Tam dosya
-    resp = s3.get_object(Bucket=AWS_S3_BUCKET_NAME, Key=key)
-    headers["Content-Length"] = str(total)
-    return StreamingResponse(_body_iter(resp), headers=headers)
+    return StreamingResponse(_abody_iter(resp["Body"], writer=writer), headers=headers)
@@ -1,99 +1,49 @@
 import io
 import os
 import time
-import wave
+import asyncio
 import json
-import audioop
+import wave
+import shutil
+import hashlib
+import tempfile
+import threading
 import mimetypes
 from typing import List, Optional
+from functools import partial
 
 from fastapi import APIRouter, HTTPException, Form, UploadFile, File, Depends
 from fastapi.responses import StreamingResponse
+import anyio
 
 from google import genai
 from google.genai import types
 
-from backend.utils.aws_s3 import read_file_from_s3
+from backend.utils.aws_s3 import read_file_from_s3, head_s3_object, open_s3_spooled
+from backend.utils.cache import LRUCache
 from backend.routers.auth import get_current_user_from_cookie
 from backend.routers.prompts import *
-import webrtcvad
-
-import pandas as pd  # pip install pandas openpyxl eğer yoksa, yaptım ben 
-
-MAX_ROWS_PER_SHEET = int(os.getenv("CSV_MAX_ROWS_PER_SHEET", "2000"))
-MAX_CSV_BYTES      = int(os.getenv("CSV_MAX_BYTES", "400000"))  # ~400 KB
-CSV_PREVIEW_ROWS   = int(os.getenv("CSV_PREVIEW_ROWS", "50"))
-
-EXCEL_EXTS = (".xlsx", ".xls")
-CSV_EXTS   = (".csv",)
-
-def is_excel_filename(fn: str) -> bool:
-    fn = (fn or "").lower()
-    return fn.endswith(EXCEL_EXTS)
-
-def is_csv_filename(fn: str) -> bool:
-    fn = (fn or "").lower()
-    return fn.endswith(CSV_EXTS)
-
-def excel_bytes_to_csv_text(raw: bytes) -> str:
-    """
-    Excel'i (çok sayfalı olabilir) CSV metnine çevirir.
-    Büyük dosyalar için satır kısma ve toplam byte limiti uygular;
-    hala çok büyükse özet moda düşer (kolonlar+dtypes+ilk N satır).
-    """
-    buf = io.BytesIO(raw)
-    try:
-        xls = pd.ExcelFile(buf)  # requires openpyxl for .xlsx
-    except Exception as e:
-        # CSV gelmiş olabilir: fallback utf-8 decode
-        try:
-            return raw.decode("utf-8", errors="replace")
-        except Exception:
-            raise e
-
-    pieces = []
-    for name in xls.sheet_names:
-        df = xls.parse(name)
-        if len(df) > MAX_ROWS_PER_SHEET:
-            df_lim = df.head(MAX_ROWS_PER_SHEET)
-            note = f"# Sheet: {name} (truncated to first {MAX_ROWS_PER_SHEET} rows of {len(df)})\n"
-        else:
-            df_lim = df
-            note = f"# Sheet: {name}\n"
-        pieces.append(note + df_lim.to_csv(index=False))
-
-    csv_all = "\n\n".join(pieces)
-
-    # Byte limiti: hala çok büyükse özet moduna geç
-    if len(csv_all.encode("utf-8")) > MAX_CSV_BYTES:
-        summary_parts = []
-        for name in xls.sheet_names:
-            df = xls.parse(name)
-            dtypes = {k: str(v) for k, v in df.dtypes.to_dict().items()}
-            cols = list(df.columns)
-            preview = df.head(CSV_PREVIEW_ROWS).to_csv(index=False)
-            summary_parts.append(
-                f"# Sheet: {name}\n"
-                f"Columns ({len(cols)}): {cols}\n"
-                f"Dtypes: {dtypes}\n"
-                f"Preview (first {CSV_PREVIEW_ROWS} rows):\n{preview}"
-            )
-        csv_all = (
-            "Dataset is large, sending a compact summary instead.\n"
-            "If you need specific filters or columns, ask and I will provide a focused slice.\n\n"
-            + "\n\n".join(summary_parts)
-        )
-    return csv_all
-
-
-mimetypes.add_type("audio/mp4", ".m4a")
-mimetypes.add_type("image/jpeg", ".jpg")
-mimetypes.add_type("image/jpeg", ".jpeg")
-mimetypes.add_type("image/png", ".png")
-
-mimetypes.add_type("text/csv", ".csv")
-mimetypes.add_type("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx")
-mimetypes.add_type("application/vnd.ms-excel", ".xls")
+from backend.utils.vad import SegmentStream
+from backend.utils.packing import (
+    TRANSCRIBE_PACK_MAP, PackBuilder, join_pcm, pack_layout, pack_prompt, split_pack_text, record_call,
+)
+
+from backend.utils.spreadsheet import (
+    SPREADSHEET_DIGEST_MODE, is_excel_filename, is_csv_filename, render_spreadsheet,
+)
+from backend.utils.digest_cache import get_or_build
+from backend.utils import metrics
+from backend.utils.transcript_filter import TranscriptStream, count_dropped
+from backend.utils.transcript_cache import (
+    audio_sha256, cache_key as transcript_key, lookup as transcript_lookup, store as transcript_store,
+)
+from backend.utils.media import (
+    SNIFF_BYTES, WAV_TYPES, mime_from_filename, detect_mime, derivative_for, wav_from_pcm16,
+    spreadsheet_derivative_key,
+)
+from backend.utils.audio_decode import (
+    COMPRESSED_AUDIO_TYPES, ffmpeg_available, iter_wav_pcm16, iter_ffmpeg_pcm16,
+)
 
 router = APIRouter(prefix="/gemini", tags=["gemini"])
 
@@ -145,34 +95,79 @@ def _stream_with_backoff(make_stream_fn, max_attempts=10, base_sleep=4.0):
     yield f"\n[ERROR]: Backoff attempts exhausted. Last error: {last_err}\n"
 
 
+# Async varyantlar: /chat/stream threadpool thread'i işgal etmeden akış yapar
+_arl_lock = asyncio.Lock()
+
+async def _arl_gate():
+    global _last_call_ts
+    async with _arl_lock:
+        now = time.time()
+        wait = max(0.0, _MIN_INTERVAL - (now - _last_call_ts))
+        if wait > 0:
+            await asyncio.sleep(wait)
+        _last_call_ts = time.time()
+
+
+async def _astream_with_backoff(make_stream_coro, max_attempts=10, base_sleep=4.0):
+    """_stream_with_backoff'un async hali; client koparsa CancelledError yukarı taşınır ve upstream akış kapanır."""
+    attempt = 0
+    last_err = None
+    while attempt < max_attempts:
+        attempt += 1
+        yielded = False
+        try:
+            await _arl_gate()
+            resp = await make_stream_coro()
+            try:
+                async for chunk in resp:
+                    if getattr(chunk, "text", None):
+                        yielded = True
+                        yield chunk.text
+            finally:
+                # iptal/hata durumunda upstream HTTP akışını hemen kapat
+                aclose = getattr(resp, "aclose", None)
+                if aclose:
+                    with anyio.CancelScope(shield=True):
+                        await aclose()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            msg = str(e)
+            last_err = msg
+            print(f"[GenAI async retry {attempt}/{max_attempts}] error: {msg}")
+            transient = (
+                "RESOURCE_EXHAUSTED", "429",
+                "ACTIVE", "FAILED_PRECONDITION",
+                "INTERNAL", "temporarily unavailable",
+                "deadline", "timeout", "504", "gateway", "unavailable"
+            )
+            # kısmi çıktı gönderildiyse baştan denemek metni çiftler
+            if not yielded and any(t.lower() in msg.lower() for t in transient):
+                await asyncio.sleep(min(base_sleep * (2 ** (attempt - 1)), 25.0))
+                continue
+            yield f"\n[ERROR]: {msg}"
+            return
+    yield f"\n[ERROR]: Backoff attempts exhausted. Last error: {last_err}\n"
+
+
 # yardımcı fonksiyonlar
 def s3_key_from_url(url: str) -> str:
     return url.split(".amazonaws.com/", 1)[1]
 
 def normalize_mime(filename: str, guessed: Optional[str]) -> str:
-    fn = (filename or "").lower()
-    mime = (guessed or "application/octet-stream")
-    if fn.endswith(".webm") and mime == "video/webm":
-        mime = "audio/webm"
-    if fn.endswith(".m4a") and mime in (None, "application/octet-stream", "audio/mpeg"):
-        mime = "audio/mp4"
-    if mime == "application/octet-stream":
-        if fn.endswith(".mp3"):  mime = "audio/mpeg"
-        elif fn.endswith(".wav"): mime = "audio/wav"
-        elif fn.endswith(".ogg"): mime = "audio/ogg"
-        elif fn.endswith(".flac"): mime = "audio/flac"
-        elif fn.endswith(".aiff") or fn.endswith(".aif"): mime = "audio/aiff"
-        elif fn.endswith(".pdf"):  mime = "application/pdf"
-        elif fn.endswith(".png"):  mime = "image/png"
-        elif fn.endswith(".jpg") or fn.endswith(".jpeg"): mime = "image/jpeg"
-        elif fn.endswith(".csv"):  mime = "text/csv"
-        elif fn.endswith(".xlsx"): mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        elif fn.endswith(".xls"):  mime = "application/vnd.ms-excel"
-    return mime
+    return mime_from_filename(filename, guessed)
+
+def _as_upload_file(src):
+    """bytes -> BytesIO; dosya benzeri nesneler (Spooled/UploadFile.file) kopyalanmadan geçer."""
+    if hasattr(src, "read"):
+        src.seek(0)
+        return src
+    return io.BytesIO(src)
 
 def upload_and_wait_active(file_bytes: bytes, mime: str, timeout_s: float = 45.0, poll_sleep: float = 0.8):
-    """main.py bunu import ediyor -> imza değişmedi."""
-    up = client.files.upload(file=io.BytesIO(file_bytes), config=dict(mime_type=mime))
+    """main.py bunu import ediyor -> imza değişmedi. file_bytes bytes ya da açık dosya olabilir."""
+    up = client.files.upload(file=_as_upload_file(file_bytes), config=dict(mime_type=mime))
     name = up.name
     deadline = time.time() + timeout_s
     while time.time() < deadline:
@@ -206,11 +201,78 @@ def _ensure_all_active(file_objs, timeout_s: float = 120.0, poll_sleep: float =
             return
         time.sleep(poll_sleep)
 
+async def _aensure_all_active(file_objs, timeout_s: float = 120.0, poll_min: float = 0.25, poll_max: float = 2.0):
+    """
+    Tüm dosyalar için tek, paylaşılan ACTIVE poller'ı. Bekleyen dosyalar her turda
+    paralel sorgulanır, ACTIVE olanlar listeden düşer; aralık poll_min'den başlayıp
+    poll_max'a kadar büyür (küçük dosyalar hızlı, büyükler az istekle).
+    Dönüş: ACTIVE olan dosya adları.
+    """
+    pending = [n for n in (getattr(u, "name", None) for u in file_objs) if n]
+    active = set()
+    delay = poll_min
+    deadline = time.time() + timeout_s
+    while pending and time.time() < deadline:
+        states = await asyncio.gather(
+            *[client.aio.files.get(name=n) for n in pending], return_exceptions=True
+        )
+        still = []
+        for n, f in zip(pending, states):
+            state = None if isinstance(f, BaseException) else str(getattr(f, "state", "") or "")
+            if state and state.endswith("ACTIVE"):
+                active.add(n)
+            elif state and state.endswith("FAILED"):
+                print(f"[GEMINI][FILE] {n} FAILED state")
+            else:
+                still.append(n)
+        pending = still
+        if pending:
+            await asyncio.sleep(delay)
+            delay = min(delay * 1.6, poll_max)
+    return active
+
+async def _adelete_files(file_objs):
+    """İptal edilmiş bir akışın finally bloğunda da çalışsın diye shield içinde siler."""
+    with anyio.CancelScope(shield=True):
+        for up in file_objs:
+            try:
+                if getattr(up, "name", None):
+                    await client.aio.files.delete(name=up.name)
+            except Exception:
+                pass
+
 def _file_part_from_bytes(raw: bytes, mime: str):
     """Bytes -> File Store -> Part(file_data). Inline **KULLANMIYORUZ** (INVALID_ARGUMENT kaçınmak için)."""
     up = upload_and_wait_active(raw, mime)
     return up, types.Part(file_data=types.FileData(file_uri=up.uri, mime_type=mime))
 
+def _spreadsheet_content(filename: str, csv_text: str) -> types.Content:
+    if is_csv_filename(filename):
+        csv_block = f"Below is CSV data from file '{filename}':\n\n{csv_text}"
+    else:
+        csv_block = (
+            f"Below is spreadsheet data converted to CSV from file '{filename}'. "
+            f"It may be truncated/ summarized to fit the context.\n\n{csv_text}"
+        )
+    return types.Content(role="user", parts=[types.Part(text=csv_block)])
+
+def _spreadsheet_text_from_s3(s3_key: str, filename: str) -> str:
+    """Digest cache'ten (S3 key, ETag, limitler, mod); yoksa upload türevi ya da orijinal dönüştürülür."""
+    etag = None
+    try:
+        etag = head_s3_object(s3_key)["etag"]
+    except Exception:
+        pass
+
+    def _build():
+        deriv = derivative_for(s3_key)
+        # upload türevi başka bir mod/limitlerle üretildiyse kullanılmaz, orijinalden yeniden üretilir
+        if deriv and deriv["mime"] == "text/csv" and deriv["key"] == spreadsheet_derivative_key(s3_key):
+            return read_file_from_s3(deriv["key"]).decode("utf-8", errors="replace")
+        return render_spreadsheet(filename, read_file_from_s3(s3_key))
+
+    return get_or_build(s3_key, etag, SPREADSHEET_DIGEST_MODE, _build)
+
 # NEW: Excel/CSV yakala -> text part; diğerleri file_data
 def _append_blob_as_part_or_excel_text(
     built_contents: List[types.Content],
@@ -224,45 +286,8 @@ def _append_blob_as_part_or_excel_text(
     """
     fn = (filename or "").lower()
 
-    if is_excel_filename(fn):
-        csv_text = excel_bytes_to_csv_text(raw)
-        csv_block = (
-            f"Below is spreadsheet data converted to CSV from file '{filename}'. "
-            f"It may be truncated/ summarized to fit the context.\n\n{csv_text}"
-        )
-        built_contents.append(
-            types.Content(role="user", parts=[types.Part(text=csv_block)])
-        )
-        return
-
-    if is_csv_filename(fn):
-        try:
-            csv_text = raw.decode("utf-8", errors="replace")
-        except Exception:
-            csv_text = str(raw)
-        if len(csv_text.encode("utf-8")) > MAX_CSV_BYTES:
-            import csv as _csv
-            from io import StringIO as _SIO
-            sio = _SIO(csv_text)
-            rows, header = [], None
-            reader = _csv.reader(sio)
-            for i, row in enumerate(reader):
-                if i == 0:
-                    header = row
-                if i <= CSV_PREVIEW_ROWS:
-                    rows.append(row)
-                else:
-                    break
-            csv_text = (
-                "CSV is large, sending header and a small preview.\n"
-                f"Header: {header}\n"
-                f"Preview (first {CSV_PREVIEW_ROWS} rows):\n" +
-                "\n".join([",".join(r) for r in rows])
-            )
-        csv_block = f"Below is CSV data from file '{filename}':\n\n{csv_text}"
-        built_contents.append(
-            types.Content(role="user", parts=[types.Part(text=csv_block)])
-        )
+    if is_excel_filename(fn) or is_csv_filename(fn):
+        built_contents.append(_spreadsheet_content(filename, render_spreadsheet(fn, raw)))
         return
 
     # not excel/csv: normal dosya yükle
@@ -272,6 +297,159 @@ def _append_blob_as_part_or_excel_text(
     built_contents.append(types.Content(role="user", parts=[part]))
 
 
+# (S3 key, ETag) -> aktif Gemini dosyası. Files API dosyaları ~48 saatte siler;
+# TTL bunun altında tutulur, silme işlemi merkezi GC'de yapılır (her yanıttan sonra değil).
+GEMINI_FILE_CACHE_TTL = float(os.getenv("GEMINI_FILE_CACHE_TTL", str(40 * 3600)))
+GEMINI_FILE_CACHE_GRACE = float(os.getenv("GEMINI_FILE_CACHE_GRACE", "900"))
+GEMINI_FILE_CACHE_MAX = int(os.getenv("GEMINI_FILE_CACHE_MAX", "500"))
+
+def _delete_gemini_file(name: str):
+    try:
+        client.files.delete(name=name)
+    except Exception as e:
+        print(f"[GEMINI][FILECACHE] delete failed {name}: {e}")
+
+# LRU'dan düşen / yerine yazılan kayıtların dosyaları hemen silinmez: o anda başka bir istek
+# aynı URI ile Gemini çağrısı yapıyor olabilir. (isim, düşme zamanı) kuyruğa alınır, GC grace sonrası siler.
+_evicted_files: list = []
+_evicted_lock = threading.Lock()
+
+def _defer_delete(_key, entry: dict):
+    with _evicted_lock:
+        _evicted_files.append((entry["name"], time.time()))
+
+gemini_file_cache = LRUCache(
+    "gemini_files",
+    max_items=GEMINI_FILE_CACHE_MAX,
+    on_evict=_defer_delete,
+)
+
+def _cached_file_is_fresh(entry: dict) -> bool:
+    return (time.time() - entry["created"]) < GEMINI_FILE_CACHE_TTL
+
+def gc_gemini_file_cache() -> int:
+    """
+    Süresi (TTL + grace) dolan kayıtları cache'ten çıkarıp Files API'den siler;
+    cache'ten düşeli grace kadar süre geçmiş dosyaları da siler.
+    """
+    removed = 0
+    now = time.time()
+    with _evicted_lock:
+        due = [name for name, t in _evicted_files if now - t >= GEMINI_FILE_CACHE_GRACE]
+        _evicted_files[:] = [(name, t) for name, t in _evicted_files if now - t < GEMINI_FILE_CACHE_GRACE]
+    for name in due:
+        _delete_gemini_file(name)
+        removed += 1
+    for key, entry in gemini_file_cache.items():
+        if now - entry["created"] >= GEMINI_FILE_CACHE_TTL + GEMINI_FILE_CACHE_GRACE:
+            if gemini_file_cache.pop(key) is not None:
+                _delete_gemini_file(entry["name"])
+                removed += 1
+    return removed
+
+GEMINI_ATTACH_CONCURRENCY = int(os.getenv("GEMINI_ATTACH_CONCURRENCY", "4"))
+
+def upload_nowait(src, mime: str):
+    """ACTIVE beklemeden yükler; bekleme _aensure_all_active içinde toplu yapılır."""
+    return client.files.upload(file=_as_upload_file(src), config=dict(mime_type=mime))
+
+def _file_content(uri: str, mime: str) -> types.Content:
+    return types.Content(role="user", parts=[types.Part(file_data=types.FileData(file_uri=uri, mime_type=mime))])
+
+def _blob_attachment(filename: str, raw, cache_key=None) -> dict:
+    """
+    Thread'de çalışır. raw: bytes ya da dosya nesnesi (Excel/CSV için bytes beklenir).
+    Dönüş: {"contents": [...], "pending": [{"up", "mime", "cache_key"}]}
+    """
+    out = {"contents": [], "pending": []}
+    fn = (filename or "").lower()
+    if is_excel_filename(fn) or is_csv_filename(fn):
+        if hasattr(raw, "read"):
+            raw = raw.read()
+        _append_blob_as_part_or_excel_text(out["contents"], [], filename, raw)
+        return out
+    mime = normalize_mime(fn, mimetypes.guess_type(fn)[0])
+    up = upload_nowait(raw, mime)
+    out["contents"].append(_file_content(up.uri, mime))
+    out["pending"].append({"up": up, "mime": mime, "cache_key": cache_key})
+    return out
+
+def _s3_attachment(s3_key: str) -> dict:
+    """
+    Aynı (key, ETag) daha önce yüklendiyse indirme/yükleme yapılmaz;
+    ETag HEAD ile ucuzca doğrulanır.
+    """
+    filename = os.path.basename(s3_key)
+    if is_excel_filename(filename) or is_csv_filename(filename):
+        text = _spreadsheet_text_from_s3(s3_key, filename)
+        return {"contents": [_spreadsheet_content(filename, text)], "pending": []}
+
+    # Upload sırasında üretilen kanonik kopya (16 kHz mono WAV)
+    deriv = derivative_for(s3_key)
+    if deriv:
+        s3_key = deriv["key"]
+        filename = os.path.basename(s3_key)
+
+    etag = None
+    try:
+        etag = head_s3_object(s3_key)["etag"]
+    except Exception:
+        pass
+
+    key = (s3_key, etag)
+    entry = gemini_file_cache.get(key) if etag else None
+    if entry and _cached_file_is_fresh(entry):
+        return {"contents": [_file_content(entry["uri"], entry["mime"])], "pending": []}
+
+    # S3 gövdesi parça parça spool'lanır ve dosya olarak yüklenir; tam kopya bellekte tutulmaz
+    with open_s3_spooled(s3_key) as f:
+        return _blob_attachment(filename, f, cache_key=key if etag else None)
+
+async def _prepare_attachments(jobs: list, uploaded_for_cleanup: list) -> list:
+    """
+    jobs: [(fn, strict)]. Hepsi sınırlı paralellikle thread'lerde hazırlanır (S3 okuma +
+    yükleme), ardından tek bir poller tüm dosyaların ACTIVE olmasını bekler.
+    İlk token süresi toplam yerine en yavaş dosya kadar olur.
+    Dönüş: job sırasıyla Content listeleri. strict olmayan hatalı job -> [] (uyarı basılır).
+    """
+    if not jobs:
+        return []
+    sem = asyncio.Semaphore(GEMINI_ATTACH_CONCURRENCY)
+
+    async def _run(fn):
+        async with sem:
+            return await asyncio.to_thread(fn)
+
+    results = await asyncio.gather(*[_run(fn) for fn, _ in jobs], return_exceptions=True)
+    pending = [p for r in results if isinstance(r, dict) for p in r["pending"]]
+
+    out, first_err = [], None
+    for (_, strict), r in zip(jobs, results):
+        if isinstance(r, BaseException):
+            print("[WARN] Ek hazırlanamadı:", r)
+            if strict and first_err is None:
+                first_err = r
+            out.append([])
+        else:
+            out.append(r["contents"])
+    if first_err is not None:
+        await _adelete_files([p["up"] for p in pending])
+        raise first_err
+
+    active = await _aensure_all_active([p["up"] for p in pending])
+    for p in pending:
+        up = p["up"]
+        cur = gemini_file_cache.get(p["cache_key"]) if p["cache_key"] else None
+        if p["cache_key"] and up.name in active and not (cur and _cached_file_is_fresh(cur)):
+            # yerine yazılan bayat kayıt / LRU'dan düşen kayıt on_evict ile silme kuyruğuna alınır (GC siler)
+            entry = {"name": up.name, "uri": up.uri, "mime": p["mime"], "created": time.time()}
+            await asyncio.to_thread(gemini_file_cache.set, p["cache_key"], entry)
+        else:
+            # cache'lenmeyen (ya da eşzamanlı bir isteğin zaten cache'lediği) dosya yanıt sonunda silinir
+            uploaded_for_cleanup.append(up)
+    return out
+
+
 @router.post("/chat/stream")
 async def gemini_chat_stream(
     message: str = Form(...),
@@ -286,10 +464,16 @@ async def gemini_chat_stream(
       - Excel/CSV -> **CSV metni veya özet** olarak Part(text=...)
     """
     try:
-        built_contents: List[types.Content] = []
+        # Sıra korunur: metinler Content, ekler jobs içindeki index ile yer tutucu
+        slots: list = []
+        jobs: list = []
 
         def add_text(role: str, text: str):
-            built_contents.append(types.Content(role=role, parts=[types.Part(text=text or "")]))
+            slots.append(types.Content(role=role, parts=[types.Part(text=text or "")]))
+
+        def add_job(fn, strict: bool):
+            slots.append(len(jobs))
+            jobs.append((fn, strict))
 
         uploaded_for_cleanup = []
 
@@ -308,12 +492,7 @@ async def gemini_chat_stream(
                     if entry.get("files"):
                         for url in entry["files"]:
                             s3u = url["url"] if isinstance(url, dict) else url
-                            s3_key = s3_key_from_url(s3u)
-                            data = read_file_from_s3(s3_key)
-                            filename = os.path.basename(s3_key)
-                            _append_blob_as_part_or_excel_text(
-                                built_contents, uploaded_for_cleanup, filename, data
-                            )
+                            add_job(partial(_s3_attachment, s3_key_from_url(s3u)), strict=False)
             except Exception as e:
                 print("[WARN] History parse hatası:", e)
         else:
@@ -324,21 +503,26 @@ async def gemini_chat_stream(
             if isinstance(files, str):
                 files = [files]
             for url in files:
-                s3_key = s3_key_from_url(url)
-                data = read_file_from_s3(s3_key)
-                filename = os.path.basename(s3_key)
-                _append_blob_as_part_or_excel_text(
-                    built_contents, uploaded_for_cleanup, filename, data
-                )
+                add_job(partial(_s3_attachment, s3_key_from_url(url)), strict=True)
 
         # --- upload_files (multipart dosya) ---
         if upload_files:
             for uf in upload_files:
-                raw = await uf.read()
                 filename = (uf.filename or "").lower()
-                _append_blob_as_part_or_excel_text(
-                    built_contents, uploaded_for_cleanup, filename, raw
-                )
+                if is_excel_filename(filename) or is_csv_filename(filename):
+                    src = await uf.read()
+                else:
+                    src = uf.file  # zaten SpooledTemporaryFile; belleğe kopyalamadan yükle
+                add_job(partial(_blob_attachment, filename, src), strict=True)
+
+        # --- Ekleri paralel hazırla ---
+        prepared = await _prepare_attachments(jobs, uploaded_for_cleanup)
+        built_contents: List[types.Content] = []
+        for slot in slots:
+            if isinstance(slot, int):
+                built_contents.extend(prepared[slot])
+            else:
+                built_contents.append(slot)
 
         config = None
         if web_search:
@@ -346,27 +530,21 @@ async def gemini_chat_stream(
                 tools=[types.Tool(google_search=types.GoogleSearch())]
             )
 
-        def streaming_gen():
+        async def streaming_gen():
             try:
-                _ensure_all_active(uploaded_for_cleanup)
                 def _mk():
                     if config:
-                        return client.models.generate_content_stream(
+                        return client.aio.models.generate_content_stream(
                             model=MODEL, contents=built_contents, config=config
                         )
-                    return client.models.generate_content_stream(
+                    return client.aio.models.generate_content_stream(
                         model=MODEL, contents=built_contents
                     )
-                for piece in _stream_with_backoff(_mk, max_attempts=10, base_sleep=4.0):
+                async for piece in _astream_with_backoff(_mk, max_attempts=10, base_sleep=4.0):
                     if piece:
                         yield piece
             finally:
-                for up in uploaded_for_cleanup:
-                    try:
-                        if getattr(up, "name", None):
-                            client.files.delete(name=up.name)
-                    except Exception:
-                        pass
+                await _adelete_files(uploaded_for_cleanup)
 
         return StreamingResponse(streaming_gen(), media_type="text/plain")
 
@@ -375,6 +553,42 @@ async def gemini_chat_stream(
         raise HTTPException(500, detail=f"Gemini Streaming Hatası: {e}")
 
 
+def _audio_digest(f, mime: str) -> str:
+    """
+    16 kHz mono PCM16 WAV (türetilmiş kopya) için PCM çerçevelerinin, diğerleri için dosya
+    baytlarının SHA-256'sı. Dosya başa sarılmış bırakılır.
+    """
+    h = hashlib.sha256()
+    try:
+        if mime in WAV_TYPES:
+            wf = wave.open(f, "rb")
+            if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) == (16000, 1, 2):
+                for chunk in iter(lambda: wf.readframes(256 * 1024), b""):
+                    h.update(chunk)
+                return h.hexdigest()
+    except (wave.Error, EOFError):
+        pass
+    finally:
+        f.seek(0)
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        h.update(chunk)
+    f.seek(0)
+    return h.hexdigest()
+
+
+def _open_transcribe_sources(files: List[str], out: list) -> None:
+    """S3 URL'leri -> (spool dosyası, mime) out listesine (hata olursa açılanlar çağıranda kapatılır)."""
+    for url in files:
+        s3_key = s3_key_from_url(url)
+        deriv = derivative_for(s3_key)
+        if deriv:
+            s3_key = deriv["key"]  # hazır 16 kHz mono WAV
+        filename = os.path.basename(s3_key)
+        mime = normalize_mime(filename, mimetypes.guess_type(filename)[0])
+        out.append((open_s3_spooled(s3_key), mime))
+
+
 @router.post("/audio/transcribe")
 async def gemini_audio_transcribe(
     files: List[str] = Form(...),
@@ -385,16 +599,25 @@ async def gemini_audio_transcribe(
         raise HTTPException(401, "Authentication failed")
 
     try:
-        uploaded_objs = []
-        for url in files:
-            s3_key = s3_key_from_url(url)
-            data = read_file_from_s3(s3_key)
-            filename = os.path.basename(s3_key)
-            mime = normalize_mime(filename, mimetypes.guess_type(filename)[0])
-            up = upload_and_wait_active(data, mime)
-            uploaded_objs.append((up, mime))
-
         p = prompt.strip() if (prompt and prompt.strip()) else transcribe_prompt("tr")
+        sources = []
+        uploaded_objs = []
+        try:
+            # S3 indirme, özet, DB ve Gemini yüklemesi bloklayıcı: hepsi thread'de
+            await asyncio.to_thread(_open_transcribe_sources, files, sources)
+
+            digests = await asyncio.to_thread(lambda: [_audio_digest(f, mime) for f, mime in sources])
+            audio_hash = digests[0] if len(digests) == 1 else hashlib.sha256("|".join(digests).encode()).hexdigest()
+            key = transcript_key(audio_hash, p, MODEL)
+            cached = await asyncio.to_thread(transcript_lookup, key)
+            if cached is not None:
+                return StreamingResponse(iter([cached]), media_type="text/plain")
+
+            for f, mime in sources:
+                uploaded_objs.append((await asyncio.to_thread(upload_and_wait_active, f, mime), mime))
+        finally:
+            for f, _ in sources:
+                f.close()
 
         def streaming_gen():
             try:
@@ -407,13 +630,23 @@ async def gemini_audio_transcribe(
                 def _mk():
                     return client.models.generate_content_stream(model=MODEL, contents=contents)
 
+                produced, failed = [], False
+                norm = TranscriptStream()  # parça sınırında bölünen kelime/etiketler bozulmasın
                 for piece in _stream_with_backoff(_mk, max_attempts=10, base_sleep=4.0):
                     if piece.strip().startswith("[ERROR"):
+                        failed = True
                         yield piece
                     else:
-                        cleaned = postprocess_transcript(piece)
+                        cleaned = norm.feed(piece)
                         if cleaned:
+                            produced.append(cleaned)
                             yield cleaned
+                cleaned = norm.flush()
+                if cleaned:
+                    produced.append(cleaned)
+                    yield cleaned
+                if produced and not failed:
+                    transcript_store(key, MODEL, "".join(produced))
             finally:
                 for up, _ in uploaded_objs:
                     try:
@@ -428,79 +661,125 @@ async def gemini_audio_transcribe(
         raise HTTPException(500, detail=f"Gemini audio transcribe error: {e}")
 
 
-def pcm16_from_wav(wav_bytes: bytes):
-    buf = io.BytesIO(wav_bytes)
-    with wave.open(buf, 'rb') as wf:
-        n_channels = wf.getnchannels()
-        sampwidth = wf.getsampwidth()
-        framerate = wf.getframerate()
-        n_frames = wf.getnframes()
-        raw = wf.readframes(n_frames)
-    if sampwidth != 2:
-        raw = audioop.lin2lin(raw, sampwidth, 2)
-    if n_channels == 2:
-        raw = audioop.tomono(raw, 2, 0.5, 0.5)
-    return raw, framerate
-
-
-def wav_from_pcm16(pcm_bytes: bytes, sr: int = 16000) -> bytes:
-    out = io.BytesIO()
-    with wave.open(out, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(sr)
-        wf.writeframes(pcm_bytes)
-    return out.getvalue()
-
-
-class _Frame:
-    __slots__ = ("bytes", "timestamp", "duration")
-    def __init__(self, b, ts, dur):
-        self.bytes = b
-        self.timestamp = ts
-        self.duration = dur
-
-
-def _frame_generator(frame_ms: int, audio: bytes, sample_rate: int):
-    n = int(sample_rate * (frame_ms / 1000.0) * 2)
-    offset = 0; ts = 0.0
-    dur = (float(n) / (2 * sample_rate))
-    L = len(audio)
-    while offset + n <= L:
-        yield _Frame(audio[offset:offset + n], ts, dur)
-        ts += dur; offset += n
-
-
-def vad_segments(
-    pcm16: bytes,
-    sample_rate: int = 16000,
-    frame_ms: int = 20,
-    aggressiveness: int = 2,
-    max_silence_ms: int = 900,
-    min_segment_ms: int = 1200
-):
-    import webrtcvad
-    vad = webrtcvad.Vad(aggressiveness)
-    frames = list(_frame_generator(frame_ms, pcm16, sample_rate))
-    cur = bytearray(); voiced = []; silence_run = 0
-    min_frames = int(min_segment_ms / frame_ms)
-    max_silence_frames = int(max_silence_ms / frame_ms)
-    need_bytes = int(min_frames * (sample_rate * (frame_ms / 1000.0) * 2))
-    for fr in frames:
-        if vad.is_speech(fr.bytes, sample_rate):
-            cur += fr.bytes; silence_run = 0
-        else:
-            if len(cur) > 0:
-                silence_run += 1
-                if silence_run <= max_silence_frames:
-                    cur += fr.bytes
-                else:
-                    if len(cur) >= need_bytes:
-                        voiced.append(bytes(cur))
-                    cur = bytearray(); silence_run = 0
-    if len(cur) > 0 and len(cur) >= need_bytes:
-        voiced.append(bytes(cur))
-    return voiced
+# transcribe-direct: aynı anda işlenen segment sayısı ve segment başına ek deneme
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+TRANSCRIBE_SEGMENT_RETRIES = int(os.getenv("TRANSCRIBE_SEGMENT_RETRIES", "2"))
+
+_SEGMENT_DONE = object()
+
+async def _transcribe_segment(idx: int, pack: list, prompt: str,
+                              out: asyncio.Queue, sem: asyncio.Semaphore, failed: list):
+    """
+    Tek çağrı (pack; (start, end, pcm) listesi): segmentler sessizlikle birleştirilir -> WAV -> yükle -> ACTIVE -> akış.
+    Parçalar geldikçe TranscriptStream'den geçirilip out kuyruğuna yazılır, bitince _SEGMENT_DONE konur. TRANSCRIBE_PACK_MAP
+    açıksa metin tamponlanır ve "[k]" etiketlerine göre segment başına satırlara bölünür.
+    Henüz metin gönderilmediyse çağrı TRANSCRIBE_SEGMENT_RETRIES kez daha denenir.
+    Aynı PCM + prompt için önceki başarılı sonuç transcript cache'ten döner (model çağrılmaz).
+    Gemini çağrıları paylaşılan _arl_gate'ten geçer.
+    """
+    up = None
+    spans = [(start, end) for start, end, _ in pack]
+    mapped = TRANSCRIBE_PACK_MAP and len(spans) > 1
+    try:
+        pcm = join_pcm([seg for _, _, seg in pack])
+        audio_s = len(pcm) / (2 * 16000)
+        call_prompt = pack_prompt(prompt, pack_layout(spans)) if mapped else prompt
+        key = transcript_key(audio_sha256(pcm), call_prompt, MODEL)
+        cached = await asyncio.to_thread(transcript_lookup, key)
+        if cached is not None:
+            await out.put(cached)
+            return
+        produced = []
+
+        async def _emit(text: str):
+            produced.append(text)
+            await out.put(text)
+
+        async with sem:
+            wav_bytes = wav_from_pcm16(pcm, sr=16000)
+            del pcm
+            emitted = False
+            t0 = time.perf_counter()
+            attempt = 0
+            try:
+                for attempt in range(1, TRANSCRIBE_SEGMENT_RETRIES + 2):
+                    try:
+                        if up is None:
+                            up = await asyncio.to_thread(upload_nowait, wav_bytes, "audio/wav")
+                            if up.name not in await _aensure_all_active([up], timeout_s=45.0):
+                                raise RuntimeError("file not ACTIVE")
+                        contents = [types.Content(
+                            role="user",
+                            parts=[types.Part(text=call_prompt),
+                                   types.Part(file_data=types.FileData(file_uri=up.uri, mime_type="audio/wav"))]
+                        )]
+
+                        def _mk():
+                            return client.aio.models.generate_content_stream(model=MODEL, contents=contents)
+
+                        error = None
+                        buffered = []
+                        norm = TranscriptStream()
+                        async for piece in _astream_with_backoff(_mk, max_attempts=10, base_sleep=4.0):
+                            if piece.strip().startswith("[ERROR"):
+                                error = piece.strip()
+                                break
+                            if mapped:
+                                buffered.append(piece)
+                                continue
+                            cleaned = norm.feed(piece)
+                            if cleaned:
+                                emitted = True
+                                await _emit(cleaned)
+                        if error:
+                            raise RuntimeError(error)
+                        if not mapped:
+                            cleaned = norm.flush()
+                            if cleaned:
+                                emitted = True
+                                await _emit(cleaned)
+                        if mapped:
+                            texts, _ = split_pack_text("".join(buffered), len(spans))
+                            for t in texts:
+                                cleaned = postprocess_transcript(t)
+                                if cleaned:
+                                    emitted = True
+                                    await _emit(cleaned + "\n")
+                        elif emitted:
+                            await _emit("\n")
+                        if emitted:
+                            await asyncio.to_thread(transcript_store, key, MODEL, "".join(produced))
+                        else:
+                            count_dropped("empty", source="direct")
+                        return
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        if emitted or attempt > TRANSCRIBE_SEGMENT_RETRIES:
+                            failed.append(idx)
+                            await out.put(f"\n[ERROR segment {idx}]: {e}\n")
+                            return
+                        print(f"[TRANSCRIBE-DIRECT] segment {idx} retry {attempt}/{TRANSCRIBE_SEGMENT_RETRIES}: {e}")
+                        if up is not None and "ACTIVE" in str(e):
+                            await _adelete_files([up])  # yeniden yüklensin
+                            up = None
+                        await asyncio.sleep(min(2.0 * attempt, 10.0))
+            finally:
+                if attempt:
+                    record_call("direct", audio_s, time.perf_counter() - t0, segments=len(spans), attempts=attempt)
+    finally:
+        if up is not None:
+            await _adelete_files([up])
+        out.put_nowait(_SEGMENT_DONE)
+
+
+def _spool_upload(src) -> tempfile.SpooledTemporaryFile:
+    """UploadFile yanıt akarken kapatılır; çözücü kendi kopyasından okur (büyükse diskte)."""
+    dst = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    src.seek(0)
+    shutil.copyfileobj(src, dst, 1024 * 1024)
+    dst.seek(0)
+    return dst
 
 
 @router.post("/audio/transcribe-direct")
@@ -512,61 +791,133 @@ async def gemini_audio_transcribe_direct(
     if not me or not me.get("id"):
         raise HTTPException(401, "Authentication failed")
 
-    raw = await file.read()
-    filename = (file.filename or "").lower()
-    ctype = (file.content_type or "").lower()
-    if ("wav" not in filename) and (not ctype.startswith("audio/wav")):
-        raise HTTPException(400, "Please send WAV (mono/16-bit).")
+    head = await file.read(SNIFF_BYTES)
+    mime = detect_mime(head, file.filename or "", file.content_type)
+    if mime not in WAV_TYPES and mime not in COMPRESSED_AUDIO_TYPES:
+        raise HTTPException(400, f"Unsupported audio type: {mime}")
+    if mime in COMPRESSED_AUDIO_TYPES and not ffmpeg_available():
+        raise HTTPException(400, "Please send WAV; compressed audio decoding (ffmpeg) is not available.")
 
+    src = await asyncio.to_thread(_spool_upload, file.file)
     try:
-        pcm16, in_sr = pcm16_from_wav(raw)
+        if mime in WAV_TYPES:
+            chunks = await asyncio.to_thread(iter_wav_pcm16, src)  # başlık burada doğrulanır
+        else:
+            chunks = iter_ffmpeg_pcm16(src, mime)
     except Exception as e:
-        raise HTTPException(400, f"WAV parse error: {e}")
-
-    if in_sr != 16000:
-        pcm16 = audioop.ratecv(pcm16, 2, 1, in_sr, 16000, None)[0]
-        in_sr = 16000
-
-    segments = vad_segments(pcm16, sample_rate=in_sr, frame_ms=20, aggressiveness=2,
-                            max_silence_ms=900, min_segment_ms=1200)
+        src.close()
+        raise HTTPException(400, f"WAV parse error: {e}" if mime in WAV_TYPES else f"audio decode error: {e}")
 
     p = prompt.strip() if (prompt and prompt.strip()) else transcribe_prompt("tr")
 
-    def streaming_gen():
-        parts = segments if segments else [pcm16]
-        for i, seg in enumerate(parts, start=1):
-            wav_bytes = wav_from_pcm16(seg, sr=in_sr)
-            up = None
+    async def streaming_gen():
+        """
+        Çözme + VAD ayrı thread'de parça parça ilerler; kapanan segmentler PackBuilder ile
+        TRANSCRIBE_PACK_TARGET_MS'e kadar birleştirilip hemen transkripsiyona gönderilir (kayıt
+        bitmeden ilk çağrı başlar). Pack'ler TRANSCRIBE_CONCURRENCY kadar paralel işlenir; çıktı
+        sırayla akar. Bekleyen pack sayısı sınırlıdır, çözme gerekirse yavaşlar.
+        """
+        t0 = time.perf_counter()
+        sem = asyncio.Semaphore(max(1, TRANSCRIBE_CONCURRENCY))
+        order: asyncio.Queue = asyncio.Queue()  # pack kuyrukları, çıktı sırasıyla; None = son
+        tasks: list = []
+        failed: list = []
+        seg_stream = SegmentStream(sample_rate=16000, frame_ms=20, aggressiveness=2,
+                                   max_silence_ms=900, min_segment_ms=1200)
+        builder = PackBuilder()
+        stats = {"segments": 0, "first_call_s": None}
+        fallback = bytearray()  # hiç segment bulunmazsa tüm ses tek parça gönderilir (eski davranış)
+
+        def _step():
+            pcm = next(chunks, None)
+            if pcm is None:
+                return None
+            segs = seg_stream.feed(pcm)
+            if not stats["segments"] and not segs:
+                fallback.extend(pcm)
+            return segs
+
+        async def _launch(pack):
+            max_pending = 2 * max(1, TRANSCRIBE_CONCURRENCY)
+            while sum(not t.done() for t in tasks) >= max_pending:
+                await asyncio.wait([t for t in tasks if not t.done()], return_when=asyncio.FIRST_COMPLETED)
+            if stats["first_call_s"] is None:
+                stats["first_call_s"] = time.perf_counter() - t0
+            q = asyncio.Queue()
+            tasks.append(asyncio.create_task(_transcribe_segment(len(tasks) + 1, pack, p, q, sem, failed)))
+            order.put_nowait(q)
+
+        async def _add(segs):
+            for seg in segs:
+                stats["segments"] += 1
+                fallback.clear()
+                done = builder.add(seg)
+                if done:
+                    await _launch(done)
+
+        async def produce():
+            pending = None
             try:
-                up = upload_and_wait_active(wav_bytes, "audio/wav")
-                _ensure_all_active([up])
-                contents = [types.Content(
-                    role="user",
-                    parts=[types.Part(text=p),
-                           types.Part(file_data=types.FileData(file_uri=up.uri, mime_type="audio/wav"))]
-                )]
-
-                def _mk():
-                    return client.models.generate_content_stream(model=MODEL, contents=contents)
-
-                emitted = False
-                for piece in _stream_with_backoff(_mk, max_attempts=10, base_sleep=4.0):
-                    if piece.strip().startswith("[ERROR"):
-                        yield piece
-                    else:
-                        cleaned = postprocess_transcript(piece)
-                        if cleaned:
-                            emitted = True
-                            yield cleaned
-                if emitted:
-                    yield "\n"
+                while True:
+                    pending = asyncio.ensure_future(asyncio.to_thread(_step))
+                    segs = await asyncio.shield(pending)
+                    pending = None
+                    if segs is None:
+                        break
+                    await _add(segs)
+                await _add(seg_stream.finish())
+                if not stats["segments"] and fallback:
+                    await _launch([(0, len(fallback), bytes(fallback))])
+                done = builder.flush()
+                if done:
+                    await _launch(done)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                yield f"\n[ERROR segment {i}]: {e}\n"
+                print(f"[TRANSCRIBE-DIRECT] decode error: {e}")
+                q = asyncio.Queue()
+                q.put_nowait(f"\n[ERROR decode]: {e}\n")
+                q.put_nowait(_SEGMENT_DONE)
+                order.put_nowait(q)
             finally:
-                try:
-                    if up and getattr(up, "name", None):
-                        client.files.delete(name=up.name)
-                except Exception:
-                    pass
+                order.put_nowait(None)
+                with anyio.CancelScope(shield=True):
+                    if pending is not None:
+                        await asyncio.wait([pending])  # çalışan next() bitmeden generator kapatılamaz
+                    await asyncio.to_thread(chunks.close)
+                    src.close()
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                q = await order.get()
+                if q is None:
+                    break
+                while True:
+                    piece = await q.get()
+                    if piece is _SEGMENT_DONE:
+                        break
+                    yield piece
+        finally:
+            producer.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.gather(producer, return_exceptions=True)
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            wall = time.perf_counter() - t0
+            audio_s = seg_stream.total_bytes / (2 * 16000)
+            first = f"{stats['first_call_s']:.1f}s" if stats["first_call_s"] is not None else "-"
+            print(
+                f"[TRANSCRIBE-DIRECT] {mime} segments={stats['segments']} calls={len(tasks)} "
+                f"concurrency={TRANSCRIBE_CONCURRENCY} failed={len(failed)} audio={audio_s:.1f}s "
+                f"first_call={first} wall={wall:.1f}s"
+            )
+            metrics.incr("transcribe_direct_requests")
+            metrics.incr("transcribe_direct_segments", stats["segments"])
+            metrics.incr("transcribe_direct_failed_segments", len(failed))
+            metrics.incr("transcribe_direct_wall_seconds", wall)
+            if stats["first_call_s"] is not None:
+                metrics.incr("transcribe_direct_first_call_seconds", stats["first_call_s"])
 
     return StreamingResponse(streaming_gen(), media_type="text/plain")
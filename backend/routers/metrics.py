@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Depends, HTTPException
+from backend.routers.auth import get_current_user_from_cookie
+from backend.utils.metrics import snapshot
+from backend.utils.packing import transcribe_rates
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+@router.get("/")
+def get_metrics(user: dict = Depends(get_current_user_from_cookie)):
+    if not user or not user.get("id"):
+        raise HTTPException(status_code=401, detail="Authentication failed")
+    data = snapshot()
+    data["transcribe"] = transcribe_rates()
+    return data
@@ -1,4 +1,4 @@
-import re
+from backend.utils.transcript_filter import normalize_transcript
 
 PROMPT_TRANSCRIBE_TR = (
     "Sen bir konuşma-metne dönüştürücüsün.\n"
@@ -29,55 +29,8 @@ PROMPT_TRANSCRIBE_EN = (
 def transcribe_prompt(lang: str | None = "tr") -> str:
     return PROMPT_TRANSCRIBE_TR if (lang or "tr").lower().startswith("tr") else PROMPT_TRANSCRIBE_EN
 
-_TAGS = re.compile(r"\[[^\]]+\]")
-
-def postprocess_transcript(text: str | None) -> str:
-    s = text or ""
-
-    # 1) köşeli etiketleri temizle
-    s = _TAGS.sub(" ", s)
-
-    # 2) ek temizlik (YENİ) — fonksiyon içi, yeni global yok
-    code_fences = re.compile(r"^```.*?$|```$", re.MULTILINE)
-    bullets = re.compile(r"^\s*(?:[-*•]\s+)", re.MULTILINE)
-    role_label = re.compile(r"^\s*(?:speaker\s*\d+|user|assistant|agent|model)\s*:\s*", re.IGNORECASE | re.MULTILINE)
-    commenty_lines = re.compile(
-        r"""
-        ^\s*(?:the\s+)?audio\b.*$|
-        ^\s*no\s+(?:\w+\s+)*speech.*$|
-        ^\s*background\s+noise.*$|
-        ^\s*only\s+noise.*$|
-        ^\s*(?:typing|beep|ringing|music)\b.*$
-        """,
-        re.IGNORECASE | re.MULTILINE | re.VERBOSE,
-    )
-    noise_phrases = re.compile(
-        r"""
-        \b(
-           no\s+(?:clear|discernible)?\s*speech(?:\s+detected)?|
-           background\s+noise|
-           (?:the\s+)?audio(?:\s+primarily)?\s+contains(?:\s+only)?\s+(?:noise|sounds?)|
-           typing\s+sounds?|
-           beep(?:ing)?|
-           high[-\s]?pitched\s+(?:tone|ringing|beep)|
-           sound(?:s)?\s+of\s+(?:a\s)?(?:machine|device|vehicle|vehicles)|
-           music\s+only
-        )\b
-        """,
-        re.IGNORECASE | re.VERBOSE,
-    )
-
-    s = code_fences.sub(" ", s)
-    s = bullets.sub("", s)
-    s = role_label.sub("", s)
-    s = commenty_lines.sub("", s)
-    s = noise_phrases.sub(" ", s)
-
-    s = " ".join(s.split()).strip()
-
-    if not s or all(ch in "-–—•.,;:!?()[]{}" for ch in s):
-        return ""
-    return s
+# Tek geçişlik, derlenmiş normalizasyon (eski adıyla dışa açık)
+postprocess_transcript = normalize_transcript
 
 def _mk_summary_prompt_tr(participants: list[str], when_str: str) -> str:
     plist = ", ".join([p for p in participants if p])
@@ -85,6 +38,7 @@ def _mk_summary_prompt_tr(participants: list[str], when_str: str) -> str:
         "Aşağıda bir görüşmenin transkripti var. Sadece metindeki bilgilere dayan.\n"
         "Çıktı formatı: Markdown. Kısa ve profesyonel yaz (toplam 150–250 kelime).\n"
         f"Meta:\n- Katılımcılar: {plist}\n- Tarih/Saat: {when_str}\n\n"
+        "Transkript satırları \"[dk:sn] Konuşmacı (rol): metin\" biçimindedir; konuşmacılar kesindir.\n\n"
         "Aşağıdaki başlıklarla yaz:\n"
         "## Katılımcılar\n"
         "## Görüşmenin Başlığı (tek cümle)\n"
@@ -102,6 +56,7 @@ def _mk_summary_prompt_en(participants: list[str], when_str: str) -> str:
         "Below is a call transcript. Rely ONLY on the text.\n"
         "Output format: Markdown. Keep it concise and professional (150–250 words total).\n"
         f"Meta:\n- Participants: {plist}\n- Date/Time: {when_str}\n\n"
+        "Transcript lines are formatted as \"[mm:ss] Speaker (role): text\"; speaker labels are reliable.\n\n"
         "Use these headings:\n"
         "## Participants\n"
         "## Meeting Title (one sentence)\n"
@@ -13,8 +13,9 @@ from urllib.parse import quote
 from backend.database import get_db
 from backend.models import SessionLog, Users
 from backend.routers.auth import get_current_user_from_cookie
-from backend.utils.security import encrypt_message, decrypt_message
+from backend.utils.security import encrypt_message, decrypt_message, decrypt_message_cached, decrypt_many
 from backend.routers.prompts import summary_prompt
+from backend.utils.diarize import transcript_lines, transcript_text
 
 from google import genai
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
@@ -104,7 +105,8 @@ def _register_unicode_font() -> str:
 def _escape_xml(s: str) -> str:
     return (s or "").replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
-def summary_text_to_pdf_bytes(title: str, subtitle_lines: List[str], body_text: str) -> bytes:
+def summary_text_to_pdf_bytes(title: str, subtitle_lines: List[str], body_text: str,
+                              transcript_title: str = "", transcript: Optional[List[str]] = None) -> bytes:
     font_name = _register_unicode_font()
     buf = io.BytesIO()
     doc = SimpleDocTemplate(
@@ -123,6 +125,12 @@ def summary_text_to_pdf_bytes(title: str, subtitle_lines: List[str], body_text:
     story.append(Spacer(1, 6))
     for part in (body_text or "").split("\n"):
         story.append(Spacer(1, 4) if part.strip()=="" else Paragraph(_escape_xml(part), styles["Body"]))
+    if transcript:
+        styles.add(ParagraphStyle(name="Section", parent=styles["Heading2"], fontName=font_name, spaceBefore=12))
+        styles.add(ParagraphStyle(name="Line", parent=styles["Normal"], fontName=font_name, fontSize=10, leading=13, spaceAfter=3))
+        story.append(Paragraph(_escape_xml(transcript_title), styles["Section"]))
+        for line in transcript:
+            story.append(Paragraph(_escape_xml(line), styles["Line"]))
     doc.build(story)
     return buf.getvalue()
 
@@ -224,7 +232,7 @@ def get_session_log(
         user1_name=_display_name(u1),
         user2_name=_display_name(u2),
         session_time_stamp=as_tr(row.session_time_stamp),
-        transcript=decrypt_message(row.transcript),
+        transcript=decrypt_message_cached(row.transcript, ("sessionlog", row.id)),
         created_at=as_tr(row.created_at),
         updated_at=as_tr(row.updated_at),
     )
@@ -256,6 +264,14 @@ def list_session_logs(
     users = db.query(Users).filter(Users.id.in_(user_ids or [0])).all()
     umap = {u.id: _display_name(u) for u in users}
 
+    transcripts, errors = decrypt_many(
+        [r.transcript for r in rows],
+        cache_keys=[("sessionlog", r.id) for r in rows],
+        fallback=[],
+    )
+    if errors:
+        print(f"[SESSIONLOG][DECRYPT] {len(errors)} kayıt çözülemedi: {[rows[i].id for i in errors]}")
+
     return [
         SessionLogOut(
             id=r.id,
@@ -264,10 +280,10 @@ def list_session_logs(
             user1_name=umap.get(r.user1_id),
             user2_name=umap.get(r.user2_id),
             session_time_stamp=as_tr(r.session_time_stamp),  # TR
-            transcript=decrypt_message(r.transcript),
+            transcript=tr,
             created_at=as_tr(r.created_at),                  # TR
             updated_at=as_tr(r.updated_at),                  # TR
-        ) for r in rows
+        ) for r, tr in zip(rows, transcripts)
     ]
 
 @router.delete("/{log_id}", status_code=204)
@@ -314,11 +330,9 @@ def summarize_session_log(
     ]
     when_str = as_tr(row.session_time_stamp).strftime("%d/%m/%Y %H:%M")  # TR
 
-    parts = decrypt_message(row.transcript)
-    text = "\n".join(
-        p["text"] if isinstance(p, dict) and "text" in p else str(p)
-        for p in (parts or [])
-    )[:200_000]
+    parts = decrypt_message_cached(row.transcript, ("sessionlog", row.id))
+    # konuşmacı etiketleri kayıttaki kanal bilgisinden gelir (ek model çağrısı yok)
+    text = transcript_text(parts, {row.user1_id: participants[0], row.user2_id: participants[1]})[:200_000]
 
     prompt = summary_prompt(lang, participants, when_str)
     try:
@@ -337,6 +351,7 @@ def summary_pdf(
     log_id: int,
     lang: str = "tr",
     force: bool = False,
+    with_transcript: bool = True,
     db: Session = Depends(get_db),
     me: dict = Depends(get_current_user_from_cookie),
 ):
@@ -348,20 +363,18 @@ def summary_pdf(
 
     summary_text = _summary_to_plain(row.summary, db, row) if row.summary else ""
 
+    u1 = db.query(Users).filter(Users.id == row.user1_id).first()
+    u2 = db.query(Users).filter(Users.id == row.user2_id).first()
+    participants = [
+        _display_name(u1) or f"#{row.user1_id}",
+        _display_name(u2) or f"#{row.user2_id}",
+    ]
+    names = {row.user1_id: participants[0], row.user2_id: participants[1]}
+    parts = decrypt_message_cached(row.transcript, ("sessionlog", row.id))
+
     if not summary_text or force:
-        u1 = db.query(Users).filter(Users.id == row.user1_id).first()
-        u2 = db.query(Users).filter(Users.id == row.user2_id).first()
-        participants = [
-            _display_name(u1) or f"#{row.user1_id}",
-            _display_name(u2) or f"#{row.user2_id}",
-        ]
         when_str = as_tr(row.session_time_stamp).strftime("%d/%m/%Y %H:%M")  # TR
-
-        parts = decrypt_message(row.transcript)
-        text = "\n".join(
-            p["text"] if isinstance(p, dict) and "text" in p else str(p)
-            for p in (parts or [])
-        )[:200_000]
+        text = transcript_text(parts, names)[:200_000]
 
         prompt = summary_prompt(lang, participants, when_str)
         try:
@@ -378,7 +391,11 @@ def summary_pdf(
         f"Log ID: {row.id}",
         f"Tarih: {as_tr(row.session_time_stamp).strftime('%d/%m/%Y %H:%M')}"
     ]
-    pdf_bytes = summary_text_to_pdf_bytes(title, subtitle, summary_text)
+    pdf_bytes = summary_text_to_pdf_bytes(
+        title, subtitle, summary_text,
+        transcript_title="Transkript" if lang == "tr" else "Transcript",
+        transcript=transcript_lines(parts, names) if with_transcript else None,
+    )
 
     filename_utf8 = f"{title} {row.id}.pdf"
     headers = {"Content-Disposition": content_disposition(filename_utf8)}
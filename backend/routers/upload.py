@@ -1,15 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from backend.utils.aws_s3 import upload_file_to_s3
+from fastapi import APIRouter, HTTPException, Depends, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from backend.utils.aws_s3 import (
+    S3_UPLOAD_PART_SIZE, S3_UPLOAD_CONCURRENCY, s3_object_url, put_s3_object,
+    create_multipart_upload, upload_s3_part, complete_multipart_upload, abort_multipart_upload,
+)
 from backend.routers.auth import get_current_user_from_cookie
+from backend.utils.media import SNIFF_BYTES, detect_mime, register_asset
 from datetime import datetime
-import mimetypes
+import asyncio
 import uuid
-import os
 
-router = APIRouter(prefix="/upload", tags=["upload"])
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import MultipartParseError
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import MultipartParseError
 
-# Bazı ortamlar için m4a tanımı
-mimetypes.add_type("audio/mp4", ".m4a")
+router = APIRouter(prefix="/upload", tags=["upload"])
 
 DOC_IMG_TYPES = {
     "application/pdf",
@@ -36,53 +45,218 @@ ALLOWED_TYPES = {t.lower() for t in (DOC_IMG_TYPES | AUDIO_TYPES)}
 
 MAX_FILE_SIZE_MB = 20
 MAX_FILE_SIZE = MAX_FILE_SIZE_MB * 1024 * 1024
+# multipart sınırları/part başlıkları için Content-Length'e tanınan pay
+FORM_OVERHEAD = 64 * 1024
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Dosya max {MAX_FILE_SIZE_MB} MB olabilir.")
+
+def _begin_upload(user_id: int, filename: str, declared: str | None, head: bytes) -> "_S3StreamUpload":
+    """Tip, beyan edilen Content-Type yerine dosyanın ilk byte'larından belirlenir."""
+    ct = detect_mime(head, filename, declared)
+    if ct not in ALLOWED_TYPES:
+        raise HTTPException(status_code=400, detail=f"Desteklenmeyen dosya tipi: {ct}")
+
+    # Basit bir isimlendirme
+    safe_name = (filename or "file").replace("/", "_").replace("\\", "_")
+    key = f"user_{user_id}/{datetime.utcnow():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}_{safe_name}"
+    return _S3StreamUpload(key, ct)
+
+class _S3StreamUpload:
+    """
+    Gelen byte'ları S3_UPLOAD_PART_SIZE'lık parçalara böler ve multipart upload ile
+    threadpool'da, en fazla S3_UPLOAD_CONCURRENCY parça aynı anda olacak şekilde yükler.
+    Tek parçaya sığan dosyalar tek put_object ile gider. Bellekte en fazla
+    (eşzamanlılık + 1) parça tutulur; slot yoksa okuma bekler (backpressure).
+    """
+
+    def __init__(self, key: str, content_type: str):
+        self.key = key
+        self.content_type = content_type
+        self.size = 0
+        self._buf = bytearray()
+        self._upload_id = None
+        self._tasks = []
+        self._slots = asyncio.Semaphore(S3_UPLOAD_CONCURRENCY)
+
+    async def feed(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > MAX_FILE_SIZE:
+            raise _too_large()
+        self._buf += data
+        while len(self._buf) >= S3_UPLOAD_PART_SIZE:
+            part = bytes(self._buf[:S3_UPLOAD_PART_SIZE])
+            del self._buf[:S3_UPLOAD_PART_SIZE]
+            await self._submit(part)
+
+    async def _submit(self, part: bytes) -> None:
+        for t in self._tasks:
+            if t.done() and t.exception():
+                raise t.exception()
+        if self._upload_id is None:
+            self._upload_id = await run_in_threadpool(create_multipart_upload, self.key, self.content_type)
+        await self._slots.acquire()
+        self._tasks.append(asyncio.create_task(self._upload_part(len(self._tasks) + 1, part)))
+
+    async def _upload_part(self, part_number: int, part: bytes) -> dict:
+        try:
+            return await run_in_threadpool(upload_s3_part, self.key, self._upload_id, part_number, part)
+        finally:
+            self._slots.release()
+
+    async def finish(self) -> str:
+        if self._upload_id is None:
+            await run_in_threadpool(put_s3_object, self.key, bytes(self._buf), self.content_type)
+        else:
+            if self._buf:
+                await self._submit(bytes(self._buf))
+            parts = await asyncio.gather(*self._tasks)
+            await run_in_threadpool(complete_multipart_upload, self.key, self._upload_id, list(parts))
+        self._buf = bytearray()
+        return s3_object_url(self.key)
+
+    async def abort(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._upload_id is not None:
+            await run_in_threadpool(abort_multipart_upload, self.key, self._upload_id)
 
-EXT_TO_MIME = {
-    ".mp3": "audio/mpeg",
-    ".wav": "audio/wav",
-    ".m4a": "audio/mp4",
-    ".aac": "audio/aac",
-    ".ogg": "audio/ogg",
-    ".webm": "audio/webm",
-    ".flac": "audio/flac",
-    ".aiff": "audio/aiff",
-    ".aif": "audio/aiff",
+_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
 }
 
-@router.post("/file")
+@router.post("/file", openapi_extra=_UPLOAD_OPENAPI)
 async def upload_file(
-    file: UploadFile = File(...),
+    request: Request,
     user: dict = Depends(get_current_user_from_cookie),
 ):
+    """
+    multipart/form-data gövdesini (file alanı) belleğe almadan okur; boyut limiti
+    byte'lar geldikçe uygulanır ve dosya aynı anda S3'e multipart olarak aktarılır.
+    """
     if not user or not user.get("id"):
         raise HTTPException(status_code=401, detail="Authentication failed")
 
-    # Content-Type normalize
-    guessed = mimetypes.guess_type(file.filename or "")[0]
-    ct_in = file.content_type or guessed or "application/octet-stream"
-    ct = (ct_in.split(";", 1)[0].strip().lower() or "application/octet-stream")
+    # Gövde okunmadan erken red
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        declared = 0
+    if declared > MAX_FILE_SIZE + FORM_OVERHEAD:
+        raise _too_large()
 
-    # Octet-stream ise uzantıdan tahmin et
-    if ct == "application/octet-stream":
-        _, ext = os.path.splitext((file.filename or "").lower())
-        if ext in EXT_TO_MIME:
-            ct = EXT_TO_MIME[ext]
+    form_ct, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if form_ct != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="multipart/form-data bekleniyor")
 
-    if ct not in ALLOWED_TYPES:
-        raise HTTPException(status_code=400, detail=f"Desteklenmeyen dosya tipi: {ct}")
+    # Parser callback'leri sync; olayları biriktirip her chunk sonrası async işliyoruz
+    events = []
+    hdr = {"field": b"", "value": b"", "headers": {}}
 
-    contents = await file.read()
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail=f"Dosya max {MAX_FILE_SIZE_MB} MB olabilir.")
-    file.file.seek(0)
+    def on_header_field(data, start, end):
+        hdr["field"] += data[start:end]
 
-    # Basit bir isimlendirme
-    safe_name = (file.filename or "file").replace("/", "_").replace("\\", "_")
-    filename = f"user_{user['id']}/{datetime.utcnow():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}_{safe_name}"
+    def on_header_value(data, start, end):
+        hdr["value"] += data[start:end]
+
+    def on_header_end():
+        hdr["headers"][hdr["field"].lower()] = hdr["value"]
+        hdr["field"], hdr["value"] = b"", b""
+
+    def on_headers_finished():
+        events.append(("headers", hdr["headers"]))
+        hdr["headers"] = {}
+
+    def on_part_data(data, start, end):
+        events.append(("data", data[start:end]))
 
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    upload = None
+    part = None  # (filename, beyan edilen tip); ilk byte'lar gelene kadar bekler
+    head = bytearray()
+    receiving = False
+    done = False
     try:
-        url = upload_file_to_s3(file.file, filename, ct)
-        return {"url": url, "content_type": ct}
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, payload in events:
+                if kind == "headers":
+                    _, disp = parse_options_header(payload.get(b"content-disposition", b""))
+                    receiving = (
+                        upload is None and not done
+                        and disp.get(b"name") == b"file" and b"filename" in disp
+                    )
+                    if receiving:
+                        part = (
+                            disp[b"filename"].decode("utf-8", "replace"),
+                            payload.get(b"content-type", b"").decode("latin-1") or None,
+                        )
+                elif kind == "data" and receiving:
+                    if upload is None:
+                        head += payload
+                        if len(head) >= SNIFF_BYTES:
+                            upload = _begin_upload(user["id"], *part, bytes(head))
+                            await upload.feed(bytes(head))
+                    else:
+                        await upload.feed(payload)
+                elif kind == "end" and receiving:
+                    if upload is None:  # SNIFF_BYTES'tan küçük dosya
+                        upload = _begin_upload(user["id"], *part, bytes(head))
+                        await upload.feed(bytes(head))
+                    receiving, done = False, True
+            events.clear()
+        parser.finalize()
+
+        if not done:
+            raise HTTPException(status_code=400, detail="file alanı bulunamadı")
+
+        url = await upload.finish()
+    except HTTPException:
+        if upload:
+            await upload.abort()
+        raise
+    except MultipartParseError:
+        if upload:
+            await upload.abort()
+        raise HTTPException(status_code=400, detail="Geçersiz multipart gövdesi")
+    except ClientDisconnect:
+        if upload:
+            await upload.abort()
+        raise HTTPException(status_code=400, detail="Yükleme yarıda kesildi")
     except Exception as e:
+        if upload:
+            await upload.abort()
         print("UPLOAD ERROR:", e)
         raise HTTPException(status_code=500, detail=f"Upload error: {e}")
+    except BaseException:
+        if upload:
+            await asyncio.shield(upload.abort())
+        raise
+
+    # İçerik kaydı + arka planda kanonik kopya (16 kHz mono WAV / Excel -> CSV); hata upload'ı bozmaz
+    asset_id = None
+    try:
+        asset_id = await run_in_threadpool(register_asset, upload.key, user["id"], upload.content_type, upload.size)
+    except Exception as e:
+        print("MEDIA REGISTER ERROR:", e)
+    return {"url": url, "content_type": upload.content_type, "asset_id": asset_id}
@@ -10,6 +10,7 @@ from starlette import status
 from .auth import get_current_user_from_cookie
 from backend.database import SessionLocal
 from backend.models import Users
+from backend.utils.chat import invalidate_user_info
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -169,5 +170,6 @@ async def update_status(
 
     user_model.status = norm
     db.commit()
+    invalidate_user_info(user_model.id)
     db.refresh(user_model)
     return {"message": "Status updated successfully", "new_status": user_model.status}
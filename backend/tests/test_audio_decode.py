@@ -0,0 +1,18 @@
+"""
+ffmpeg girdi dökümünden orijinal akış bilgisi (upload türevinde sample_rate/channels).
+Çalıştırma (repo kökünden):  python -m pytest -q backend/tests
+"""
+import pytest
+
+from backend.utils.audio_decode import _parse_stream_info
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("  Stream #0:0: Audio: mp3 (mp3float), 44100 Hz, stereo, fltp, 128 kb/s", {"sample_rate": 44100, "channels": 2}),
+    ("  Stream #0:0(und): Audio: aac (LC) (mp4a / 0x6134706D), 48000 Hz, mono, fltp, 69 kb/s", {"sample_rate": 48000, "channels": 1}),
+    ("  Stream #0:0: Audio: opus, 48000 Hz, 5.1(side), fltp", {"sample_rate": 48000, "channels": 6}),
+    ("  Stream #0:1: Audio: pcm_s16le, 8000 Hz, 3 channels, s16, 384 kb/s", {"sample_rate": 8000, "channels": 3}),
+    ("Input #0, mp3, from 'pipe:0':", {}),
+])
+def test_parse_stream_info(line, expected):
+    assert _parse_stream_info("Input #0\n" + line + "\n") == expected
@@ -0,0 +1,48 @@
+"""
+LRUCache.on_evict: kapasite, TTL ve aynı anahtara yeni değer yazılması durumlarında çağrılır.
+Çalıştırma (repo kökünden):  python -m pytest -q backend/tests
+"""
+import time
+
+from backend.utils.cache import LRUCache
+
+
+def _cache(**kw):
+    evicted = []
+    return LRUCache("test_evict", on_evict=lambda k, v: evicted.append((k, v)), **kw), evicted
+
+
+def test_replaced_value_is_evicted():
+    c, evicted = _cache()
+    c.set("k", {"name": "files/old"})
+    c.set("k", {"name": "files/new"})
+    assert evicted == [("k", {"name": "files/old"})]
+    assert c.get("k") == {"name": "files/new"}
+
+
+def test_resetting_same_object_is_not_evicted():
+    c, evicted = _cache()
+    v = {"name": "files/a"}
+    c.set("k", v)
+    c.set("k", v)
+    assert evicted == []
+
+
+def test_expired_value_is_evicted_on_get_and_on_overwrite():
+    c, evicted = _cache(ttl=0.01)
+    c.set("a", 1)
+    c.set("b", 2)
+    time.sleep(0.02)
+    assert c.get("a") is None
+    c.set("b", 3)
+    assert evicted == [("a", 1), ("b", 2)]
+
+
+def test_capacity_eviction_and_pop():
+    c, evicted = _cache(max_items=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.set("c", 3)
+    assert evicted == [("a", 1)]
+    assert c.pop("b") == 2  # çağıranın çıkardığı değer için on_evict çağrılmaz
+    assert evicted == [("a", 1)]
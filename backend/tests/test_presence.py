@@ -0,0 +1,66 @@
+"""
+Çok worker presence: aynı LocalRedis'i (Redis uyumlu stand-in) paylaşan iki RedisPresence iki
+worker'ı temsil eder. Çalıştırma (repo kökünden):  python -m pytest -q backend/tests
+"""
+import asyncio
+
+from backend.utils.presence import InMemoryPresence, LocalRedis, RedisPresence
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _workers(ttl: int = 60):
+    clock = _Clock()
+    shared = LocalRedis(clock=clock)
+    return clock, RedisPresence(client=shared, ttl=ttl), RedisPresence(client=shared, ttl=ttl)
+
+
+def test_presence_is_shared_across_workers():
+    async def run():
+        _, a, b = _workers()
+        await a.add(7, "sid-a")
+        assert await b.is_online(7)
+        assert await b.user_of("sid-a") == "7"
+        await b.add(7, "sid-b")
+        assert await a.sids(7) == {"sid-a", "sid-b"}
+        assert await b.remove("sid-a") == "7"  # disconnect başka worker'da işlense de
+        assert await a.sids(7) == {"sid-b"}
+        await b.remove("sid-b")
+        assert not await a.is_online(7)
+    asyncio.run(run())
+
+
+def test_crashed_worker_sids_expire_and_heartbeat_keeps_live_ones():
+    async def run():
+        clock, a, b = _workers(ttl=60)
+        await a.add(1, "sid-a")
+        await b.add(1, "sid-b")
+        await b.add(2, "sid-b2")
+        clock.now += 40
+        await a.heartbeat()   # b çöktü: heartbeat yok
+        clock.now += 40
+        assert await a.sids(1) == {"sid-a"}
+        assert not await a.is_online(2)
+        clock.now += 100      # a da durursa tüm kayıtlar düşer
+        assert not await b.is_online(1)
+    asyncio.run(run())
+
+
+def test_in_memory_presence_matches_interface():
+    async def run():
+        p = InMemoryPresence()
+        await p.add(3, "s1")
+        await p.add(3, "s2")
+        assert await p.is_online(3) and await p.sids(3) == {"s1", "s2"}
+        assert await p.remove("s1") == "3"
+        assert await p.user_of("s2") == "3"
+        await p.remove("s2")
+        assert not await p.is_online(3)
+        assert await p.remove("missing") is None
+    asyncio.run(run())
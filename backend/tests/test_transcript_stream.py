@@ -0,0 +1,99 @@
+"""
+TranscriptStream özelliği: metin hangi sınırlardan (tek karakter dahil) parçalanırsa parçalansın
+"".join(feed(...)) + flush() == normalize_transcript(metin).
+Çalıştırma (repo kökünden):  pip install -r requirements-dev.txt && python -m pytest -q backend/tests
+hypothesis ile ek olarak denenir; kurulu değilse o test "skipped" görünür, tohumlu random testleri yine çalışır.
+"""
+import random
+
+import pytest
+
+from backend.utils.transcript_filter import TranscriptStream, normalize_transcript
+
+# Kuralları tetikleyen parçalar: rol/madde önekleri, etiketler, kod blokları, gürültü ifadeleri,
+# yorum satırları ve bunlara benzeyip eşleşmemesi gereken kelimeler
+ATOMS = [
+    "[a b c d e f g h i]",
+    "the", "audio", "contains", "only", "noise", "sounds", "no", "clear", "speech", "detected",
+    "background", "typing", "beep", "beeping", "ringing", "music", "high", "pitched", "tone",
+    "high-pitched", "sound", "of", "a", "machine", "merhaba", "dünya", "evet", "İstanbul", "123",
+    "user:", "speaker 2:", "Speaker", "1", ":", "model:", "assistant", "agent", "-", "*", "•",
+    "[music]", "[", "]", "[]", "[x", "y]", "[no clear speech]", "```", "```json", "`", "...", ",", ".",
+    "audiobook", "beeper", "speechless", "Primarily", "AUDIO", "\n", "\n\n", " ", "  ", "\t", "\r\n",
+]
+SEPARATORS = [" ", " ", "", "\n", "  "]
+
+
+def _random_text(rng: random.Random) -> str:
+    out = []
+    for _ in range(rng.randint(0, 40)):
+        out.append(rng.choice(ATOMS))
+        out.append(rng.choice(SEPARATORS))
+    return "".join(out)
+
+
+def _stream(chunks) -> str:
+    st = TranscriptStream()
+    return "".join(st.feed(c) for c in chunks) + st.flush()
+
+
+def _random_split(text: str, rng: random.Random) -> list[str]:
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(0, len(text) - 1))) if len(text) > 1 else []
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_splits_match_whole_text(seed):
+    rng = random.Random(seed)
+    for _ in range(500):
+        text = _random_text(rng)
+        assert _stream(_random_split(text, rng)) == normalize_transcript(text), repr(text)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_single_character_chunks_match_whole_text(seed):
+    rng = random.Random(1000 + seed)
+    for _ in range(300):
+        text = _random_text(rng)
+        assert _stream(list(text)) == normalize_transcript(text), repr(text)
+
+
+@pytest.mark.parametrize("head, tail, expected", [
+    ("merhaba ", "dünya", "merhaba dünya"),                 # parça sınırındaki boşluk korunur
+    ("- user: [mus", "ic] merhaba", "merhaba"),             # etiket parçalar arasında bölünmüş
+    ("The aud", "io contains only noise", ""),              # yorum satırı başı bölünmüş
+    ("..", ".", ""),                                        # sadece noktalama
+    ("•", "\nmerhaba dünya", "merhaba dünya"),              # satırda tek başına madde işareti
+    ("- a\n", "*", "a"),                                     # metin sonunda çıplak madde işareti
+    ("evet background [mus", "ic] noise tamam", "evet tamam"),  # gürültü ifadesinin arasında etiket
+])
+def test_boundary_examples(head, tail, expected):
+    assert _stream([head, tail]) == expected == normalize_transcript(head + tail)
+
+
+def test_long_line_is_emitted_before_flush():
+    st = TranscriptStream()
+    words = ("bugün toplantıda bütçe konuşuldu ve karar alındı " * 20).split()
+    emitted = "".join(st.feed(w + " ") for w in words)
+    assert len(emitted) > len(" ".join(words)) // 2
+    assert emitted + st.flush() == " ".join(words)
+
+
+try:
+    from hypothesis import given, settings, strategies as hs
+except ImportError:  # requirements-dev.txt; yoksa tohumlu testler yine çalışır
+    hs = None
+
+    @pytest.mark.skip(reason="hypothesis kurulu değil (pip install -r requirements-dev.txt)")
+    def test_hypothesis_splits_match_whole_text():
+        pass
+
+if hs is not None:
+    _texts = hs.lists(hs.one_of(hs.sampled_from(ATOMS + SEPARATORS), hs.text(max_size=3)), max_size=40).map("".join)
+
+    @settings(max_examples=500, deadline=None)
+    @given(text=_texts, data=hs.data())
+    def test_hypothesis_splits_match_whole_text(text, data):
+        cuts = data.draw(hs.lists(hs.integers(0, len(text)), max_size=len(text)).map(sorted))
+        chunks = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+        assert _stream(chunks) == normalize_transcript(text)
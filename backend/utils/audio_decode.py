@@ -0,0 +1,248 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import subprocess
+import wave
+
+import numpy as np
+
+TARGET_SR = 16000
+# Çözme/yeniden örnekleme parça boyu (ses süresi); VAD bu parçalarla beslenir
+DECODE_CHUNK_MS = int(os.getenv("DECODE_CHUNK_MS", "2000"))
+# Sıkıştırılmış formatlar için yerel çözücü (PATH'te yoksa bu formatlar reddedilir)
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+
+# ffmpeg ile çözülen formatlar; mp4 kapsayıcısında moov atomu sonda olabildiğinden
+# bu tip pipe yerine geçici dosyadan okunur
+COMPRESSED_AUDIO_TYPES = {
+    "audio/mpeg", "audio/mp4", "audio/aac", "audio/ogg", "audio/webm", "audio/flac", "audio/aiff",
+}
+_SEEKABLE_INPUT_TYPES = {"audio/mp4"}
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BIN) is not None
+
+
+def _lowpass_taps(ratio: float) -> np.ndarray:
+    """Aşağı örnekleme öncesi kenar yumuşatma (windowed-sinc). ratio = out_sr / in_sr < 1."""
+    n = min(255, int(16 / ratio)) | 1
+    fc = 0.5 * ratio * 0.9
+    k = np.arange(n) - (n - 1) / 2.0
+    h = 2 * fc * np.sinc(2 * fc * k) * np.hamming(n)
+    return h / h.sum()
+
+
+class PcmConverter:
+    """
+    Parça parça gelen PCM (1/2/3/4 bayt, N kanal, herhangi bir örnekleme hızı) -> 16 kHz mono PCM16.
+    Kanallar ortalanır; hız farklıysa FIR alçak geçiren + doğrusal ara değerleme ile (NumPy,
+    durum parçalar arasında korunur) yeniden örneklenir. Zaten kanonik girdi kopyalanmadan geçer.
+    """
+
+    def __init__(self, in_sr: int, channels: int = 1, sampwidth: int = 2, out_sr: int = TARGET_SR):
+        if channels < 1:
+            raise ValueError(f"Desteklenmeyen kanal sayısı: {channels}")
+        if sampwidth not in (1, 2, 3, 4):
+            raise ValueError(f"Desteklenmeyen örnek genişliği: {sampwidth}")
+        if in_sr <= 0:
+            raise ValueError(f"Geçersiz örnekleme hızı: {in_sr}")
+        self.in_sr, self.channels, self.sampwidth, self.out_sr = in_sr, channels, sampwidth, out_sr
+        self._frame = channels * sampwidth
+        self._passthrough = (in_sr, channels, sampwidth) == (out_sr, 1, 2)
+        self._step = in_sr / out_sr
+        self._taps = _lowpass_taps(out_sr / in_sr) if in_sr > out_sr else None
+        # Filtre gecikmesi: baştaki (taps-1)/2 örnek atılır, flush'ta aynı kadar sıfır beslenir
+        self._delay = 0 if self._taps is None else (len(self._taps) - 1) // 2
+        self._hist = None if self._taps is None else np.zeros(len(self._taps) - 1)
+        self._skip = self._delay
+        self._pos = 0.0     # sıradaki çıktı örneğinin konumu (tampon başına göre, girdi örneği)
+        self._prev = None   # önceki parçanın son örneği (ara değerleme sürekliliği)
+        self._rem = b""     # tamamlanmamış frame baytları
+
+    def _to_float(self, raw: bytes) -> np.ndarray:
+        sw = self.sampwidth
+        if sw == 1:
+            x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128.0) * 256.0  # 8-bit işaretsiz
+        elif sw == 2:
+            x = np.frombuffer(raw, dtype="<i2").astype(np.float64)
+        elif sw == 3:
+            b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            v = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+            x = ((v << 8) >> 8).astype(np.float64) / 256.0
+        else:
+            x = np.frombuffer(raw, dtype="<i4").astype(np.float64) / 65536.0
+        if self.channels > 1:
+            x = x.reshape(-1, self.channels).mean(axis=1)
+        return x
+
+    def _resample(self, x: np.ndarray) -> np.ndarray:
+        if self._taps is not None:
+            buf = np.concatenate((self._hist, x))
+            self._hist = buf[len(buf) - len(self._hist):]
+            x = np.convolve(buf, self._taps, mode="valid")
+            if self._skip:
+                cut = min(self._skip, len(x))
+                x = x[cut:]
+                self._skip -= cut
+        if self.in_sr == self.out_sr or len(x) == 0:
+            return x
+        buf = x if self._prev is None else np.concatenate(([self._prev], x))
+        last = len(buf) - 1
+        if last < self._pos:
+            k = 0
+        else:
+            k = int((last - self._pos) // self._step) + 1
+        pos = self._pos + self._step * np.arange(k)
+        out = np.interp(pos, np.arange(len(buf)), buf)
+        self._pos = self._pos + k * self._step - last
+        self._prev = buf[-1]
+        return out
+
+    @staticmethod
+    def _to_pcm16(x: np.ndarray) -> bytes:
+        return np.clip(np.rint(x), -32768, 32767).astype("<i2").tobytes()
+
+    def feed(self, raw) -> bytes:
+        if self._passthrough:
+            return bytes(raw)
+        data = self._rem + bytes(raw)
+        usable = len(data) - (len(data) % self._frame)
+        self._rem = data[usable:]
+        if not usable:
+            return b""
+        return self._to_pcm16(self._resample(self._to_float(data[:usable])))
+
+    def flush(self) -> bytes:
+        """Filtrede kalan son örnekler (gecikme kadar sıfır beslenerek)."""
+        self._rem = b""
+        if self._passthrough or not self._delay:
+            return b""
+        return self._to_pcm16(self._resample(np.zeros(self._delay)))
+
+
+def iter_wav_pcm16(f, chunk_ms: int = DECODE_CHUNK_MS):
+    """
+    WAV dosya nesnesi -> 16 kHz mono PCM16 parçaları (generator). Başlık ilk next()'te değil,
+    çağrıda okunur; bozuk dosya hemen wave.Error/ValueError verir.
+    """
+    wf = wave.open(f, "rb")
+    try:
+        conv = PcmConverter(wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+    except Exception:
+        wf.close()
+        raise
+    n = max(1, int(wf.getframerate() * chunk_ms / 1000))
+
+    def _gen():
+        try:
+            while True:
+                raw = wf.readframes(n)
+                if not raw:
+                    break
+                out = conv.feed(raw)
+                if out:
+                    yield out
+            tail = conv.flush()
+            if tail:
+                yield tail
+        finally:
+            wf.close()
+
+    return _gen()
+
+
+def _copy_to_stdin(src, stdin):
+    try:
+        for chunk in iter(lambda: src.read(256 * 1024), b""):
+            stdin.write(chunk)
+    except (BrokenPipeError, ValueError, OSError):
+        pass  # ffmpeg erken çıktı; hata stderr'den raporlanır
+    finally:
+        try:
+            stdin.close()
+        except Exception:
+            pass
+
+
+_STREAM_RE = re.compile(r"Stream #\d+:\d+.*?: Audio: [^,]+, (\d+) Hz, ([^,\n]+)")
+_LAYOUT_CHANNELS = {"mono": 1, "stereo": 2, "2.1": 3, "quad": 4, "4.0": 4, "5.0": 5, "5.1": 6, "6.1": 7, "7.1": 8}
+
+
+def _parse_stream_info(stderr: str) -> dict:
+    """ffmpeg girdi dökümünden ilk ses akışının orijinal hızı ve kanal sayısı (bulunamazsa boş)."""
+    m = _STREAM_RE.search(stderr or "")
+    if not m:
+        return {}
+    layout = m.group(2).strip()
+    layout_key = layout.split("(")[0].strip()
+    ch = _LAYOUT_CHANNELS.get(layout_key)
+    if ch is None:
+        n = re.match(r"(\d+) channels", layout)
+        ch = int(n.group(1)) if n else None
+    return {"sample_rate": int(m.group(1)), "channels": ch}
+
+
+def iter_ffmpeg_pcm16(f, mime: str, chunk_ms: int = DECODE_CHUNK_MS, info: dict | None = None):
+    """
+    Sıkıştırılmış ses (dosya nesnesi) -> 16 kHz mono PCM16 parçaları (generator). Girdi ffmpeg'e
+    parça parça beslenir, çıktı geldikçe okunur; tüm dosya belleğe alınmaz. Generator kapatılırsa
+    süreç sonlandırılır. ffmpeg hata ile biterse RuntimeError. Geçici dosya (mp4) ve süreç ilk
+    next()'te oluşturulur: kopyalama çağıranın thread'inde yapılır, hiç başlatılmayan generator
+    geride dosya bırakmaz. info verilirse çözme bitince orijinal sample_rate/channels yazılır.
+    """
+    chunk_bytes = int(TARGET_SR * chunk_ms / 1000) * 2
+
+    def _gen():
+        tmp_path = None
+        proc = None
+        feeder = None
+        try:
+            cmd = [FFMPEG_BIN, "-nostdin", "-hide_banner", "-loglevel", "info" if info is not None else "error"]
+            if mime in _SEEKABLE_INPUT_TYPES:
+                with tempfile.NamedTemporaryFile(suffix=".m4a", delete=False) as tmp:
+                    tmp_path = tmp.name
+                    shutil.copyfileobj(f, tmp, 1024 * 1024)
+                cmd += ["-i", tmp_path]
+            else:
+                cmd += ["-i", "pipe:0"]
+            cmd += ["-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(TARGET_SR), "pipe:1"]
+            proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.DEVNULL if tmp_path else subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            if not tmp_path:
+                feeder = threading.Thread(target=_copy_to_stdin, args=(f, proc.stdin), daemon=True)
+                feeder.start()
+            err = []
+            err_reader = threading.Thread(target=lambda: err.append(proc.stderr.read()), daemon=True)
+            err_reader.start()
+            while True:
+                out = proc.stdout.read(chunk_bytes)
+                if not out:
+                    break
+                yield out
+            rc = proc.wait()
+            err_reader.join(timeout=5)
+            msg = (err[0] if err else b"").decode("utf-8", "replace").strip()
+            if rc != 0:
+                raise RuntimeError(f"ffmpeg decode failed (rc={rc}): {msg[-500:]}")
+            if info is not None:
+                info.update(_parse_stream_info(msg))
+        finally:
+            if proc is not None and proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            if feeder is not None:
+                feeder.join(timeout=5)
+            if tmp_path:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+    return _gen()
@@ -1,5 +1,8 @@
 import os
+import tempfile
+import threading
 import boto3
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError
 
 AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
@@ -7,13 +10,56 @@ AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION")
 AWS_S3_BUCKET_NAME = os.getenv("AWS_S3_BUCKET_NAME")
 
+# Yerel S3 uyumlu sunucu (MinIO, moto server) için, örn. http://localhost:9000
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "4"))
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client():
+    """
+    Süreç boyunca tek, paylaşılan S3 client'ı. boto3 client'ları thread-safe'tir;
+    kimlik/endpoint çözümü ve TLS bağlantıları her çağrıda tekrar kurulmaz.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.session.Session().client(
+                    "s3",
+                    aws_access_key_id=AWS_ACCESS_KEY,
+                    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                    region_name=AWS_DEFAULT_REGION,
+                    endpoint_url=S3_ENDPOINT_URL,
+                    config=Config(
+                        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                        tcp_keepalive=True,
+                        retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "adaptive"},
+                        signature_version="s3v4",
+                    ),
+                )
+    return _s3_client
+
+def reset_s3_client():
+    """Testlerde (moto/MinIO) env değiştikten sonra client'ı yeniden kurmak için."""
+    global _s3_client
+    with _s3_client_lock:
+        _s3_client = None
+
+# Bu boyuta kadar bellekte, üstünde geçici dosyada tutulur
+S3_SPOOL_MAX_MEMORY = int(os.getenv("S3_SPOOL_MAX_MEMORY", str(2 * 1024 * 1024)))
+
+# Multipart upload: parça boyu (S3 alt sınırı 5 MB) ve aynı anda yüklenen parça sayısı
+S3_UPLOAD_PART_SIZE = max(5 * 1024 * 1024, int(os.getenv("S3_UPLOAD_PART_SIZE", str(8 * 1024 * 1024))))
+S3_UPLOAD_CONCURRENCY = max(1, int(os.getenv("S3_UPLOAD_CONCURRENCY", "4")))
+
+def s3_object_url(key: str) -> str:
+    return f"https://{AWS_S3_BUCKET_NAME}.s3.{AWS_DEFAULT_REGION}.amazonaws.com/{key}"
+
 def upload_file_to_s3(file_obj, filename, content_type):
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_DEFAULT_REGION,
-    )
+    s3 = get_s3_client()
     try:
         s3.upload_fileobj(
             file_obj,
@@ -21,23 +67,74 @@ def upload_file_to_s3(file_obj, filename, content_type):
             filename,
             ExtraArgs={"ContentType": content_type}
         )
-        return f"https://{AWS_S3_BUCKET_NAME}.s3.{AWS_DEFAULT_REGION}.amazonaws.com/{filename}"
+        return s3_object_url(filename)
     except NoCredentialsError:
         raise Exception("AWS credentials not found!")
     except Exception as e:
         print("!!! UPLOAD ERROR:", e)
         raise
 
-def read_file_from_s3(s3_key: str) -> bytes:
-    s3 = boto3.client(
-        "s3",
-        aws_access_key_id=AWS_ACCESS_KEY,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_DEFAULT_REGION,
+def put_s3_object(key: str, data: bytes, content_type: str) -> None:
+    """Tek parçalık (küçük) objeler için; multipart'ın 3 çağrısına gerek yok."""
+    get_s3_client().put_object(Bucket=AWS_S3_BUCKET_NAME, Key=key, Body=data, ContentType=content_type)
+
+def create_multipart_upload(key: str, content_type: str) -> str:
+    resp = get_s3_client().create_multipart_upload(Bucket=AWS_S3_BUCKET_NAME, Key=key, ContentType=content_type)
+    return resp["UploadId"]
+
+def upload_s3_part(key: str, upload_id: str, part_number: int, data: bytes) -> dict:
+    resp = get_s3_client().upload_part(
+        Bucket=AWS_S3_BUCKET_NAME, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data
+    )
+    return {"PartNumber": part_number, "ETag": resp["ETag"]}
+
+def complete_multipart_upload(key: str, upload_id: str, parts: list) -> None:
+    get_s3_client().complete_multipart_upload(
+        Bucket=AWS_S3_BUCKET_NAME, Key=key, UploadId=upload_id,
+        MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])},
     )
+
+def abort_multipart_upload(key: str, upload_id: str) -> None:
+    try:
+        get_s3_client().abort_multipart_upload(Bucket=AWS_S3_BUCKET_NAME, Key=key, UploadId=upload_id)
+    except Exception as e:
+        print("!!! S3 ABORT MULTIPART ERROR:", e)
+
+def read_file_from_s3(s3_key: str) -> bytes:
+    s3 = get_s3_client()
     try:
         resp = s3.get_object(Bucket=AWS_S3_BUCKET_NAME, Key=s3_key)
         return resp["Body"].read()
     except Exception as e:
         print("!!! S3 READ ERROR:", e)
         raise
+
+def head_s3_object(s3_key: str) -> dict:
+    """Gövdeyi indirmeden ETag/boyut/tip bilgisi (cache doğrulama için ucuz çağrı)."""
+    s3 = get_s3_client()
+    try:
+        resp = s3.head_object(Bucket=AWS_S3_BUCKET_NAME, Key=s3_key)
+        return {
+            "etag": (resp.get("ETag") or "").strip('"'),
+            "size": int(resp.get("ContentLength", 0)),
+            "content_type": resp.get("ContentType"),
+        }
+    except Exception as e:
+        print("!!! S3 HEAD ERROR:", e)
+        raise
+
+def open_s3_spooled(s3_key: str):
+    """
+    Objeyi parça parça SpooledTemporaryFile'a indirir (tek bir büyük bytes oluşmaz).
+    Dönen dosya başa sarılmıştır; kapatmak çağırana aittir.
+    """
+    s3 = get_s3_client()
+    tmp = tempfile.SpooledTemporaryFile(max_size=S3_SPOOL_MAX_MEMORY)
+    try:
+        s3.download_fileobj(AWS_S3_BUCKET_NAME, s3_key, tmp)
+        tmp.seek(0)
+        return tmp
+    except Exception as e:
+        tmp.close()
+        print("!!! S3 SPOOL ERROR:", e)
+        raise
@@ -0,0 +1,123 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Süreç içi (in-process) cache'ler burada kayıt olur; /metrics endpoint'i buradan okur
+_REGISTRY = {}
+
+
+class LRUCache:
+    """
+    Thread-safe, boyut sınırlı LRU cache.
+      - max_items: en fazla eleman sayısı
+      - ttl: saniye cinsinden yaşam süresi (None/0 -> süresiz)
+      - max_bytes: toplam tahmini boyut limiti (sizeof ile ölçülür, None/0 -> limitsiz)
+    Değerler sadece bellekte tutulur; diske hiçbir şey yazılmaz.
+    """
+
+    def __init__(self, name: str, max_items: int = 1024, ttl: float | None = None,
+                 max_bytes: int | None = None, sizeof=None, on_evict=None):
+        self.name = name
+        self.max_items = max(1, int(max_items))
+        self.ttl = float(ttl) if ttl else None
+        self.max_bytes = int(max_bytes) if max_bytes else None
+        self.sizeof = sizeof or (lambda v: 0)
+        # kapasite, TTL ya da aynı anahtara yeni değer yazılması nedeniyle düşen (key, value)
+        # için çağrılır; pop/clear ile çağıranın kendisinin çıkardığı değerler için çağrılmaz
+        self.on_evict = on_evict
+        self._data = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _REGISTRY[name] = self
+
+    def _drop(self, key):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _notify(self, evicted) -> None:
+        if not self.on_evict:
+            return
+        for k, v in evicted:
+            try:
+                self.on_evict(k, v)
+            except Exception as e:
+                print(f"[CACHE][{self.name}] on_evict error: {e}")
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = item
+            expired = expires_at is not None and expires_at <= time.monotonic()
+            if expired:
+                self._drop(key)
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        self._notify([(key, value)])
+        return default
+
+    def set(self, key, value, ttl: float | None = None):
+        size = int(self.sizeof(value) or 0)
+        if self.max_bytes and size > self.max_bytes:
+            return  # tek başına limiti aşan değeri hiç tutma
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = (time.monotonic() + ttl) if ttl else None
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                old = self._data[key][0]
+                self._drop(key)
+                if old is not value:  # aynı nesne yeniden yazılıyorsa kaynağı hâlâ kullanımda
+                    evicted.append((key, old))
+            self._data[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._data) > self.max_items or (self.max_bytes and self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                evicted.append((oldest, self._data[oldest][0]))
+                self._drop(oldest)
+                self.evictions += 1
+        self._notify(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            self._drop(key)
+            return item[0]
+
+    def items(self) -> list:
+        """(key, value) anlık görüntüsü; LRU sırasını değiştirmez."""
+        with self._lock:
+            return [(k, v[0]) for k, v in self._data.items()]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def cache_stats() -> dict:
+    return {name: c.stats() for name, c in _REGISTRY.items()}
@@ -1,39 +1,58 @@
-from backend.models import UserConversationState, UserChatMessage, UserConversation
+import os
+from backend.models import UserConversationState, UserChatMessage, Users, UserMessageRead
 from sqlalchemy.orm import Session
-from backend.utils.security import encrypt_message
+from sqlalchemy import func, exists, and_
+from backend.utils.cache import LRUCache
+
+# Gönderici profil bilgisi için kısa ömürlü cache (status değişince invalidate edilir)
+USER_INFO_TTL = float(os.getenv("USER_INFO_CACHE_TTL", "60"))
+user_info_cache = LRUCache("user_info", max_items=2048, ttl=USER_INFO_TTL)
+
+def get_user_info(db: Session, user_id: int) -> dict | None:
+    info = user_info_cache.get(int(user_id))
+    if info is None:
+        u = db.query(Users).filter(Users.id == user_id).first()
+        if not u:
+            return None
+        info = {
+            "id": u.id,
+            "first_name": u.first_name,
+            "last_name": u.last_name,
+            "username": u.username,
+            "profile_picture_url": u.profile_picture_url,
+            "status": u.status,
+            "role": u.role,
+        }
+        user_info_cache.set(int(user_id), info)
+    return dict(info)
+
+def invalidate_user_info(user_id) -> None:
+    try:
+        user_info_cache.pop(int(user_id))
+    except (TypeError, ValueError):
+        pass
+
+def count_unread(db: Session, conversation_id: int, user_id: int, other_user_id: int) -> int:
+    """Karşı tarafın gönderip user_id'nin okumadığı mesaj sayısı (tek COUNT sorgusu)."""
+    read_exists = exists().where(and_(
+        UserMessageRead.message_id == UserChatMessage.id,
+        UserMessageRead.user_id == user_id,
+    ))
+    return db.query(func.count(UserChatMessage.id)).filter(
+        UserChatMessage.conversation_id == conversation_id,
+        UserChatMessage.sender_id == other_user_id,
+        ~read_exists,
+    ).scalar() or 0
 
 def get_or_create_link(user_id: int, conversation_id: int, db: Session) -> UserConversationState:
+    """Commit etmez; çağıran tek commit ile transaction'ı kapatır."""
     link = db.query(UserConversationState).filter_by(user_id=user_id, conversation_id=conversation_id).first()
     if link:
         if link.cleared_at:  # daha önce silinmiş gibi düşünülüyorsa
             link.cleared_at = None
-            db.commit()
         return link
 
     link = UserConversationState(user_id=user_id, conversation_id=conversation_id)
     db.add(link)
-    db.commit()
-    db.refresh(link)
+    db.flush()
     return link
-
-def create_message(sender_id: int, receiver_id: int, content: str, db: Session, conversation_id: int = None) -> UserChatMessage:
-    # Eğer conversation_id verilmişse
-    if conversation_id:
-        conversation = db.query(UserConversation).filter(UserConversation.id == conversation_id).first()
-    else:
-        conversation = get_or_create_conversation(sender_id, receiver_id, db)
-
-    get_or_create_link(sender_id, conversation.id, db)
-    get_or_create_link(receiver_id, conversation.id, db)
-
-    encrypted_content = encrypt_message({"text": content})
-
-    message = UserChatMessage(
-        conversation_id=conversation.id,
-        sender_id=sender_id,
-        content=encrypted_content
-    )
-    db.add(message)
-    db.commit()
-    db.refresh(message)
-    return message
@@ -0,0 +1,115 @@
+from datetime import timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+
+from backend.database import SessionLocal
+from backend.models import now_tr
+from backend.utils.cache import LRUCache
+from backend.utils.security import fernet
+from backend.utils import metrics
+
+
+class EncryptedDbCache:
+    """
+    İki katmanlı metin cache'i: süreç içi LRU (plaintext sadece bellekte) + DB (Fernet ile şifreli).
+    DB tablosu şu kolonlara sahip olmalı: <key_column>, content, size_bytes, created_at,
+    last_used_at ve (ttl_s verilirse) expires_at. Toplam boyut max_bytes'ı aşınca en eski
+    kullanılanlar %90'a inene kadar silinir. Tüm metotlar sync; event loop'tan thread'de çağrılmalı.
+    DB hataları yutulur (log_tag ile basılır), cache hiçbir zaman çağıranın işini engellemez.
+    """
+
+    def __init__(self, name: str, model, key_column: str, metric_prefix: str, log_tag: str,
+                 max_bytes: int, memory_bytes: int, memory_items: int = 1024, ttl_s: int = 0):
+        self.model = model
+        self.key_col = getattr(model, key_column)
+        self.key_column = key_column
+        self.metric_prefix = metric_prefix
+        self.log_tag = log_tag
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s or 0
+        self.memory = LRUCache(
+            name,
+            max_items=memory_items,
+            ttl=self.ttl_s or None,
+            max_bytes=memory_bytes,
+            sizeof=len,
+        )
+
+    def _load(self, key: str) -> str | None:
+        db = SessionLocal()
+        try:
+            now = now_tr()
+            q = db.query(self.model).filter(self.key_col == key)
+            if self.ttl_s:
+                q = q.filter(or_(self.model.expires_at.is_(None), self.model.expires_at > now))
+            row = q.first()
+            if row is None:
+                return None
+            row.last_used_at = now
+            db.commit()
+            return fernet.decrypt(row.content.encode("utf-8")).decode("utf-8")
+        finally:
+            db.close()
+
+    def _enforce_cap(self, db) -> None:
+        m = self.model
+        if self.ttl_s:
+            expired = (
+                db.query(m)
+                .filter(m.expires_at.isnot(None), m.expires_at <= now_tr())
+                .delete(synchronize_session=False)
+            )
+            if expired:
+                metrics.incr(f"{self.metric_prefix}_expired", expired)
+        total = db.query(func.coalesce(func.sum(m.size_bytes), 0)).scalar() or 0
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)  # her eklemede tekrar tetiklenmesin
+        victims = []
+        for row_id, size in db.query(m.id, m.size_bytes).order_by(m.last_used_at.asc()):
+            if total <= target:
+                break
+            victims.append(row_id)
+            total -= size
+        if victims:
+            db.query(m).filter(m.id.in_(victims)).delete(synchronize_session=False)
+            metrics.incr(f"{self.metric_prefix}_evictions", len(victims))
+
+    def _store(self, key: str, text: str, columns: dict) -> None:
+        token = fernet.encrypt(text.encode("utf-8")).decode("utf-8")
+        db = SessionLocal()
+        try:
+            now = now_tr()
+            row = self.model(content=token, size_bytes=len(token), created_at=now, last_used_at=now, **columns)
+            setattr(row, self.key_column, key)
+            if self.ttl_s:
+                row.expires_at = now + timedelta(seconds=self.ttl_s)
+            db.add(row)
+            db.flush()
+            self._enforce_cap(db)
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # aynı kaydı başka bir worker yazmış
+        finally:
+            db.close()
+
+    def get(self, key: str) -> str | None:
+        """Bellek -> DB (bulunursa belleğe de alınır)."""
+        text = self.memory.get(key)
+        if text is not None:
+            return text
+        try:
+            text = self._load(key)
+        except Exception as e:
+            print(f"[{self.log_tag}] load failed {key}: {e}")
+        if text is not None:
+            self.memory.set(key, text)
+        return text
+
+    def put(self, key: str, text: str, **columns) -> None:
+        """columns: tabloya özgü ek kolonlar (ör. model, s3_key)."""
+        self.memory.set(key, text)
+        try:
+            self._store(key, text, columns)
+        except Exception as e:
+            print(f"[{self.log_tag}] store failed {key}: {e}")
@@ -0,0 +1,93 @@
+# Canlı görüşmede iki taraf ayrı sid ile ayrı PCM akışı gönderir; konuşmacı kanaldan bellidir.
+# Her segment {"text", "user_id", "role", "t0", "start", "end"} olarak saklanır:
+#   t0         -> akışın başladığı an (sunucu saati, epoch saniye)
+#   start/end  -> akış içi konum (frame sayacından, saniye)
+# İki tarafın segmentleri t0 + start'a göre tek sıralı transkriptte birleştirilir. Eski kayıtlar
+# ({"text"} ya da düz string) zamansızdır; sıralamada başta ve kendi sıralarında kalır.
+
+TRANSCRIPT_MAX_ITEMS = 500
+
+
+def make_item(text: str, user_id, role, t0: float, start: float, end: float) -> dict:
+    return {
+        "text": text,
+        "user_id": user_id,
+        "role": role,
+        "t0": round(t0, 3),
+        "start": round(start, 2),
+        "end": round(end, 2),
+    }
+
+
+def item_time(item) -> float | None:
+    """Segmentin mutlak başlangıcı (sunucu saati); zamansız kayıtlar için None."""
+    if not isinstance(item, dict) or "start" not in item:
+        return None
+    return float(item.get("t0") or 0.0) + float(item["start"])
+
+
+def _sort_key(item) -> float:
+    t = item_time(item)
+    return float("-inf") if t is None else t
+
+
+def merge_items(existing, items, limit: int = TRANSCRIPT_MAX_ITEMS) -> list:
+    """Mevcut transkript + yeni segmentler -> zamana göre sıralı, en fazla limit kayıt."""
+    merged = list(existing or []) + list(items or [])
+    merged.sort(key=_sort_key)  # stabil: eşit/zamansız kayıtların sırası korunur
+    return merged[-limit:]
+
+
+def _text_of(item) -> str:
+    if isinstance(item, dict):
+        return str(item.get("text") or "")
+    return str(item)
+
+
+def _clock(seconds: float) -> str:
+    s = max(0, int(seconds))
+    return f"{s // 3600}:{s // 60 % 60:02d}:{s % 60:02d}" if s >= 3600 else f"{s // 60:02d}:{s % 60:02d}"
+
+
+def speaker_label(item, names: dict | None = None) -> str | None:
+    """user_id -> görünen ad (yoksa #id); rol varsa parantez içinde eklenir."""
+    if not isinstance(item, dict) or (item.get("user_id") is None and not item.get("role")):
+        return None
+    uid = item.get("user_id")
+    name = (names or {}).get(uid) or (f"#{uid}" if uid is not None else None)
+    role = item.get("role")
+    if name and role:
+        return f"{name} ({role})"
+    return name or str(role)
+
+
+def transcript_lines(parts, names: dict | None = None) -> list[str]:
+    """
+    Kayıtlı transkript -> "[dd:ss] Konuşmacı: metin" satırları. Aynı konuşmacının ardışık
+    segmentleri tek satırda birleşir; süre transkriptteki ilk zamanlı segmente göredir.
+    Konuşmacı bilgisi olmayan eski kayıtlar düz metin satırı olarak kalır.
+    """
+    times = [t for t in (item_time(p) for p in parts or []) if t is not None]
+    base = min(times) if times else 0.0
+    lines, last = [], None
+    for p in parts or []:
+        text = _text_of(p).strip()
+        if not text:
+            continue
+        label = speaker_label(p, names)
+        if label is None:
+            lines.append(text)
+            last = None
+            continue
+        if label == last:
+            lines[-1] = f"{lines[-1]} {text}"
+            continue
+        t = item_time(p)
+        stamp = f"[{_clock(t - base)}] " if t is not None else ""
+        lines.append(f"{stamp}{label}: {text}")
+        last = label
+    return lines
+
+
+def transcript_text(parts, names: dict | None = None) -> str:
+    return "\n".join(transcript_lines(parts, names))
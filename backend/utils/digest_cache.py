@@ -0,0 +1,49 @@
+import os
+import hashlib
+
+from backend.models import SpreadsheetDigest
+from backend.utils.db_cache import EncryptedDbCache
+from backend.utils.spreadsheet import MAX_ROWS_PER_SHEET, MAX_CSV_BYTES, CSV_PREVIEW_ROWS, STATS_MAX_ROWS
+from backend.utils import metrics
+
+# Kalıcı katman (DB, şifreli) için toplam boyut limiti; aşılınca en eski kullanılanlar silinir
+SPREADSHEET_DIGEST_MAX_BYTES = int(os.getenv("SPREADSHEET_DIGEST_MAX_BYTES", str(256 * 1024 * 1024)))
+# Süreç içi ön katman (plaintext sadece bellekte)
+SPREADSHEET_DIGEST_MEMORY_BYTES = int(os.getenv("SPREADSHEET_DIGEST_MEMORY_BYTES", str(32 * 1024 * 1024)))
+
+_cache = EncryptedDbCache(
+    "spreadsheet_digests",
+    SpreadsheetDigest,
+    key_column="digest_key",
+    metric_prefix="spreadsheet_digest",
+    log_tag="DIGEST",
+    max_bytes=SPREADSHEET_DIGEST_MAX_BYTES,
+    memory_bytes=SPREADSHEET_DIGEST_MEMORY_BYTES,
+)
+
+def digest_profile(mode: str) -> str:
+    """Mod + limitlerin kısa özeti; upload türevi de bununla etiketlenir (farklıysa kullanılmaz)."""
+    limits = f"{MAX_ROWS_PER_SHEET}:{MAX_CSV_BYTES}:{CSV_PREVIEW_ROWS}:{STATS_MAX_ROWS}"
+    return hashlib.sha256(f"{limits}\0{mode}".encode("utf-8")).hexdigest()[:12]
+
+def digest_key(s3_key: str, etag: str, mode: str) -> str:
+    """Limitler de anahtara girer; env değişince eski digest'ler kendiliğinden kullanılmaz."""
+    return hashlib.sha256(f"{s3_key}\0{etag}\0{digest_profile(mode)}".encode("utf-8")).hexdigest()
+
+def get_or_build(s3_key: str, etag: str | None, mode: str, build) -> str:
+    """
+    (s3_key, ETag, limitler, mod) için digest: bellek -> DB -> build().
+    ETag yoksa cache'lenmez. DB hataları digest üretimini engellemez.
+    """
+    if not etag:
+        return build()
+    key = digest_key(s3_key, etag, mode)
+    text = _cache.get(key)
+    if text is not None:
+        metrics.incr("spreadsheet_digest_hits")
+        return text
+
+    metrics.incr("spreadsheet_digest_misses")
+    text = build()
+    _cache.put(key, text, s3_key=s3_key, etag=etag, mode=mode)
+    return text
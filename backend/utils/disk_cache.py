@@ -0,0 +1,209 @@
+import os
+import mmap
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+from backend.utils.cache import LRUCache
+from backend.utils import metrics
+
+# Opsiyonel: FILES_DISK_CACHE_DIR verilmezse disk cache kapalıdır
+FILES_DISK_CACHE_DIR = os.getenv("FILES_DISK_CACHE_DIR") or None
+# Toplam disk bütçesi (tüm worker'lar). Her worker kendi pid dizinini tutar; bütçe worker sayısına
+# (WEB_CONCURRENCY, uvicorn --workers varsayılanı) bölünür, disk kullanımı toplamda bu limiti aşmaz.
+FILES_DISK_CACHE_MAX_BYTES = int(os.getenv("FILES_DISK_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+FILES_DISK_CACHE_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+FILES_DISK_CACHE_MAX_OBJECT = int(os.getenv("FILES_DISK_CACHE_MAX_OBJECT", str(100 * 1024 * 1024)))
+# Son doğrulamadan (S3 koşullu HEAD) bu kadar saniye içinde gelen isabetler S3'e gitmeden servis edilir
+FILES_DISK_CACHE_REVALIDATE_S = float(os.getenv("FILES_DISK_CACHE_REVALIDATE_S", "30"))
+
+_BLOCK = 16  # AES blok boyu
+
+
+class _CacheWriter:
+    """
+    Gelen parçaları şifreleyip geçici dosyaya yazar; commit'te cache'e alınır.
+    Geçici dosya adı benzersizdir (yazıcılar aynı event loop thread'inde açılır).
+    """
+
+    def __init__(self, cache, key: str, meta: dict, token):
+        self.cache = cache
+        self.key = key
+        self.meta = meta
+        self.token = token
+        self.nonce = os.urandom(_BLOCK)
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(meta["path"]), suffix=".part")
+        self.f = os.fdopen(fd, "wb")
+        self.enc = cache._cipher(self.nonce).encryptor()
+        self.written = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.f.write(self.enc.update(chunk))
+        self.written += len(chunk)
+
+    def commit(self) -> None:
+        try:
+            self.f.write(self.enc.finalize())
+            self.f.close()
+            if self.written != self.meta["size"]:
+                self.abort()
+                return
+            # yazım başına ayrı ad: aynı anahtar yeniden yazılınca eski kaydın on_evict'i yenisini silmez
+            path = f'{self.meta["path"]}-{self.nonce.hex()[:12]}'
+            os.replace(self.tmp_path, path)
+            self.cache._index.set(self.key, dict(self.meta, path=path, nonce=self.nonce, checked_at=time.monotonic()))
+        finally:
+            self.cache._release(self.token)
+
+    def abort(self) -> None:
+        try:
+            self.f.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+        self.cache._release(self.token)
+
+
+class DiskObjectCache:
+    """
+    S3 objeleri için boyut sınırlı, LRU disk cache'i. (key, ETag) başına bir dosya.
+    Dosyalar AES-CTR ile şifrelenir; anahtar süreç başına rastgele üretilir ve hiçbir yere
+    yazılmaz, dolayısıyla süreç bitince diskteki içerik okunamaz. CTR modu sayesinde
+    herhangi bir byte aralığı dosyanın tamamı çözülmeden mmap üzerinden okunabilir.
+    """
+
+    def __init__(self, root: str | None, max_bytes: int, max_object: int):
+        self.enabled = bool(root)
+        self.max_object = max_object
+        self._key = os.urandom(32)
+        self._index = LRUCache(
+            "files_disk",
+            max_items=1_000_000,
+            max_bytes=max_bytes,
+            sizeof=lambda e: e["size"],
+            on_evict=lambda _k, e: self._remove_file(e["path"]),
+        )
+        # (key, ETag) başına tek yazıcı; aynı anda gelen diğer soğuk okumalar S3'ten akar
+        self._inflight = set()
+        self._inflight_lock = threading.Lock()
+        if self.enabled:
+            # worker başına ayrı dizin; önceki süreçlerden kalan (okunamaz) dizinleri temizle
+            self.root = os.path.join(root, str(os.getpid()))
+            self._sweep_stale(root)
+            shutil.rmtree(self.root, ignore_errors=True)
+            os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def _pid_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _sweep_stale(self, root: str) -> None:
+        """Yeniden başlatma / worker yenilemesi sonrası ölü pid dizinleri FILES_DISK_CACHE_MAX_BYTES'a sayılmaz, silinir."""
+        try:
+            names = os.listdir(root)
+        except OSError:
+            return
+        for name in names:
+            if name.isdigit() and int(name) != os.getpid() and not self._pid_alive(int(name)):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                metrics.incr("files_disk_cache_stale_dirs_removed")
+
+    def _cipher(self, nonce: bytes, block: int = 0) -> Cipher:
+        counter = (int.from_bytes(nonce, "big") + block) % (1 << 128)
+        return Cipher(algorithms.AES(self._key), modes.CTR(counter.to_bytes(_BLOCK, "big")))
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def lookup(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        return self._index.get(key)
+
+    @staticmethod
+    def needs_revalidation(entry: dict) -> bool:
+        return time.monotonic() - entry.get("checked_at", 0.0) >= FILES_DISK_CACHE_REVALIDATE_S
+
+    @staticmethod
+    def mark_fresh(entry: dict) -> None:
+        entry["checked_at"] = time.monotonic()
+
+    def invalidate(self, key: str) -> None:
+        entry = self._index.pop(key)
+        if entry:
+            self._remove_file(entry["path"])
+
+    def _release(self, token) -> None:
+        with self._inflight_lock:
+            self._inflight.discard(token)
+
+    def writer(self, key: str, etag: str, size: int, content_type: str, last_modified) -> _CacheWriter | None:
+        if not self.enabled or not etag or size <= 0 or size > self.max_object:
+            return None
+        token = (key, etag)
+        with self._inflight_lock:
+            if token in self._inflight:
+                metrics.incr("files_disk_cache_write_skipped")
+                return None
+            self._inflight.add(token)
+        name = hashlib.sha256(f"{key}\0{etag}".encode("utf-8")).hexdigest()
+        meta = {
+            "path": os.path.join(self.root, name),
+            "etag": etag,
+            "size": size,
+            "content_type": content_type,
+            "last_modified": last_modified,
+        }
+        try:
+            return _CacheWriter(self, key, meta, token)
+        except OSError as e:
+            self._release(token)
+            print(f"[FILES][DISKCACHE] writer error: {e}")
+            return None
+
+    def read_range(self, entry: dict, start: int, end: int, chunk_size: int):
+        """
+        [start, end] aralığını mmap'ten okuyup çözerek parça parça üretir (sync generator).
+        Dosya ve mmap çağrıda (yanıt başlıkları gönderilmeden) açılır: kayıt sonradan evict/
+        invalidate edilse de açık mmap okunmaya devam eder. Dosya yoksa OSError burada yükselir.
+        """
+        f = open(entry["path"], "rb")
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            f.close()
+            raise
+        return self._iter_range(f, mm, entry["nonce"], start, end, chunk_size)
+
+    def _iter_range(self, f, mm, nonce: bytes, start: int, end: int, chunk_size: int):
+        with f, mm:
+            pos = start
+            while pos <= end:
+                n = min(chunk_size, end - pos + 1)
+                block_start = pos - (pos % _BLOCK)
+                dec = self._cipher(nonce, block_start // _BLOCK).decryptor()
+                data = dec.update(mm[block_start:pos + n])
+                yield data[pos - block_start:]
+                metrics.incr("files_disk_cache_bytes_saved", n)
+                pos += n
+
+
+disk_cache = DiskObjectCache(
+    FILES_DISK_CACHE_DIR, FILES_DISK_CACHE_MAX_BYTES // FILES_DISK_CACHE_WORKERS, FILES_DISK_CACHE_MAX_OBJECT
+)
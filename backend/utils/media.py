@@ -0,0 +1,340 @@
+import io
+import os
+import wave
+import tempfile
+import threading
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.database import SessionLocal
+from backend.models import MediaAsset
+from backend.utils.aws_s3 import read_file_from_s3, open_s3_spooled, put_s3_object, upload_file_to_s3
+from backend.utils.cache import LRUCache
+from backend.utils.audio_decode import (
+    TARGET_SR, COMPRESSED_AUDIO_TYPES, ffmpeg_available, iter_wav_pcm16, iter_ffmpeg_pcm16,
+)
+from backend.utils.spreadsheet import SPREADSHEET_DIGEST_MODE, excel_to_csv_with_stats, excel_stats_digest
+from backend.utils.digest_cache import digest_profile
+from backend.utils import metrics
+
+# Bazı ortamlar için eksik tanımlar
+mimetypes.add_type("audio/mp4", ".m4a")
+mimetypes.add_type("image/jpeg", ".jpg")
+mimetypes.add_type("image/jpeg", ".jpeg")
+mimetypes.add_type("image/png", ".png")
+mimetypes.add_type("text/csv", ".csv")
+mimetypes.add_type("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx")
+mimetypes.add_type("application/vnd.ms-excel", ".xls")
+
+OCTET = "application/octet-stream"
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+XLS_MIME = "application/vnd.ms-excel"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Tarayıcı/ortam octet-stream gönderdiğinde uzantıdan tip (tek kaynak)
+EXT_TO_MIME = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".m4a": "audio/mp4",
+    ".aac": "audio/aac",
+    ".ogg": "audio/ogg",
+    ".webm": "audio/webm",
+    ".flac": "audio/flac",
+    ".aiff": "audio/aiff",
+    ".aif": "audio/aiff",
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".csv": "text/csv",
+    ".xlsx": XLSX_MIME,
+    ".xls": XLS_MIME,
+    ".docx": DOCX_MIME,
+    ".doc": "application/msword",
+}
+
+def mime_from_filename(filename: str, declared: str | None = None) -> str:
+    """Beyan edilen tip (yoksa uzantı) -> normalize edilmiş, parametresiz, küçük harf MIME."""
+    fn = (filename or "").lower()
+    mime = declared or mimetypes.guess_type(fn)[0] or OCTET
+    mime = mime.split(";", 1)[0].strip().lower() or OCTET
+    if fn.endswith(".webm") and mime == "video/webm":
+        mime = "audio/webm"
+    if fn.endswith(".m4a") and mime in (OCTET, "audio/mpeg"):
+        mime = "audio/mp4"
+    if mime == OCTET:
+        mime = EXT_TO_MIME.get(os.path.splitext(fn)[1], mime)
+    return mime
+
+# Tip tespiti için okunması yeterli baş kısım
+SNIFF_BYTES = 512
+
+# ISO-BMFF (ftyp) marka -> tip. Sadece ses olduğunu ilan eden markalar audio/mp4 sayılır;
+# isom/mp41/mp42 gibi genel markalar hem video hem ses olabilir (aşağıda ayrıca bakılır).
+_FTYP_AUDIO = {b"M4A ", b"M4B ", b"M4P ", b"F4A ", b"F4B "}
+_FTYP_BRANDS = {
+    b"qt  ": "video/quicktime",
+    b"M4V ": "video/mp4", b"M4VH": "video/mp4", b"M4VP": "video/mp4", b"F4V ": "video/mp4",
+    b"heic": "image/heic", b"heix": "image/heic", b"heim": "image/heic", b"heis": "image/heic",
+    b"hevc": "image/heic-sequence", b"hevx": "image/heic-sequence",
+    b"mif1": "image/heif", b"msf1": "image/heif-sequence",
+    b"avif": "image/avif", b"avis": "image/avif",
+}
+_FTYP_EXT = {".m4a": "audio/mp4", ".m4b": "audio/mp4", ".aac": "audio/mp4",
+             ".mp4": "video/mp4", ".m4v": "video/mp4", ".mov": "video/quicktime"}
+
+def _hdlr(head: bytes, handler: bytes) -> bool:
+    """hdlr kutusu: 'hdlr' + version/flags (4) + pre_defined (4) + handler_type (4)."""
+    i = head.find(b"hdlr")
+    while i != -1:
+        if head[i + 12:i + 16] == handler:
+            return True
+        i = head.find(b"hdlr", i + 4)
+    return False
+
+def _ftyp_mime(head: bytes, fn: str) -> str:
+    """
+    ftyp kutusunun major + uyumlu markalarından tip. Genel markalarda (isom, mp42, ...) baş
+    kısımda görünen iz türüne (vmhd / hdlr 'vide' -> video, smhd / hdlr 'soun' -> ses) ya da uzantıya
+    bakılır; hiçbir ipucu yoksa eski davranış (audio/mp4) korunur.
+    """
+    size = int.from_bytes(head[:4], "big")
+    end = min(len(head), size if size >= 16 else 16)
+    brands = [head[8:12]] + [head[i:i + 4] for i in range(16, end - 3, 4)]
+    if head[8:12] in _FTYP_AUDIO:
+        return "audio/mp4"
+    for b in brands:
+        if b in _FTYP_BRANDS:
+            return _FTYP_BRANDS[b]
+    if any(b in _FTYP_AUDIO for b in brands):
+        return "audio/mp4"
+    if b"vmhd" in head or _hdlr(head, b"vide"):
+        return "video/mp4"
+    if b"smhd" in head or _hdlr(head, b"soun"):
+        return "audio/mp4"
+    return _FTYP_EXT.get(os.path.splitext(fn)[1], "audio/mp4")
+
+def sniff_mime(head: bytes, filename: str = "") -> str | None:
+    """Magic byte'lardan tip; tanınmazsa None (metin dosyaları, örn. CSV)."""
+    fn = (filename or "").lower()
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "audio/aiff"
+    if head.startswith(b"fLaC"):
+        return "audio/flac"
+    if head.startswith(b"OggS"):
+        return "audio/ogg"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "audio/webm"
+    if head[4:8] == b"ftyp":
+        return _ftyp_mime(head, fn)
+    if head.startswith(b"ID3"):
+        return "audio/mpeg"
+    if len(head) > 1 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0:
+        # MPEG frame sync; layer bitleri 0 ise ADTS (AAC)
+        return "audio/aac" if (head[1] & 0x06) == 0 else "audio/mpeg"
+    if head.startswith(b"PK\x03\x04"):
+        if fn.endswith(".xlsx") or b"xl/" in head:
+            return XLSX_MIME
+        if fn.endswith(".docx") or b"word/" in head:
+            return DOCX_MIME
+        return "application/zip"
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"):  # OLE2 (eski Office)
+        if fn.endswith(".xls"):
+            return XLS_MIME
+        if fn.endswith(".doc"):
+            return "application/msword"
+        return "application/x-ole-storage"
+    if head.startswith(b"MZ"):
+        return "application/x-msdownload"
+    if head.startswith(b"\x7fELF"):
+        return "application/x-executable"
+    return None
+
+def detect_mime(head: bytes, filename: str, declared: str | None = None) -> str:
+    """Önce içerik, tanınmazsa beyan/uzantı."""
+    return sniff_mime(head, filename) or mime_from_filename(filename, declared)
+
+
+# --- Ses: 16 kHz mono PCM16 ---
+WAV_TYPES = {"audio/wav", "audio/x-wav"}
+EXCEL_TYPES = {XLSX_MIME, XLS_MIME}
+
+def wav_from_pcm16(pcm_bytes: bytes, sr: int = TARGET_SR) -> bytes:
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sr)
+        wf.writeframes(pcm_bytes)
+    return out.getvalue()
+
+
+# --- Upload sonrası arka plan işleme ---
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+
+_media_pool = None
+_media_pool_lock = threading.Lock()
+
+def _get_media_pool():
+    global _media_pool
+    if _media_pool is None:
+        with _media_pool_lock:
+            if _media_pool is None:
+                _media_pool = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+    return _media_pool
+
+def _needs_processing(mime: str) -> bool:
+    if mime in COMPRESSED_AUDIO_TYPES:
+        return ffmpeg_available()  # çözücü yoksa türev üretilemez; orijinal kullanılır
+    return mime in WAV_TYPES or mime in EXCEL_TYPES or mime == "text/csv"
+
+def register_asset(s3_key: str, user_id: int | None, mime: str, size_bytes: int) -> int:
+    """Kaydı oluşturur ve gerekiyorsa işlemeyi arka plan havuzuna atar. Sync; threadpool'da çağrılmalı."""
+    db = SessionLocal()
+    try:
+        asset = MediaAsset(
+            user_id=user_id,
+            s3_key=s3_key,
+            mime=mime,
+            size_bytes=size_bytes,
+            status="pending" if _needs_processing(mime) else "skipped",
+        )
+        db.add(asset)
+        db.commit()
+        asset_id, status = asset.id, asset.status
+    finally:
+        db.close()
+    if status == "pending":
+        _get_media_pool().submit(preprocess_asset, asset_id)
+    return asset_id
+
+def _write_wav_stream(chunks, out) -> int:
+    """16 kHz mono PCM16 parçaları -> out (WAV); yazılan PCM bayt sayısı. Tüm ses bellekte tutulmaz."""
+    n = 0
+    with wave.open(out, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(TARGET_SR)
+        for chunk in chunks:
+            wf.writeframes(chunk)
+            n += len(chunk)
+    return n
+
+def _derive_audio(asset: MediaAsset) -> None:
+    """
+    Ses -> 16 kHz mono PCM16 WAV türevi. WAV PcmConverter ile, sıkıştırılmış formatlar ffmpeg ile
+    parça parça çözülür; türev geçici dosyaya yazılıp S3'e akıtılır.
+    """
+    with open_s3_spooled(asset.s3_key) as f:
+        if asset.mime in WAV_TYPES:
+            with wave.open(f, "rb") as wf:
+                sr, channels, sampwidth, n_frames = (
+                    wf.getframerate(), wf.getnchannels(), wf.getsampwidth(), wf.getnframes()
+                )
+            asset.duration_s = (n_frames / float(sr)) if sr else None
+            asset.sample_rate = sr
+            asset.channels = channels
+            if (sr, channels, sampwidth) == (TARGET_SR, 1, 2):
+                asset.derivative_key = asset.s3_key  # zaten kanonik; kopya tutma
+                asset.derivative_mime = "audio/wav"
+                return
+            f.seek(0)
+            chunks, info = iter_wav_pcm16(f), None
+        else:
+            info = {}
+            chunks = iter_ffmpeg_pcm16(f, asset.mime, info=info)
+
+        key = f"{asset.s3_key}.16k.wav"
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as out:
+            n_bytes = _write_wav_stream(chunks, out)
+            out.seek(0)
+            upload_file_to_s3(out, key, "audio/wav")
+
+    if info is not None:
+        asset.duration_s = n_bytes / (2.0 * TARGET_SR)
+        asset.sample_rate = info.get("sample_rate")
+        asset.channels = info.get("channels")
+    asset.derivative_key = key
+    asset.derivative_mime = "audio/wav"
+
+def spreadsheet_derivative_key(s3_key: str, mode: str = SPREADSHEET_DIGEST_MODE) -> str:
+    return f"{s3_key}.{digest_profile(mode)}.csv"
+
+def _derive_spreadsheet(asset: MediaAsset) -> None:
+    raw = read_file_from_s3(asset.s3_key)
+    csv_text, stats = excel_to_csv_with_stats(raw)
+    if SPREADSHEET_DIGEST_MODE == "stats" or (SPREADSHEET_DIGEST_MODE == "auto" and stats["summary"]):
+        csv_text = excel_stats_digest(raw)  # sohbette kullanılacak metinle aynı
+    asset.row_count = stats["rows"]
+    # türev hangi mod/limitlerle üretildiyse anahtarında taşır; sohbet tarafı eşleşmezse yeniden üretir
+    asset.derivative_key = spreadsheet_derivative_key(asset.s3_key)
+    asset.derivative_mime = "text/csv"
+    put_s3_object(asset.derivative_key, csv_text.encode("utf-8"), "text/csv; charset=utf-8")
+
+def _count_csv_rows(asset: MediaAsset) -> None:
+    """Satır sayısı (başlık hariç, tırnak içi satır sonları ayrıca sayılmaz)."""
+    lines, last = 0, b""
+    with open_s3_spooled(asset.s3_key) as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            lines += chunk.count(b"\n")
+            last = chunk
+    if last and not last.endswith(b"\n"):
+        lines += 1
+    asset.row_count = max(0, lines - 1)
+
+def preprocess_asset(asset_id: int) -> None:
+    db = SessionLocal()
+    try:
+        asset = db.get(MediaAsset, asset_id)
+        if asset is None:
+            return
+        try:
+            if asset.mime in WAV_TYPES or asset.mime in COMPRESSED_AUDIO_TYPES:
+                _derive_audio(asset)
+            elif asset.mime in EXCEL_TYPES:
+                _derive_spreadsheet(asset)
+            elif asset.mime == "text/csv":
+                _count_csv_rows(asset)
+            asset.status = "ready"
+            asset.error = None
+        except Exception as e:
+            print(f"[MEDIA] preprocess failed {asset.s3_key}: {e}")
+            asset.status = "failed"
+            asset.error = str(e)[:500]
+        db.commit()
+        metrics.incr(f"media_preprocess_{asset.status}")
+    except Exception as e:
+        print(f"[MEDIA] preprocess error asset={asset_id}: {e}")
+    finally:
+        db.close()
+
+# s3_key -> {"key", "mime"} (türetilmiş kopya yoksa key=None). Sadece kesinleşmiş
+# (ready/skipped/failed) sonuçlar tutulur; pending kayıtlar her seferinde yeniden sorulur.
+_derivative_cache = LRUCache("media_derivatives", max_items=4096)
+
+def derivative_for(s3_key: str) -> dict | None:
+    """Hazır türetilmiş kopya varsa {"key", "mime"}; yoksa None. DB hatası sessizce None döner."""
+    hit = _derivative_cache.get(s3_key)
+    if hit is None:
+        try:
+            db = SessionLocal()
+            try:
+                asset = db.query(MediaAsset).filter(MediaAsset.s3_key == s3_key).first()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"[MEDIA] derivative lookup failed {s3_key}: {e}")
+            return None
+        if asset is None or asset.status == "pending":
+            return None
+        hit = {"key": asset.derivative_key, "mime": asset.derivative_mime}
+        _derivative_cache.set(s3_key, hit)
+    return dict(hit) if hit["key"] else None
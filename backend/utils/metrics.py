@@ -0,0 +1,19 @@
+import threading
+from collections import defaultdict
+from backend.utils.cache import cache_stats
+
+# Basit süreç içi sayaçlar (dropped segment, bytes saved vb.)
+_counters = defaultdict(float)
+_lock = threading.Lock()
+
+def incr(name: str, n: float = 1) -> None:
+    with _lock:
+        _counters[name] += n
+
+def get(name: str) -> float:
+    return _counters.get(name, 0)
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+    return {"caches": cache_stats(), "counters": counters}
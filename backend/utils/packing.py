@@ -0,0 +1,140 @@
+import os
+import re
+
+from backend.utils import metrics
+
+# Ardışık kısa VAD segmentleri tek Gemini çağrısında birleştirilir (RPM kotası ve çağrı başına
+# sabit maliyet için). Hedef süre 0 -> kapalı (her segment ayrı çağrı).
+TRANSCRIBE_PACK_TARGET_MS = int(os.getenv("TRANSCRIBE_PACK_TARGET_MS", "20000"))
+# Canlı görüşmede gecikme önemli: daha kısa hedef + ilk segmentten sonra en fazla bekleme
+LIVE_PACK_TARGET_MS = int(os.getenv("LIVE_PACK_TARGET_MS", "6000"))
+LIVE_PACK_MAX_WAIT_MS = int(os.getenv("LIVE_PACK_MAX_WAIT_MS", "3000"))
+# Segmentler arasına konan sessizlik (model için ayırıcı)
+TRANSCRIBE_PACK_GAP_MS = int(os.getenv("TRANSCRIBE_PACK_GAP_MS", "400"))
+# Açıksa modelden "[k] ..." satırları istenir ve metin kaynak segmentlere geri dağıtılır
+TRANSCRIBE_PACK_MAP = os.getenv("TRANSCRIBE_PACK_MAP", "0").lower() in ("1", "true", "yes")
+
+
+def ms_to_bytes(ms: int, sample_rate: int = 16000) -> int:
+    """PCM16 mono için süre -> bayt (örnek sınırına hizalı)."""
+    return int(sample_rate * ms / 1000) * 2
+
+
+class PackBuilder:
+    """
+    Segmentler sırayla eklenir; grup süresi (segmentler + aradaki sessizlikler) target_ms'i
+    aşacaksa mevcut grup kapanıp döndürülür. Tek başına hedeften uzun segment kendi grubunda
+    kalır. target_ms <= 0 -> her segment ayrı grup.
+    """
+
+    def __init__(self, target_ms: int = TRANSCRIBE_PACK_TARGET_MS, gap_ms: int = TRANSCRIBE_PACK_GAP_MS,
+                 sample_rate: int = 16000):
+        self.target = ms_to_bytes(target_ms, sample_rate) if target_ms > 0 else 0
+        self.gap = ms_to_bytes(gap_ms, sample_rate)
+        self._cur: list = []
+        self._size = 0
+
+    def add(self, seg) -> list | None:
+        """seg: (start, end, pcm). Kapanan grup varsa onu döndürür."""
+        n = seg[1] - seg[0]
+        done = None
+        if self._cur and (not self.target or self._size + self.gap + n > self.target):
+            done = self.flush()
+        self._size += (self.gap if self._cur else 0) + n
+        self._cur.append(seg)
+        return done
+
+    def flush(self) -> list | None:
+        done, self._cur, self._size = (self._cur or None), [], 0
+        return done
+
+
+def join_pcm(segments, gap_ms: int = TRANSCRIBE_PACK_GAP_MS, sample_rate: int = 16000) -> bytes:
+    """Segment baytlarını aralarına gap_ms sessizlik koyarak tek PCM16 tamponda birleştirir."""
+    if len(segments) == 1:
+        return bytes(segments[0])
+    return (b"\x00" * ms_to_bytes(gap_ms, sample_rate)).join(bytes(x) for x in segments)
+
+
+def pack_layout(spans: list[tuple[int, int]], gap_ms: int = TRANSCRIBE_PACK_GAP_MS,
+                sample_rate: int = 16000) -> list[tuple[float, float]]:
+    """Her segmentin birleştirilmiş ses içindeki (başlangıç, bitiş) saniyesi."""
+    out = []
+    t = 0.0
+    for k, (s, e) in enumerate(spans):
+        if k:
+            t += gap_ms / 1000.0
+        dur = (e - s) / (2.0 * sample_rate)
+        out.append((t, t + dur))
+        t += dur
+    return out
+
+
+def pack_prompt(base: str, layout: list[tuple[float, float]]) -> str:
+    """Eşleme açıkken temel prompt'a parça numaralı çıktı talimatı eklenir."""
+    if len(layout) < 2:
+        return base
+    parts = ", ".join(f"[{k}] {a:.1f}-{b:.1f}s" for k, (a, b) in enumerate(layout, start=1))
+    return (
+        f"{base}\n\nThe audio contains {len(layout)} consecutive parts separated by short silences "
+        f"({parts}). Start each part's transcription on a new line prefixed with its number in "
+        f"square brackets, e.g. \"[2] ...\". Do not add anything else."
+    )
+
+
+# Model satır sonunu atlasa da etiket yakalanır (satır başı veya boşluktan sonra)
+_PART_TAG = re.compile(r"(?:^|(?<=\s))\[(\d+)\]\s*")
+
+def split_pack_text(text: str, n: int) -> tuple[list[str], bool]:
+    """
+    "[k] ..." etiketli parçaları n segmente dağıtır -> (metinler, eşlendi_mi).
+    Etiket yoksa ya da geçersizse tüm metin ilk segmente yazılır (kayıp olmaz).
+    """
+    out = [""] * n
+    tags = list(_PART_TAG.finditer(text or ""))
+    if n < 2 or not tags or any(not (1 <= int(m.group(1)) <= n) for m in tags):
+        out[0] = (text or "").strip() if n else ""
+        if n >= 2:
+            metrics.incr("transcribe_pack_map_misses")
+        return out, n < 2
+    head = text[:tags[0].start()].strip()
+    if head:
+        out[int(tags[0].group(1)) - 1] = head
+    for m, nxt in zip(tags, tags[1:] + [None]):
+        idx = int(m.group(1)) - 1
+        body = text[m.end():nxt.start() if nxt else len(text)].strip()
+        if body:
+            out[idx] = f"{out[idx]} {body}".strip()
+    return out, True
+
+
+def record_call(path: str, audio_s: float, latency_s: float, segments: int = 1, attempts: int = 1) -> None:
+    """Çağrı (pack) başına sayaçlar; path: "direct" | "live"."""
+    metrics.incr(f"transcribe_{path}_calls", attempts)
+    metrics.incr(f"transcribe_{path}_packs")
+    metrics.incr(f"transcribe_{path}_packed_segments", segments)
+    metrics.incr(f"transcribe_{path}_audio_seconds", audio_s)
+    metrics.incr(f"transcribe_{path}_latency_seconds", latency_s)
+
+
+def transcribe_rates() -> dict:
+    """Pack hedefini ayarlamak için: ses dakikası başına istek, ortalama gecikme ve pack doluluğu."""
+    out = {
+        "pack_target_ms": TRANSCRIBE_PACK_TARGET_MS,
+        "live_pack_target_ms": LIVE_PACK_TARGET_MS,
+        "live_pack_max_wait_ms": LIVE_PACK_MAX_WAIT_MS,
+        "pack_gap_ms": TRANSCRIBE_PACK_GAP_MS,
+        "pack_map": TRANSCRIBE_PACK_MAP,
+    }
+    for path in ("direct", "live"):
+        calls = metrics.get(f"transcribe_{path}_calls")
+        packs = metrics.get(f"transcribe_{path}_packs")
+        audio_s = metrics.get(f"transcribe_{path}_audio_seconds")
+        out[path] = {
+            "calls": calls,
+            "audio_minutes": round(audio_s / 60.0, 2),
+            "requests_per_audio_minute": round(calls / (audio_s / 60.0), 3) if audio_s else None,
+            "avg_latency_s": round(metrics.get(f"transcribe_{path}_latency_seconds") / packs, 3) if packs else None,
+            "avg_segments_per_call": round(metrics.get(f"transcribe_{path}_packed_segments") / packs, 2) if packs else None,
+        }
+    return out
@@ -0,0 +1,251 @@
+import os
+import time
+import asyncio
+
+# SOCKETIO_BACKEND=memory (varsayılan, tek worker) | redis (çok worker)
+SOCKETIO_BACKEND = os.getenv("SOCKETIO_BACKEND", "memory").lower()
+# memory://  -> süreç içi Redis uyumlu stand-in (test / tek süreçte çok worker simülasyonu)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PRESENCE_PREFIX = os.getenv("PRESENCE_PREFIX", "cizgitek")
+# SID kayıtlarının ömrü; sahibi olan worker her PRESENCE_HEARTBEAT_S saniyede bir yeniler.
+# Çöken worker'ın kullanıcıları en geç PRESENCE_TTL_S sonra çevrimdışı görünür.
+PRESENCE_TTL_S = int(os.getenv("PRESENCE_TTL_S", "60"))
+PRESENCE_HEARTBEAT_S = float(os.getenv("PRESENCE_HEARTBEAT_S", str(max(1, PRESENCE_TTL_S // 3))))
+
+
+
+class InMemoryPresence:
+    """Tek süreçlik presence: user_id -> SID seti, sid -> user_id. Tümü event loop'ta çalışır."""
+
+    def __init__(self):
+        self._users = {}
+        self._sids = {}
+
+    async def add(self, user_id, sid) -> None:
+        self._users.setdefault(str(user_id), set()).add(sid)
+        self._sids[sid] = str(user_id)
+
+    async def remove(self, sid):
+        uid = self._sids.pop(sid, None)
+        if uid is None:
+            return None
+        sids = self._users.get(uid)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._users[uid]
+        return uid
+
+    async def user_of(self, sid):
+        return self._sids.get(sid)
+
+    async def sids(self, user_id) -> set:
+        return set(self._users.get(str(user_id), ()))
+
+    async def is_online(self, user_id) -> bool:
+        return bool(self._users.get(str(user_id)))
+
+    async def heartbeat(self) -> None:
+        return None
+
+
+class LocalRedis:
+    """
+    redis.asyncio.Redis'in presence'ın kullandığı alt kümesi (string/set, EX/expire, mget,
+    pipeline), süreç içinde. Aynı örneği paylaşan birden çok RedisPresence, ayrı worker'ları
+    simüle eder; clock verilerek TTL süresi testte ileri sarılabilir.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._data = {}   # key -> (value, expires_at | None)
+        self._clock = clock
+
+    def _get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= self._clock():
+            del self._data[key]
+            return None
+        return item[0]
+
+    async def set(self, key, value, ex=None):
+        self._data[key] = (str(value), (self._clock() + ex) if ex else None)
+        return True
+
+    async def get(self, key):
+        v = self._get(key)
+        return v if isinstance(v, str) else None
+
+    async def getdel(self, key):
+        v = await self.get(key)
+        self._data.pop(key, None)
+        return v
+
+    async def delete(self, *keys):
+        return sum(self._data.pop(k, None) is not None for k in keys)
+
+    async def expire(self, key, seconds):
+        v = self._get(key)
+        if v is None:
+            return False
+        self._data[key] = (v, self._clock() + seconds)
+        return True
+
+    async def mget(self, keys):
+        return [await self.get(k) for k in keys]
+
+    async def sadd(self, key, *members):
+        s = self._get(key)
+        if not isinstance(s, set):
+            s = set()
+            self._data[key] = (s, None)
+        n = len(s)
+        s.update(members)
+        return len(s) - n
+
+    async def srem(self, key, *members):
+        s = self._get(key)
+        if not isinstance(s, set):
+            return 0
+        n = len(s)
+        s.difference_update(members)
+        if not s:
+            del self._data[key]
+        return n - len(s)
+
+    async def smembers(self, key):
+        s = self._get(key)
+        return set(s) if isinstance(s, set) else set()
+
+    def pipeline(self, transaction=True):
+        return _LocalPipeline(self)
+
+    async def aclose(self):
+        return None
+
+
+class _LocalPipeline:
+    def __init__(self, r: LocalRedis):
+        self._r = r
+        self._ops = []
+
+    def __getattr__(self, name):
+        fn = getattr(self._r, name)
+
+        def _queue(*args, **kwargs):
+            self._ops.append((fn, args, kwargs))
+            return self
+        return _queue
+
+    async def execute(self):
+        ops, self._ops = self._ops, []
+        return [await fn(*a, **kw) for fn, a, kw in ops]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._ops = []
+
+
+class RedisPresence:
+    """
+    Redis (veya Redis uyumlu: valkey, dragonfly, ...) üzerinden paylaşılan presence; redis.asyncio
+    ile event loop'u bloklamaz. SID kayıtları TTL'lidir ve sadece sahibi olan worker tarafından
+    yenilenir; kullanıcı setinde ömrü dolmuş SID'ler okunurken ayıklanır.
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = PRESENCE_PREFIX, client=None,
+                 ttl: int = PRESENCE_TTL_S):
+        if client is None:
+            if url.startswith("memory://"):
+                client = LocalRedis()
+            else:
+                import redis.asyncio as aioredis  # opsiyonel bağımlılık: pip install redis
+                client = aioredis.Redis.from_url(url, decode_responses=True)
+        self.r = client
+        self.p = prefix
+        self.ttl = ttl
+        self._local = {}  # bu worker'a bağlı sid -> user_id (heartbeat ile yenilenir)
+
+    def _u(self, user_id) -> str:
+        return f"{self.p}:presence:user:{user_id}"
+
+    def _s(self, sid) -> str:
+        return f"{self.p}:presence:sid:{sid}"
+
+    async def add(self, user_id, sid) -> None:
+        self._local[sid] = str(user_id)
+        async with self.r.pipeline(transaction=False) as pipe:
+            pipe.sadd(self._u(user_id), sid)
+            pipe.expire(self._u(user_id), self.ttl)
+            pipe.set(self._s(sid), str(user_id), ex=self.ttl)
+            await pipe.execute()
+
+    async def remove(self, sid):
+        self._local.pop(sid, None)
+        uid = await self.r.getdel(self._s(sid))
+        if uid is None:
+            return None
+        await self.r.srem(self._u(uid), sid)
+        return uid
+
+    async def user_of(self, sid):
+        return await self.r.get(self._s(sid))
+
+    async def sids(self, user_id) -> set:
+        members = list(await self.r.smembers(self._u(user_id)))
+        if not members:
+            return set()
+        alive = await self.r.mget([self._s(s) for s in members])
+        dead = [s for s, v in zip(members, alive) if v is None]
+        if dead:
+            await self.r.srem(self._u(user_id), *dead)  # çöken worker'dan kalanlar
+        return {s for s, v in zip(members, alive) if v is not None}
+
+    async def is_online(self, user_id) -> bool:
+        return bool(await self.sids(user_id))
+
+    async def heartbeat(self) -> None:
+        if not self._local:
+            return
+        async with self.r.pipeline(transaction=False) as pipe:
+            for sid, uid in self._local.items():
+                pipe.expire(self._s(sid), self.ttl)
+                pipe.expire(self._u(uid), self.ttl)
+            await pipe.execute()
+
+
+async def run_heartbeat(presence, interval: float = PRESENCE_HEARTBEAT_S) -> None:
+    """Startup'ta başlatılır; bu worker'ın SID kayıtlarının TTL'ini yeniler."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await presence.heartbeat()
+        except Exception as e:
+            print(f"[PRESENCE][HEARTBEAT][ERR] {e}")
+
+
+def make_presence():
+    if SOCKETIO_BACKEND == "redis":
+        return RedisPresence()
+    return InMemoryPresence()
+
+
+def make_client_manager():
+    """
+    Socket.IO client manager. redis modunda emit'ler pub/sub ile tüm worker'lara
+    dağıtılır; HTTP isteğini hangi worker işlerse işlesin doğru odaya ulaşır.
+
+    DAĞITIM ŞARTI (çok worker): load balancer sticky session ile çalışmalı (ör. nginx
+    ip_hash, ya da istemci transports=["websocket"] ile bağlanmalı). Redis manager sadece
+    emit'leri dağıtır; bir sid'in gelen olaylarını (pcm_begin/pcm_chunk/pcm_end) başka
+    worker'a taşımaz. pcm_states worker-yereldir ve sahiplik kaydı tutulmaz: sticky
+    olmayan bir kurulumda polling istekleri farklı worker'lara düşer, pcm_chunk'lar
+    pcm_begin'i görmemiş worker'da sessizce atılır.
+    """
+    if SOCKETIO_BACKEND == "redis" and not REDIS_URL.startswith("memory://"):
+        import socketio
+        return socketio.AsyncRedisManager(REDIS_URL, channel=f"{PRESENCE_PREFIX}:socketio")
+    return None
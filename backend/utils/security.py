@@ -1,9 +1,27 @@
 import os
 import json
+import copy
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.fernet import Fernet
+from backend.utils.cache import LRUCache
 
 fernet = Fernet(os.getenv("FERNET_KEY"))
 
+# Çözülmüş mesaj cache'i (sadece bellekte, plaintext diske yazılmaz)
+DECRYPT_CACHE_MAX_ITEMS = int(os.getenv("DECRYPT_CACHE_MAX_ITEMS", "5000"))
+DECRYPT_CACHE_TTL = float(os.getenv("DECRYPT_CACHE_TTL", "0"))  # 0 -> süresiz
+DECRYPT_CACHE_MAX_BYTES = int(os.getenv("DECRYPT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+decrypt_cache = LRUCache(
+    "decrypt",
+    max_items=DECRYPT_CACHE_MAX_ITEMS,
+    ttl=DECRYPT_CACHE_TTL,
+    max_bytes=DECRYPT_CACHE_MAX_BYTES,
+    sizeof=lambda v: v[1],
+)
+
 def encrypt_message(messages):
     if isinstance(messages, str):
         messages = {"text": messages}
@@ -11,8 +29,7 @@ def encrypt_message(messages):
     cipher = fernet.encrypt(raw)
     return cipher.decode("utf-8")
 
-def decrypt_message(cipher_text):
-    raw = fernet.decrypt(cipher_text.encode("utf-8"))
+def _normalize(raw: bytes):
     try:
         data = json.loads(raw)
     except Exception:
@@ -27,3 +44,99 @@ def decrypt_message(cipher_text):
         return [{"text": data}]
     else:
         return []
+
+def decrypt_message(cipher_text):
+    raw = fernet.decrypt(cipher_text.encode("utf-8"))
+    return _normalize(raw)
+
+def decrypt_message_cached(cipher_text, cache_key=None):
+    """
+    decrypt_message ile aynı çıktı, ama (cache_key, ciphertext hash) ile LRU cache'lenir.
+    cache_key örn. ("msg", message.id) / ("sessionlog", row.id). Ciphertext değişirse
+    hash de değişir, eski kayıt kendiliğinden geçersiz olur.
+    """
+    digest = hashlib.blake2b(cipher_text.encode("utf-8"), digest_size=16).digest()
+    key = (cache_key, digest)
+    hit = decrypt_cache.get(key)
+    if hit is None:
+        raw = fernet.decrypt(cipher_text.encode("utf-8"))
+        hit = (_normalize(raw), len(raw))
+        decrypt_cache.set(key, hit)
+    # çağıranlar listeyi/dict'leri değiştirirse cache bozulmasın
+    return [dict(x) if isinstance(x, dict) else x for x in hit[0]]
+
+# Toplu şifreleme/çözme: büyük listeler thread havuzuna dağıtılır
+# (cryptography primitifleri GIL'i bırakır), sıra korunur.
+CRYPTO_PARALLEL_MIN = int(os.getenv("CRYPTO_PARALLEL_MIN", "256"))
+CRYPTO_WORKERS = int(os.getenv("CRYPTO_WORKERS", str(min(8, (os.cpu_count() or 2)))))
+CRYPTO_CHUNK = int(os.getenv("CRYPTO_CHUNK", "128"))
+
+_crypto_pool = None
+_crypto_pool_lock = threading.Lock()
+
+def _get_crypto_pool():
+    global _crypto_pool
+    if _crypto_pool is None:
+        with _crypto_pool_lock:
+            if _crypto_pool is None:
+                _crypto_pool = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix="crypto")
+    return _crypto_pool
+
+def _run_batched(fn, items: list) -> list:
+    """fn'i her elemana uygular; sonuç listesi girişle aynı sırada."""
+    if len(items) < CRYPTO_PARALLEL_MIN or CRYPTO_WORKERS <= 1:
+        return [fn(x) for x in items]
+    chunks = [items[i:i + CRYPTO_CHUNK] for i in range(0, len(items), CRYPTO_CHUNK)]
+    out = []
+    for part in _get_crypto_pool().map(lambda ch: [fn(x) for x in ch], chunks):
+        out.extend(part)
+    return out
+
+def decrypt_many(cipher_texts, cache_keys=None, fallback=None):
+    """
+    Çok sayıda ciphertext'i sırayı koruyarak çözer.
+    Dönüş: (sonuçlar, hatalar). Hatalı elemanın yerine `fallback`ın kopyası konur
+    (ör. fallback=[] her satıra ayrı liste verir), hatalar {index: exception} olarak
+    döner; batch yarıda kesilmez.
+    cache_keys verilirse decrypt_message_cached kullanılır.
+    """
+    cipher_texts = list(cipher_texts)
+    keys = list(cache_keys) if cache_keys is not None else [None] * len(cipher_texts)
+
+    def _one(pair):
+        ct, key = pair
+        try:
+            if key is not None:
+                return True, decrypt_message_cached(ct, key)
+            return True, decrypt_message(ct)
+        except Exception as e:
+            return False, e
+
+    results, errors = [], {}
+    for i, (ok, val) in enumerate(_run_batched(_one, list(zip(cipher_texts, keys)))):
+        if ok:
+            results.append(val)
+        else:
+            results.append(copy.copy(fallback))
+            errors[i] = val
+    return results, errors
+
+def encrypt_many(payloads, fallback=None):
+    """
+    encrypt_message'ın toplu hali; sıra korunur.
+    Dönüş: (sonuçlar, hatalar), decrypt_many ile aynı sözleşme.
+    """
+    def _one(payload):
+        try:
+            return True, encrypt_message(payload)
+        except Exception as e:
+            return False, e
+
+    results, errors = [], {}
+    for i, (ok, val) in enumerate(_run_batched(_one, list(payloads))):
+        if ok:
+            results.append(val)
+        else:
+            results.append(copy.copy(fallback))
+            errors[i] = val
+    return results, errors
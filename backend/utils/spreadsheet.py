@@ -0,0 +1,314 @@
+import io
+import os
+import csv
+import itertools
+import datetime as _dt
+
+import pandas as pd  # pip install pandas openpyxl eğer yoksa, yaptım ben 
+
+MAX_ROWS_PER_SHEET = int(os.getenv("CSV_MAX_ROWS_PER_SHEET", "2000"))
+MAX_CSV_BYTES      = int(os.getenv("CSV_MAX_BYTES", "400000"))  # ~400 KB
+CSV_PREVIEW_ROWS   = int(os.getenv("CSV_PREVIEW_ROWS", "50"))
+
+# Digest modu: csv (satırlar / önizleme özeti), stats (kolon istatistikleri),
+# auto (sığarsa csv, sığmazsa önizleme yerine stats)
+SPREADSHEET_DIGEST_MODE = os.getenv("SPREADSHEET_DIGEST_MODE", "auto")
+STATS_MAX_ROWS     = int(os.getenv("SPREADSHEET_STATS_MAX_ROWS", "200000"))
+STATS_TOP_VALUES   = int(os.getenv("SPREADSHEET_STATS_TOP_VALUES", "5"))
+STATS_PREVIEW_ROWS = int(os.getenv("SPREADSHEET_STATS_PREVIEW_ROWS", "5"))
+
+EXCEL_EXTS = (".xlsx", ".xls")
+CSV_EXTS   = (".csv",)
+
+def is_excel_filename(fn: str) -> bool:
+    fn = (fn or "").lower()
+    return fn.endswith(EXCEL_EXTS)
+
+def is_csv_filename(fn: str) -> bool:
+    fn = (fn or "").lower()
+    return fn.endswith(CSV_EXTS)
+
+def excel_bytes_to_csv_text(raw: bytes) -> str:
+    """
+    Excel'i (çok sayfalı olabilir) CSV metnine çevirir.
+    Büyük dosyalar için satır kısma ve toplam byte limiti uygular;
+    hala çok büyükse özet moda düşer (kolonlar+dtypes+ilk N satır).
+    """
+    return excel_to_csv_with_stats(raw)[0]
+
+def _dtype_of(values: list) -> str:
+    """Önizleme değerlerinden pandas benzeri dtype adı (özet modu için)."""
+    kinds = {type(v) for v in values if v is not None}
+    if not kinds:
+        return "object"
+    if kinds <= {bool}:
+        return "bool"
+    if kinds <= {int}:
+        return "float64" if None in values else "int64"  # boş hücreli tamsayı kolonu -> float
+    if kinds <= {int, float}:
+        return "float64"
+    if kinds <= {_dt.datetime, _dt.date}:
+        return "datetime64[ns]"
+    return "object"
+
+class _SheetDigest:
+    """Bir sayfanın başlığı, önizlemesi ve (bütçe içindeyse) CSV gövdesi."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.header = None
+        self.preview = []
+        self.rows = 0          # CSV'ye yazılan veri satırı
+        self.total = None      # biliniyorsa toplam veri satırı
+        self.truncated = False
+        self.out = io.StringIO()
+        self._line = io.StringIO()
+        self._line_writer = csv.writer(self._line, lineterminator="\n")
+
+    def write(self, row) -> int:
+        """Satırı CSV'ye ekler; UTF-8 byte boyunu döner (bütçe takibi için)."""
+        self._line.seek(0)
+        self._line.truncate()
+        self._line_writer.writerow(row)
+        line = self._line.getvalue()
+        self.out.write(line)
+        return len(line.encode("utf-8"))
+
+    def note(self) -> str:
+        if not self.truncated:
+            return f"# Sheet: {self.name}\n"
+        of = f" of {self.total}" if self.total is not None else ""
+        return f"# Sheet: {self.name} (truncated to first {self.rows} rows{of})\n"
+
+    def summary(self) -> str:
+        cols = list(self.header or [])
+        dtypes = {c: _dtype_of([r[i] if i < len(r) else None for r in self.preview]) for i, c in enumerate(cols)}
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator="\n")
+        w.writerow(cols)
+        w.writerows(self.preview)
+        return (
+            f"# Sheet: {self.name}\n"
+            f"Columns ({len(cols)}): {cols}\n"
+            f"Dtypes: {dtypes}\n"
+            f"Preview (first {CSV_PREVIEW_ROWS} rows):\n{buf.getvalue()}"
+        )
+
+def _iter_xlsx_sheets(src):
+    """openpyxl read-only: sayfalar ve satırlar tembel okunur (tüm sayfa belleğe alınmaz)."""
+    from openpyxl import load_workbook
+    wb = load_workbook(src, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            max_row = ws.max_row  # <dimension> etiketinden; yoksa None
+            total = max(0, max_row - 1) if max_row else None
+            yield ws.title, total, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+def _iter_legacy_sheets(src, limit: int):
+    """.xls (xlrd): satır akışı yok; pandas nrows ile en fazla limit+1 satır DataFrame'e alınır."""
+    xls = pd.ExcelFile(src)
+    for name in xls.sheet_names:
+        df = xls.parse(name, nrows=limit + 1)
+        total = None
+        try:
+            total = max(0, xls.book.sheet_by_name(name).nrows - 1)
+        except Exception:
+            pass
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        yield name, total, iter([tuple(df.columns)] + list(rows))
+
+def excel_to_csv_with_stats(raw) -> tuple[str, dict]:
+    """
+    excel_bytes_to_csv_text + istatistik. raw: bytes ya da dosya nesnesi.
+    Satırlar akış halinde okunur: sayfa başına MAX_ROWS_PER_SHEET satırda, toplamda
+    MAX_CSV_BYTES'ta okuma durur. Bütçe aşılırsa kalan sayfalardan sadece başlık +
+    önizleme okunur ve çıktı özet moduna geçer.
+    stats: {"sheets", "rows" (bilinmiyorsa None), "truncated", "summary"}
+    """
+    src = io.BytesIO(raw) if isinstance(raw, (bytes, bytearray)) else raw
+    try:
+        sheets = _iter_xlsx_sheets(src)
+        first = next(sheets, None)
+    except Exception:
+        src.seek(0)
+        try:
+            sheets = _iter_legacy_sheets(src, MAX_ROWS_PER_SHEET)
+            first = next(sheets, None)
+        except Exception as e:
+            # CSV gelmiş olabilir: fallback utf-8 decode
+            if not isinstance(raw, (bytes, bytearray)):
+                raise e
+            return raw.decode("utf-8", errors="replace"), {"sheets": 0, "rows": None, "truncated": False, "summary": False}
+
+    digests = []
+    budget_left = MAX_CSV_BYTES
+    over_budget = False
+    for name, total, rows in itertools.chain([first] if first else [], sheets):
+        d = _SheetDigest(name)
+        d.total = total
+        digests.append(d)
+        for row in rows:
+            if d.header is None:
+                d.header = list(row)
+                if not over_budget:
+                    budget_left -= d.write(d.header) + len(d.note().encode("utf-8"))
+                continue
+            if all(v is None for v in row):
+                continue
+            if len(d.preview) < CSV_PREVIEW_ROWS:
+                d.preview.append(list(row))
+            if over_budget:
+                if len(d.preview) >= CSV_PREVIEW_ROWS:
+                    break  # özet modu: önizleme yeterli
+                continue
+            if d.rows >= MAX_ROWS_PER_SHEET:
+                d.truncated = True
+                break
+            budget_left -= d.write(row)
+            d.rows += 1
+            if budget_left < 0:
+                over_budget = True
+                if len(d.preview) >= CSV_PREVIEW_ROWS:
+                    break
+
+    known = [d.total for d in digests]
+    stats = {
+        "sheets": len(digests),
+        "rows": sum(known) if all(t is not None for t in known) else None,
+        "truncated": over_budget or any(d.truncated for d in digests),
+        "summary": over_budget,
+    }
+
+    if not over_budget:
+        return "\n\n".join(d.note() + d.out.getvalue() for d in digests), stats
+
+    # Byte limiti aşıldı: özet moduna geç
+    csv_all = (
+        "Dataset is large, sending a compact summary instead.\n"
+        "If you need specific filters or columns, ask and I will provide a focused slice.\n\n"
+        + "\n\n".join(d.summary() for d in digests)
+    )
+    return csv_all, stats
+
+
+def csv_bytes_to_text(raw: bytes) -> str:
+    """CSV; MAX_CSV_BYTES'ı aşıyorsa sadece başlık + ilk CSV_PREVIEW_ROWS satır."""
+    too_big = len(raw) > MAX_CSV_BYTES  # tekrar encode etmeden byte boyutu
+    # büyükse önizleme için baştaki limit kadarını çözmek yeterli
+    csv_text = (raw[:MAX_CSV_BYTES] if too_big else raw).decode("utf-8", errors="replace")
+    if not too_big:
+        return csv_text
+    rows, header = [], None
+    for i, row in enumerate(csv.reader(io.StringIO(csv_text))):
+        if i == 0:
+            header = row
+        if i <= CSV_PREVIEW_ROWS:
+            rows.append(row)
+        else:
+            break
+    return (
+        "CSV is large, sending header and a small preview.\n"
+        f"Header: {header}\n"
+        f"Preview (first {CSV_PREVIEW_ROWS} rows):\n" +
+        "\n".join([",".join(r) for r in rows])
+    )
+
+def _fmt(v) -> str:
+    if isinstance(v, float):
+        return f"{v:.6g}"
+    return str(v)
+
+def dataframe_stats(df: pd.DataFrame, title: str, total_rows: int | None) -> str:
+    """
+    Kolon başına istatistik (vektörel: describe/nunique/notna tüm kolonlar için tek seferde).
+    Sayısal: min/p25/p50/p75/max/mean/std; tarih: min/max; diğer: en sık değerler.
+    """
+    df = df.infer_objects()
+    # CSV'den metin olarak gelen ISO tarih kolonları
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        sample = df[col].dropna().head(20).astype(str)
+        if len(sample) and sample.str.match(r"^\d{4}-\d{2}-\d{2}").all():
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    n = len(df)
+    scope = f"{n} rows" if total_rows is None or total_rows <= n else f"first {n} of {total_rows} rows"
+    nonnull = df.notna().sum()
+    nunique = df.nunique(dropna=True)
+    num = df.select_dtypes(include="number")
+    desc = num.describe().T if not num.empty else None
+    dates = df.select_dtypes(include="datetime")
+    dmin, dmax = (dates.min(), dates.max()) if not dates.empty else (None, None)
+
+    lines = [f"# {title} (stats over {scope})", f"Columns ({len(df.columns)}):"]
+    for col in df.columns:
+        head = f"- {col} [{df[col].dtype}] non-null={int(nonnull[col])} unique={int(nunique[col])}"
+        if desc is not None and col in desc.index:
+            d = desc.loc[col]
+            head += (
+                f" min={_fmt(d['min'])} p25={_fmt(d['25%'])} p50={_fmt(d['50%'])}"
+                f" p75={_fmt(d['75%'])} max={_fmt(d['max'])} mean={_fmt(d['mean'])} std={_fmt(d['std'])}"
+            )
+        elif dmin is not None and col in dates.columns:
+            head += f" min={dmin[col]} max={dmax[col]}"
+        else:
+            top = df[col].value_counts(dropna=True).head(STATS_TOP_VALUES)
+            if len(top):
+                head += " top: " + ", ".join(f"{k!s} ({int(c)})" for k, c in top.items())
+        lines.append(head)
+    preview = df.head(STATS_PREVIEW_ROWS).to_csv(index=False)
+    lines.append(f"Preview (first {STATS_PREVIEW_ROWS} rows):\n{preview}")
+    return "\n".join(lines)
+
+_STATS_HEADER = (
+    "Dataset is large, sending per-column statistics instead of rows.\n"
+    "If you need specific filters or columns, ask and I will provide a focused slice.\n\n"
+)
+
+def excel_stats_digest(raw) -> str:
+    """Her sayfanın ilk STATS_MAX_ROWS satırı DataFrame'e alınır (tam sayfa değil)."""
+    src = io.BytesIO(raw) if isinstance(raw, (bytes, bytearray)) else raw
+    try:
+        sheets = _iter_xlsx_sheets(src)
+        first = next(sheets, None)
+    except Exception:
+        src.seek(0)
+        sheets = _iter_legacy_sheets(src, STATS_MAX_ROWS)
+        first = next(sheets, None)
+    parts = []
+    for name, total, rows in itertools.chain([first] if first else [], sheets):
+        header = next(rows, None)
+        if header is None:
+            continue
+        cols = [c if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        records = [r for r in itertools.islice(rows, STATS_MAX_ROWS) if any(v is not None for v in r)]
+        cut = next(rows, None) is not None  # STATS_MAX_ROWS'ta kesildi mi
+        df = pd.DataFrame.from_records(records, columns=cols) if records else pd.DataFrame(columns=cols)
+        parts.append(dataframe_stats(df, f"Sheet: {name}", total if cut else None))
+    return _STATS_HEADER + "\n\n".join(parts)
+
+def csv_stats_digest(raw: bytes) -> str:
+    df = pd.read_csv(io.BytesIO(raw), nrows=STATS_MAX_ROWS, encoding_errors="replace")
+    total = None
+    if len(df) >= STATS_MAX_ROWS:
+        total = max(len(df), raw.count(b"\n") - 1)  # yaklaşık (tırnak içi satır sonları hariç)
+    return _STATS_HEADER + dataframe_stats(df, "CSV", total)
+
+def render_spreadsheet(filename: str, raw, mode: str = SPREADSHEET_DIGEST_MODE) -> str:
+    """Excel/CSV -> modele gönderilecek metin (csv / stats / auto)."""
+    is_excel = is_excel_filename(filename)
+    if mode == "stats":
+        return excel_stats_digest(raw) if is_excel else csv_stats_digest(raw)
+    if is_excel:
+        text, stats = excel_to_csv_with_stats(raw)
+        if mode == "auto" and stats["summary"]:
+            if hasattr(raw, "seek"):
+                raw.seek(0)
+            return excel_stats_digest(raw)
+        return text
+    if mode == "auto" and len(raw) > MAX_CSV_BYTES:
+        try:
+            return csv_stats_digest(raw)
+        except Exception as e:
+            print(f"[SPREADSHEET] CSV stats failed, falling back to preview: {e}")
+    return csv_bytes_to_text(raw)
@@ -0,0 +1,49 @@
+import os
+import hashlib
+
+from backend.models import TranscriptCache
+from backend.utils.db_cache import EncryptedDbCache
+from backend.utils import metrics
+
+# Aynı ses + prompt + model için transkripsiyon sonucu (yeniden yükleme, ağ hatası sonrası
+# tekrar, aynı S3 dosyasının yeniden yazıya dökülmesi). 0 -> kapalı.
+TRANSCRIPT_CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE", "1").lower() not in ("0", "false", "no")
+# Kayıt ömrü (saniye); 0 -> süresiz
+TRANSCRIPT_CACHE_TTL_S = int(os.getenv("TRANSCRIPT_CACHE_TTL_S", str(30 * 24 * 3600)))
+# Kalıcı katman (DB, şifreli) toplam boyut limiti; aşılınca en eski kullanılanlar silinir
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Süreç içi ön katman (plaintext sadece bellekte)
+TRANSCRIPT_CACHE_MEMORY_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MEMORY_BYTES", str(8 * 1024 * 1024)))
+
+_cache = EncryptedDbCache(
+    "transcripts",
+    TranscriptCache,
+    key_column="cache_key",
+    metric_prefix="transcript_cache",
+    log_tag="TRANSCRIPT-CACHE",
+    max_bytes=TRANSCRIPT_CACHE_MAX_BYTES,
+    memory_bytes=TRANSCRIPT_CACHE_MEMORY_BYTES,
+    memory_items=4096,
+    ttl_s=TRANSCRIPT_CACHE_TTL_S,
+)
+
+def audio_sha256(data) -> str:
+    """Kanonik (16 kHz mono PCM16) ses baytlarının özeti."""
+    return hashlib.sha256(memoryview(data).cast("B")).hexdigest()
+
+def cache_key(audio_hash: str, prompt: str, model: str) -> str:
+    return hashlib.sha256(f"{audio_hash}\0{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+def lookup(key: str) -> str | None:
+    """Bellek -> DB. Sync; event loop'tan asyncio.to_thread ile çağrılmalı. Hatalar None döner."""
+    if not TRANSCRIPT_CACHE_ENABLED:
+        return None
+    text = _cache.get(key)
+    metrics.incr("transcript_cache_hits" if text is not None else "transcript_cache_misses")
+    return text
+
+def store(key: str, model: str, text: str) -> None:
+    """Boş/hatalı sonuçlar çağıran tarafta elenir. Sync; DB hataları yutulur."""
+    if not TRANSCRIPT_CACHE_ENABLED or not text:
+        return
+    _cache.put(key, text, model=model)
@@ -0,0 +1,269 @@
+import re
+from collections import Counter
+
+from backend.utils import metrics
+
+# --- Normalizasyon: model çıktısındaki etiket/yorum/biçim artıklarını temizler ---
+# Tüm kurallar tek bir derlenmiş desende; metin tek re.sub geçişiyle işlenir. Satır bazlı
+# kurallar (kod bloğu, madde işareti, rol etiketi, yorum satırı) satır başına bağlıdır.
+# Hiçbir kural satır sonunu aşmaz (boşluk sınıfı \n hariç); böylece metnin sonucu satırların
+# sonuçlarının birleşimidir ve TranscriptStream parça parça aynı sonucu üretebilir.
+
+_S = r"[^\S\n]"
+_TAG = r"\[[^\]\n]+\]"
+# Satır başında köşeli etiketler boşluk sayılır ("- [music] The audio ..." da yorum satırıdır)
+_WS = rf"(?:{_S}|{_TAG})"
+_ROLE = rf"(?:speaker{_S}*\d+|user|assistant|agent|model){_S}*:"
+_LINE_PREFIX = rf"^{_WS}*(?:[-*•](?:{_WS}+|$))?(?:{_ROLE}{_WS}*)?"
+_COMMENT_LINE = rf"""
+    (?:the{_S}+)?audio\b
+  | no{_S}+(?:\w+{_S}+)*speech
+  | background{_S}+noise
+  | only{_S}+noise
+  | (?:typing|beep|ringing|music)\b
+"""
+_NOISE_PHRASE = rf"""
+    no{_WS}+(?:clear|discernible)?{_WS}*speech(?:{_WS}+detected)?
+  | background{_WS}+noise
+  | (?:the{_WS}+)?audio(?:{_WS}+primarily)?{_WS}+contains(?:{_WS}+only)?{_WS}+(?:noise|sounds?)
+  | typing{_WS}+sounds?
+  | beep(?:ing)?
+  | high(?:-|{_WS})?pitched{_WS}+(?:tone|ringing|beep)
+  | sound(?:s)?{_WS}+of{_WS}+(?:a{_WS})?(?:machine|device|vehicle|vehicles)
+  | music{_WS}+only
+"""
+_NORMALIZE = re.compile(
+    rf"""
+      (?P<fence>^{_S}*```[^\n]*$|```{_S}*$)               # kod bloğu satırı / kapanışı
+    | (?P<comment>{_LINE_PREFIX}(?:{_COMMENT_LINE}).*$)  # "the audio contains..." gibi satırlar
+    | (?P<prefix>{_LINE_PREFIX})                            # etiket / madde işareti / rol etiketi
+    | (?P<tag>{_TAG})                                       # [music], [no clear speech] ...
+    | \b(?P<noise>{_NOISE_PHRASE})\b                         # cümle içi gürültü ifadeleri (araya etiket girebilir)
+    """,
+    re.IGNORECASE | re.MULTILINE | re.VERBOSE,
+)
+_PUNCT_ONLY = frozenset("-–—•.,;:!?()[]{}")
+
+
+def normalize_transcript(text: str | None) -> str:
+    """Model çıktısı -> tek satır düz metin. Sadece noktalama kalırsa boş string."""
+    s = _NORMALIZE.sub(" ", text or "")
+    s = " ".join(s.split())
+    if not s or all(ch in _PUNCT_ONLY for ch in s):
+        return ""
+    return s
+
+
+# --- Akış halinde normalizasyon ---
+# Satır başı kararı (kod bloğu / yorum satırı mı, önek nerede bitiyor) için satırın yorum
+# başlığına hâlâ tamamlanabilir olup olmadığı: _HEAD_OPEN tam eşleşiyorsa karar beklenir.
+
+def _partial(word: str) -> str:
+    """word'ün herhangi bir öneki (boş dahil)."""
+    out = ""
+    for ch in reversed(word):
+        out = f"(?:{re.escape(ch)}{out})?"
+    return out
+
+
+_OPEN_TAG = r"\[[^\]\n]*"
+_ROLE_OPEN = "|".join(
+    [_partial("speaker"), rf"speaker{_S}*\d*", rf"speaker{_S}*\d+{_S}*"]
+    + [f"{_partial(w)}|{w}{_S}*" for w in ("user", "assistant", "agent", "model")]
+)
+_COMMENT_OPEN = "|".join([
+    _partial("the"), rf"the{_S}+{_partial('audio')}", _partial("audio"),
+    _partial("no"), rf"no{_S}+(?:\w+{_S}+)*\w*",
+    _partial("background"), rf"background{_S}+{_partial('noise')}",
+    _partial("only"), rf"only{_S}+{_partial('noise')}",
+    _partial("typing"), _partial("beep"), _partial("ringing"), _partial("music"),
+])
+_HEAD_OPEN = re.compile(
+    rf"""
+      {_S}*`{{1,2}}
+    | {_WS}*(?:
+          {_OPEN_TAG}
+        | [-*•]{_WS}*(?:{_OPEN_TAG})?
+        | (?:[-*•]{_WS}+)?(?:{_ROLE_OPEN}|{_ROLE}{_WS}*(?:{_OPEN_TAG}|{_COMMENT_OPEN})|{_COMMENT_OPEN})
+      )
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+_FENCE_HEAD = re.compile(rf"{_S}*```")
+_COMMENT_HEAD = re.compile(rf"{_LINE_PREFIX}(?:{_COMMENT_LINE})", re.IGNORECASE | re.VERBOSE)
+_PREFIX_HEAD = re.compile(_LINE_PREFIX, re.IGNORECASE)
+# Kelime: köşeli etiketler (içindeki boşluklarla) kelimenin parçasıdır; sadece etiketten
+# oluşan kelimeler bekletme sayımına girmez (gürültü ifadelerinin arasına etiket girebilir)
+_TOKEN = re.compile(r"(?:\[[^\]\n]*\]|\[(?![^\]\n]*\])|[^\s\[])+")
+_TAG_ONLY = re.compile(rf"(?:{_TAG})+")
+
+# En uzun satır içi gürültü ifadesi 6 kelime (aradaki etiketler hariç); karar için sonrasında
+# en az bu kadar kelime görülmeli
+_HOLD_TOKENS = 8
+
+
+class TranscriptStream:
+    """
+    Akış halinde gelen model çıktısı için normalize_transcript. feed() parçaları alır, kesinleşen
+    temiz metni döndürür; flush() kalanı verir. Çıktıların birleşimi tüm metnin
+    normalize_transcript sonucuyla aynıdır. Tamponda yalnız kararı henüz verilemeyen kısım
+    kalır: yorum/kod bloğu olabilecek satır başı, kapanmamış [etiket] ve son birkaç kelime.
+    """
+
+    def __init__(self):
+        self._line = ""       # mevcut satır (satır sonu hariç)
+        self._pos = 0         # _line içinde işlenmiş kısım
+        self._mode = "head"   # head: satır başı kararsız | body: satır içi | drop: satır atılıyor
+        self._started = False
+        self._held = None     # ilk kelime sadece noktalamaysa metin devam edene kadar bekletilir
+
+    def feed(self, text: str) -> str:
+        out = []
+        *lines, rest = (text or "").split("\n")
+        for line in lines:
+            self._line += line
+            self._finish_line(out)
+        self._line += rest
+        self._advance(out)
+        return "".join(out)
+
+    def flush(self) -> str:
+        out = []
+        self._finish_line(out)
+        self._held = None  # metin tek noktalama kelimesinden ibaretmiş
+        return "".join(out)
+
+    def _put(self, tokens, out) -> None:
+        if not tokens:
+            return
+        if not self._started:
+            if self._held is not None:
+                tokens = [self._held, *tokens]
+                self._held = None
+            elif len(tokens) == 1 and all(ch in _PUNCT_ONLY for ch in tokens[0]):
+                self._held = tokens[0]
+                return
+            self._started = True
+            out.append(" ".join(tokens))
+        else:
+            out.append(" " + " ".join(tokens))
+
+    def _sub(self, end: int) -> list[str]:
+        """_line[_pos:end] (end'i aşan eşleşme yok) -> kelimeler."""
+        line, pos, parts = self._line, self._pos, []
+        for m in _NORMALIZE.finditer(line, pos):
+            if m.start() >= end:
+                break
+            parts.append(line[pos:m.start()])
+            pos = m.end()
+        parts.append(line[pos:end])
+        return " ".join(parts).split()
+
+    def _finish_line(self, out) -> None:
+        if self._mode == "head":
+            self._put(_NORMALIZE.sub(" ", self._line).split(), out)
+        elif self._mode == "body":
+            self._put(self._sub(len(self._line)), out)
+        self._line, self._pos, self._mode = "", 0, "head"
+
+    def _advance(self, out) -> None:
+        line = self._line
+        if self._mode == "head":
+            if _FENCE_HEAD.match(line):
+                self._mode = "drop"
+            else:
+                m = _COMMENT_HEAD.match(line)
+                if m and m.end() < len(line):
+                    self._mode = "drop"
+                elif m or _HEAD_OPEN.fullmatch(line):
+                    return
+                else:
+                    self._mode = "body"
+                    self._pos = _PREFIX_HEAD.match(line).end()
+        if self._mode == "drop":
+            self._line = ""
+            return
+        cut = self._safe_cut()
+        if cut > self._pos:
+            self._put(self._sub(cut), out)
+            # \b için bir önceki karakter yeterli; işlenen kısım atılır
+            self._line, self._pos = self._line[cut - 1:], 1
+
+    def _safe_cut(self) -> int:
+        """Öncesindeki hiçbir kuralın sonucu sonraki metne bağlı olmayan en büyük kelime başı."""
+        line, pos = self._line, self._pos
+        end = len(line)
+        i = line.find("[", pos)
+        while i != -1:
+            if line[i + 1:i + 2] != "]" and line.find("]", i + 2) == -1:
+                end = i  # kapanmamış etiket: kapanınca önceki kelimelerle ifade oluşturabilir
+                break
+            i = line.find("[", i + 1)
+        starts = [m.start() for m in _TOKEN.finditer(line, pos, end) if not _TAG_ONLY.fullmatch(m.group())]
+        if len(starts) <= _HOLD_TOKENS:
+            return pos
+        limit = starts[-_HOLD_TOKENS]
+        spans = [(m.start(), m.end()) for m in _NORMALIZE.finditer(line, pos) if m.start() < limit]
+        for s in reversed(starts):
+            if s > limit or s <= pos:
+                continue
+            if not any(a < s < b for a, b in spans):
+                return s
+        return pos
+
+
+# --- Çöp segment filtresi ---
+_FILLER_WORDS = frozenset({
+    "uh", "uhhuh", "umm", "hm", "hmm", "mm", "eee", "ı", "i", "hıhı", "haha", "ha", "hahaha",
+})
+# kısa ama anlamlı yanıtlar
+_ALLOW_SHORT = frozenset({
+    "evet", "hayır", "hayir", "tamam", "olur", "peki", "tabi", "teşekkürler", "tesekkurler",
+    "sağ ol", "sag ol", "yok", "var", "merhaba", "alo",
+})
+_WORD = re.compile(r"[^\W\d_]+")
+
+MIN_CHARS = 10
+MIN_WORDS = 3
+MIN_LETTER_RATIO = 0.6
+
+
+def trash_reason(text: str | None) -> str | None:
+    """
+    Segment atılacaksa nedeni ("empty", "short", "few_words", "low_letters", "filler"),
+    tutulacaksa None. Harf dizileri tek findall ile çıkarılır; harf oranı bunlardan hesaplanır.
+    """
+    s = (text or "").strip()
+    if not s:
+        return "empty"
+    if " ".join(s.lower().split()) in _ALLOW_SHORT:
+        return None
+    if len(s) < MIN_CHARS:
+        return "short"
+    words = _WORD.findall(s)
+    if len(words) < MIN_WORDS:
+        return "few_words"
+    if sum(map(len, words)) / len(s) < MIN_LETTER_RATIO:
+        return "low_letters"
+    if all(w.lower().replace("-", "") in _FILLER_WORDS for w in words):
+        return "filler"
+    return None
+
+
+def is_trash_text(text: str | None) -> bool:
+    return trash_reason(text) is not None
+
+
+def classify_batch(texts, source: str = "segment") -> list[str | None]:
+    """
+    Metin listesi -> her biri için trash_reason. Atılanlar neden bazında toplanıp
+    transcript_dropped_<source>_<neden> sayaçlarına tek seferde yazılır.
+    """
+    reasons = [trash_reason(t) for t in texts]
+    for reason, n in Counter(r for r in reasons if r).items():
+        metrics.incr(f"transcript_dropped_{source}_{reason}", n)
+    return reasons
+
+
+def count_dropped(reason: str, source: str = "segment") -> None:
+    metrics.incr(f"transcript_dropped_{source}_{reason}")
@@ -0,0 +1,203 @@
+import os
+import numpy as np
+import webrtcvad
+
+# Opsiyonel enerji ön-filtresi: RMS'i bu dBFS'in altındaki frame'ler WebRTC VAD'e
+# sorulmadan sessiz sayılır. Boş -> kapalı (eski davranışla birebir aynı sonuç).
+VAD_ENERGY_GATE_DBFS = float(os.getenv("VAD_ENERGY_GATE_DBFS")) if os.getenv("VAD_ENERGY_GATE_DBFS") else None
+
+
+def _frame_rms_dbfs(pcm16, n_frames: int, frame_samples: int) -> np.ndarray:
+    """Frame başına RMS (dBFS); kopyasız int16 görünümü üzerinden tek seferde."""
+    x = np.frombuffer(pcm16, dtype=np.int16, count=n_frames * frame_samples).reshape(n_frames, frame_samples)
+    power = np.einsum("ij,ij->i", x, x, dtype=np.float64) / frame_samples
+    return 10.0 * np.log10(np.maximum(power, 1e-12) / (32768.0 ** 2))
+
+
+def speech_flags(
+    pcm16,
+    sample_rate: int = 16000,
+    frame_ms: int = 20,
+    aggressiveness: int = 2,
+    energy_gate_dbfs: float | None = VAD_ENERGY_GATE_DBFS,
+    vad: webrtcvad.Vad | None = None,
+) -> np.ndarray:
+    """
+    Tam frame'ler için konuşma bayrakları (bool dizisi). Kalan yarım frame atılır.
+    Akış halinde çağrılırken aynı vad nesnesi verilmeli (WebRTC VAD frame'ler arası durum tutar).
+    """
+    mv = memoryview(pcm16).cast("B")
+    frame_bytes = int(sample_rate * (frame_ms / 1000.0)) * 2
+    n_frames = len(mv) // frame_bytes
+    flags = np.zeros(n_frames, dtype=bool)
+    if n_frames == 0:
+        return flags
+
+    if energy_gate_dbfs is not None:
+        candidates = np.flatnonzero(_frame_rms_dbfs(mv, n_frames, frame_bytes // 2) >= energy_gate_dbfs)
+    else:
+        candidates = range(n_frames)
+
+    if vad is None:
+        vad = webrtcvad.Vad(aggressiveness)
+    is_speech = vad.is_speech
+    for i in candidates:
+        off = int(i) * frame_bytes
+        if is_speech(mv[off:off + frame_bytes], sample_rate):
+            flags[i] = True
+    return flags
+
+
+def segment_offsets(
+    flags: np.ndarray,
+    frame_bytes: int,
+    max_silence_frames: int,
+    min_frames: int,
+) -> list[tuple[int, int]]:
+    """
+    Konuşma bayraklarından (start, end) byte offset çiftleri.
+    Segment içindeki en fazla max_silence_frames'lik sessizlik segmente dahil edilir;
+    daha uzun sessizlik segmenti kapatır. min_frames'ten kısa segmentler atılır.
+    Frame'ler tek tek değil, aynı bayraklı ardışık bloklar (run) halinde işlenir.
+    """
+    n = len(flags)
+    if n == 0:
+        return []
+    change = np.flatnonzero(np.diff(flags.view(np.int8))) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [n]))
+
+    out = []
+    cur_start = cur_end = None
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        if flags[s]:
+            if cur_start is None:
+                cur_start = s
+            cur_end = e
+        elif cur_start is not None:
+            if e - s <= max_silence_frames:
+                cur_end = e
+            else:
+                cur_end = s + max_silence_frames
+                if cur_end - cur_start >= min_frames:
+                    out.append((cur_start * frame_bytes, cur_end * frame_bytes))
+                cur_start = None
+    if cur_start is not None and cur_end - cur_start >= min_frames:
+        out.append((cur_start * frame_bytes, cur_end * frame_bytes))
+    return out
+
+
+def vad_offsets(
+    pcm16,
+    sample_rate: int = 16000,
+    frame_ms: int = 20,
+    aggressiveness: int = 2,
+    max_silence_ms: int = 900,
+    min_segment_ms: int = 1200,
+    energy_gate_dbfs: float | None = VAD_ENERGY_GATE_DBFS,
+) -> list[tuple[int, int]]:
+    """
+    PCM16 mono tampon -> konuşma segmentlerinin (start, end) byte offset'leri.
+    Tampon kopyalanmaz; segment baytları gerektiğinde memoryview(pcm16)[s:e] ile alınır.
+    """
+    flags = speech_flags(pcm16, sample_rate, frame_ms, aggressiveness, energy_gate_dbfs)
+    return segment_offsets(
+        flags,
+        frame_bytes=int(sample_rate * (frame_ms / 1000.0)) * 2,
+        max_silence_frames=int(max_silence_ms / frame_ms),
+        min_frames=int(min_segment_ms / frame_ms),
+    )
+
+
+class SegmentStream:
+    """
+    vad_offsets'in artımlı hali: PCM16 parçaları geldikçe feed() kapanan segmentleri
+    (start, end, pcm) olarak döndürür, finish() son açık segmenti kapatır. Offset'ler akışın
+    başından itibaren byte cinsindendir ve tek seferlik vad_offsets ile aynıdır. Sadece açık
+    segmentin baytları tutulur; bellek kayıt uzunluğundan bağımsızdır.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 20,
+        aggressiveness: int = 2,
+        max_silence_ms: int = 900,
+        min_segment_ms: int = 1200,
+        energy_gate_dbfs: float | None = VAD_ENERGY_GATE_DBFS,
+    ):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.energy_gate_dbfs = energy_gate_dbfs
+        self.frame_bytes = int(sample_rate * (frame_ms / 1000.0)) * 2
+        self.max_silence_frames = int(max_silence_ms / frame_ms)
+        self.min_frames = int(min_segment_ms / frame_ms)
+        self._vad = webrtcvad.Vad(aggressiveness)
+        self._rem = bytearray()   # yarım frame
+        self._buf = bytearray()   # _buf_start frame'inden itibaren tutulan PCM
+        self._buf_start = 0
+        self._n = 0               # işlenmiş frame sayısı
+        self._cur_start = None
+        self._cur_end = None
+        self._sil_start = None
+
+    def _take(self, start: int, end: int) -> tuple[int, int, bytes]:
+        fb = self.frame_bytes
+        a, b = (start - self._buf_start) * fb, (end - self._buf_start) * fb
+        return start * fb, end * fb, bytes(self._buf[a:b])
+
+    def _close(self, end: int, out: list) -> None:
+        if end - self._cur_start >= self.min_frames:
+            out.append(self._take(self._cur_start, end))
+        self._cur_start = self._cur_end = self._sil_start = None
+
+    def feed(self, pcm16) -> list[tuple[int, int, bytes]]:
+        self._rem += pcm16
+        usable = len(self._rem) - (len(self._rem) % self.frame_bytes)
+        if not usable:
+            return []
+        data = bytes(self._rem[:usable])
+        del self._rem[:usable]
+        flags = speech_flags(data, self.sample_rate, self.frame_ms,
+                             energy_gate_dbfs=self.energy_gate_dbfs, vad=self._vad)
+        base = self._n
+        self._n += len(flags)
+        self._buf += data
+
+        out = []
+        change = np.flatnonzero(np.diff(flags.view(np.int8))) + 1
+        starts = np.concatenate(([0], change)) + base
+        ends = np.concatenate((change, [len(flags)])) + base
+        for s, e in zip(starts.tolist(), ends.tolist()):
+            if flags[s - base]:
+                if self._cur_start is None:
+                    self._cur_start = s
+                self._cur_end = e
+                self._sil_start = None
+            elif self._cur_start is not None:
+                if self._sil_start is None:
+                    self._sil_start = s
+                if e - self._sil_start <= self.max_silence_frames:
+                    self._cur_end = e
+                else:
+                    self._close(self._sil_start + self.max_silence_frames, out)
+
+        # artık gerekmeyen baytları bırak
+        keep = self._cur_start if self._cur_start is not None else self._n
+        drop = (keep - self._buf_start) * self.frame_bytes
+        if drop > 0:
+            del self._buf[:drop]
+            self._buf_start = keep
+        return out
+
+    def finish(self) -> list[tuple[int, int, bytes]]:
+        out = []
+        if self._cur_start is not None:
+            self._close(self._cur_end, out)
+        self._buf.clear()
+        self._buf_start = self._n
+        return out
+
+    @property
+    def total_bytes(self) -> int:
+        return self._n * self.frame_bytes + len(self._rem)